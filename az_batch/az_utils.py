@@ -1,6 +1,7 @@
 import datetime
+import io
 import os
-from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 
 import azure.batch.models as batchmodels
 import pandas as pd
@@ -12,6 +13,14 @@ from azure.storage.blob import (
     generate_container_sas,
 )
 
+from stock_price_simulator.aggregate import PathAggregate
+from stock_price_simulator.formats import format_of, read_frame
+from stock_price_simulator.instrument import span
+
+# Transfers in flight at once, below the 10 pooled connections that a
+# client's HTTP transport keeps per host by default
+DEFAULT_MAX_CONCURRENCY = 8
+
 
 def blob_service_client():
     return BlobServiceClient(
@@ -43,7 +52,9 @@ def clear_container(blob_service_client, container_name):
             )
 
 
-def upload_file_to_container(blob_service_client, container_name, file_path):
+def upload_file_to_container(
+    blob_service_client, container_name, file_path, sas_token=None
+):
     """
     Uploads a local file to an Azure Blob storage container.
 
@@ -51,6 +62,8 @@ def upload_file_to_container(blob_service_client, container_name, file_path):
     :type blob_service_client: `azure.storage.blob.BlobServiceClient`
     :param str container_name: The name of the Azure Blob storage container.
     :param str file_path: The local path to the file.
+    :param str sas_token: A read SAS of the container, generated for the
+    blob if not given.
     :rtype: `azure.batch.models.ResourceFile`
     :return: A ResourceFile initialized with a SAS URL appropriate for Batch
     tasks.
@@ -60,21 +73,27 @@ def upload_file_to_container(blob_service_client, container_name, file_path):
 
     print("Uploading file {} to container [{}]...".format(file_path, container_name))
 
-    with open(file_path, "rb") as data:
+    with span(
+        "blob_upload",
+        container=container_name,
+        blob=blob_name,
+        bytes=os.path.getsize(file_path),
+    ), open(file_path, "rb") as data:
         blob_client.upload_blob(data, overwrite=True)
 
     account_name = os.environ["STORAGE_ACCOUNT_NAME"]
     account_key = os.environ["STORAGE_ACCOUNT_KEY"]
     account_domain = "blob.core.windows.net"
 
-    sas_token = generate_blob_sas(
-        account_name,
-        container_name,
-        blob_name,
-        account_key=account_key,
-        permission=BlobSasPermissions(read=True),
-        expiry=datetime.datetime.utcnow() + datetime.timedelta(hours=6),
-    )
+    if sas_token is None:
+        sas_token = generate_blob_sas(
+            account_name,
+            container_name,
+            blob_name,
+            account_key=account_key,
+            permission=BlobSasPermissions(read=True),
+            expiry=datetime.datetime.utcnow() + datetime.timedelta(hours=6),
+        )
 
     sas_url = generate_sas_url(
         account_name,
@@ -87,6 +106,39 @@ def upload_file_to_container(blob_service_client, container_name, file_path):
     return batchmodels.ResourceFile(http_url=sas_url, file_path=blob_name)
 
 
+def upload_files_to_container(
+    blob_service_client,
+    container_name,
+    file_paths,
+    max_concurrency=DEFAULT_MAX_CONCURRENCY,
+):
+    """Upload many local files at once, see upload_file_to_container.
+
+    The uploads share the blob service client, so its pooled connections
+    are reused, and one read SAS of the container signs every URL. Returns
+    the ResourceFiles in the order of file_paths.
+    """
+    sas_token = generate_container_sas(
+        os.environ["STORAGE_ACCOUNT_NAME"],
+        container_name,
+        account_key=os.environ["STORAGE_ACCOUNT_KEY"],
+        permission=BlobSasPermissions(read=True),
+        expiry=datetime.datetime.utcnow() + datetime.timedelta(hours=6),
+    )
+
+    with span(
+        "blob_upload_all", container=container_name, blobs=len(file_paths)
+    ), ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        return list(
+            executor.map(
+                lambda file_path: upload_file_to_container(
+                    blob_service_client, container_name, file_path, sas_token
+                ),
+                file_paths,
+            )
+        )
+
+
 def generate_sas_url(
     account_name, account_domain, container_name, blob_name, sas_token
 ):
@@ -108,13 +160,49 @@ def make_container_sas_url(container_name):
     return f"https://{os.environ['STORAGE_ACCOUNT_NAME']}.{account_domain}/{container_name}?{container_sas}"
 
 
-def blobs_to_df(blob_service_client, container_name, prefix=None):
+def blobs_to_df(
+    blob_service_client,
+    container_name,
+    prefix=None,
+    max_concurrency=DEFAULT_MAX_CONCURRENCY,
+):
+    """Download and parse the blobs of a container into one frame.
+
+    Blobs are downloaded and parsed by up to max_concurrency threads that
+    share the client's connections, and concatenated in listing order.
+    """
     container_client = blob_service_client.get_container_client(container_name)
 
-    dfs = []
-    for blob in container_client.list_blobs(name_starts_with=prefix):
-        blob_data = container_client.download_blob(blob.name).readall()
-        df = pd.read_csv(BytesIO(blob_data))
-        dfs.append(df)
+    blob_names = [
+        blob.name for blob in container_client.list_blobs(name_starts_with=prefix)
+    ]
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        dfs = list(
+            executor.map(
+                lambda blob_name: blob_to_df(
+                    container_client, container_name, blob_name
+                ),
+                blob_names,
+            )
+        )
+
+    with span("concat", blobs=len(dfs)):
+        return pd.concat(dfs, ignore_index=True)
+
+
+def blob_to_df(container_client, container_name, blob_name):
+    """Download and parse one blob, in the wire format of its extension."""
+    with span("blob_download", container=container_name, blob=blob_name) as attributes:
+        blob_data = container_client.download_blob(blob_name).readall()
+        attributes["bytes"] = len(blob_data)
+    with span("parse", blob=blob_name):
+        return read_frame(blob_data, format_of(blob_name))
+
+
+def blob_to_aggregate(container_client, container_name, blob_name):
+    """Download one PathAggregate, saved as .npz by an aggregate task."""
+    with span("blob_download", container=container_name, blob=blob_name) as attributes:
+        blob_data = container_client.download_blob(blob_name).readall()
+        attributes["bytes"] = len(blob_data)
 
-    return pd.concat(dfs, ignore_index=True)
+    return PathAggregate.load(io.BytesIO(blob_data))
@@ -2,32 +2,99 @@ import datetime
 import os
 import sys
 import time
-from typing import List, Set
+from typing import Callable, List, Optional, Set
 
 import azure.batch.models as batchmodels
 from az_utils import make_container_sas_url
 from azure.batch import BatchServiceClient
+from wheelhouse import NODE_EXTRAS, offline_install_commands
 
+from stock_price_simulator.formats import WIRE_FORMATS
+from stock_price_simulator.instrument import TRACE_FILE_ENV, span, tracing_enabled
 
-def create_pool(batch_service_client, resource_files, package_name):
+# Polling intervals in seconds, doubled while nothing changes
+POLL_INTERVAL = 1
+MAX_POLL_INTERVAL = 30
+
+NODE_FAILED_STATES = frozenset(
+    (
+        batchmodels.ComputeNodeState.start_task_failed,
+        batchmodels.ComputeNodeState.unusable,
+    )
+)
+
+
+class Backoff:
+    """Sleeps between polls, longer and longer until reset by progress."""
+
+    def __init__(
+        self, interval=POLL_INTERVAL, max_interval=MAX_POLL_INTERVAL, sleep=time.sleep
+    ):
+        self.initial_interval = interval
+        self.interval = interval
+        self.max_interval = max_interval
+        self._sleep = sleep
+
+    def reset(self):
+        self.interval = self.initial_interval
+
+    def sleep(self):
+        self._sleep(self.interval)
+        self.interval = min(self.interval * 2, self.max_interval)
+
+
+class TasksFailed(RuntimeError):
+    """Some tasks of a job failed, the others succeeded.
+
+    task_ids are the failed tasks, and run_job sets tickers to the tickers
+    they simulated, so a rerun can retry only those.
+    """
+
+    def __init__(self, task_ids):
+        super().__init__(f"There are failed tasks, please check! {task_ids}")
+        self.task_ids = task_ids
+        self.tickers = []
+
+
+def create_pool(
+    batch_service_client,
+    resource_files,
+    package_name,
+    wheelhouse=None,
+    wait_for_all_nodes=True,
+    backoff=None,
+):
+    """Create the pool and wait until all its nodes are idle.
+
+    With wheelhouse, the name of a wheelhouse archive among the resource
+    files (see wheelhouse.py), the start task installs the project offline
+    from prebuilt wheels. Otherwise it installs pip with apt-get and the
+    package_name sdist, building its dependencies on every node.
+
+    Without wait_for_all_nodes, returns as soon as any node is idle, so
+    tasks start on it while the other nodes are still provisioned.
+    """
     pool_id = os.environ["POOL_ID"]
     pool_vm_size = os.environ["POOL_VM_SIZE"]
     pool_node_count = os.environ["POOL_NODE_COUNT"]
 
     print(f"Creating pool [{pool_id}]...")
 
-    task_commands = [
-        # Copy the task.py script to the "shared" directory
-        # that all tasks that run on the node have access to. Note that
-        # we are using the -p flag with cp to preserve the file uid/gid,
-        # otherwise since this start task is run as an admin, it would not
-        # be accessible by tasks run as a non-admin user.
-        "sudo apt-get -y update",
-        "sudo dpkg --configure -a",
-        "sudo apt-get install -y python3-pip",
-        "pip3 install --upgrade pip",
-        f"sudo pip3 install {package_name}",
-    ]
+    if wheelhouse is not None:
+        task_commands = offline_install_commands(wheelhouse)
+    else:
+        task_commands = [
+            "sudo apt-get -y update",
+            "sudo dpkg --configure -a",
+            "sudo apt-get install -y python3-pip",
+            "pip3 install --upgrade pip",
+            f"sudo pip3 install '{package_name}{NODE_EXTRAS}'",
+        ]
+    # Copy the task.py script to the "shared" directory
+    # that all tasks that run on the node have access to. Note that
+    # we are using the -p flag with cp to preserve the file uid/gid,
+    # otherwise since this start task is run as an admin, it would not
+    # be accessible by tasks run as a non-admin user.
     for f in resource_files:
         task_commands.append(f"cp -p {f.file_path} $AZ_BATCH_NODE_SHARED_DIR")
 
@@ -60,19 +127,22 @@ def create_pool(batch_service_client, resource_files, package_name):
     batch_service_client.pool.add(new_pool)
 
     start_time = datetime.datetime.now().replace(microsecond=0)
+    if not wait_for_all_nodes:
+        with span("provision_first_node", pool_id=pool_id, vm_size=pool_vm_size):
+            wait_for_idle_node(batch_service_client, pool_id, backoff)
+        end_time = datetime.datetime.now().replace(microsecond=0)
+        print(f"It takes {end_time - start_time} to get a node of pool {pool_id}")
+        return pool_id
+
     # because we want all nodes to be available before any tasks are assigned
     # to the pool, here we will wait for all compute nodes to reach idle
-    nodes = wait_for_all_nodes_state(
-        batch_service_client,
-        pool_id,
-        frozenset(
-            (
-                batchmodels.ComputeNodeState.start_task_failed,
-                batchmodels.ComputeNodeState.unusable,
-                batchmodels.ComputeNodeState.idle,
-            )
-        ),
-    )
+    with span("provision_nodes", pool_id=pool_id, vm_size=pool_vm_size):
+        nodes = wait_for_all_nodes_state(
+            batch_service_client,
+            pool_id,
+            NODE_FAILED_STATES | {batchmodels.ComputeNodeState.idle},
+            backoff,
+        )
     # ensure all node are idle
     if any(node.state != batchmodels.ComputeNodeState.idle for node in nodes):
         raise RuntimeError(f"node(s) of pool {pool_id} not in idle state")
@@ -96,27 +166,101 @@ def create_job(batch_service_client, pool_id):
     return job_id
 
 
-def run_job(batch_service_client, input_files, pool_id, job_id):
+def bundle_input_files(input_files, bundle_size=None):
+    """Group the input files into (task id, input files) of one task each.
+
+    Without bundle_size there is one task per ticker, named after it.
+    Otherwise each task simulates up to bundle_size tickers, ideally the
+    number of cores of a node, in one Python process and its pool.
+    """
+    if bundle_size is None:
+        return [(ticker_of(input_file), [input_file]) for input_file in input_files]
+    if bundle_size < 1:
+        raise ValueError(f"bundle_size must be positive, got {bundle_size}")
+
+    return [
+        (f"bundle-{i // bundle_size:04d}", input_files[i : i + bundle_size])
+        for i in range(0, len(input_files), bundle_size)
+    ]
+
+
+def ticker_of(input_file):
+    return os.path.splitext(os.path.basename(input_file.file_path))[0]
+
+
+def run_job(
+    batch_service_client,
+    input_files,
+    pool_id,
+    job_id,
+    seed=None,
+    bundle_size=None,
+    output_format="csv",
+    float32=False,
+    model=None,
+    aggregate=False,
+    on_task_complete=None,
+    backoff=None,
+):
+    """Add a task per bundle of input files and wait until all succeeded.
+
+    Tasks write their outputs in output_format, one of the wire formats
+    of stock_price_simulator.formats, with float32 prices if float32.
+    With aggregate, they write the PathAggregate of each ticker as
+    Aggregate_{ticker}.npz instead.
+    model selects a return model of stock_price_simulator.models.
+
+    on_task_complete(task_id, tickers) is called as soon as each task has
+    succeeded, while the others still run, e.g. to download its output.
+    When some tasks failed, the job and pool are deleted and TasksFailed
+    is raised with their tickers.
+    """
     start_time = datetime.datetime.now().replace(microsecond=0)
     container_url = make_container_sas_url(os.environ["output_container"])
 
     try:
         # Add the tasks to the job. Pass the input files and a SAS URL
         # to the storage container for output files.
-        print(f"Adding {len(input_files)} tasks to job [{job_id}]...")
+        bundles = bundle_input_files(input_files, bundle_size)
+        print(f"Adding {len(bundles)} tasks to job [{job_id}]...")
+
+        # tasks write their spans next to their logs when tracing locally
+        environment_settings = []
+        if tracing_enabled():
+            environment_settings.append(
+                batchmodels.EnvironmentSetting(name=TRACE_FILE_ENV, value="trace.jsonl")
+            )
+
+        if aggregate:
+            output_pattern = "data/output/*.npz"
+        else:
+            output_pattern = f"data/output/*{WIRE_FORMATS[output_format]}"
 
         tasks = []
-        for input_file in input_files:
-            filepath = input_file.file_path
-            ticker = os.path.splitext(os.path.basename(filepath))[0]
-            command = f'/bin/bash -c "python3 $AZ_BATCH_NODE_SHARED_DIR/task.py --ticker {ticker} --filepath {filepath}"'
+        for (task_id, task_files) in bundles:
+            task_args = " ".join(
+                f"--ticker {ticker_of(input_file)} --filepath {input_file.file_path}"
+                for input_file in task_files
+            )
+            if seed is not None:
+                task_args += f" --seed {seed}"
+            task_args += f" --output-format {output_format}"
+            if float32:
+                task_args += " --float32"
+            if model is not None:
+                task_args += f" --model {model}"
+            if aggregate:
+                task_args += " --aggregate"
+            command = (
+                f'/bin/bash -c "python3 $AZ_BATCH_NODE_SHARED_DIR/task.py {task_args}"'
+            )
 
             tasks.append(
                 batchmodels.TaskAddParameter(
-                    id=ticker,
+                    id=task_id,
                     command_line=command,
-                    resource_files=[input_file],
-                    # environment_settings=[],
+                    resource_files=task_files,
+                    environment_settings=environment_settings,
                     output_files=[
                         batchmodels.OutputFile(
                             file_pattern="../*.txt",
@@ -131,7 +275,19 @@ def run_job(batch_service_client, input_files, pool_id, job_id):
                             ),
                         ),
                         batchmodels.OutputFile(
-                            file_pattern="data/output/*.csv",
+                            file_pattern="trace.jsonl",
+                            destination=batchmodels.OutputFileDestination(
+                                container=batchmodels.OutputFileBlobContainerDestination(
+                                    container_url=container_url,
+                                    path=f"traces/{task_id}.jsonl",
+                                )
+                            ),
+                            upload_options=batchmodels.OutputFileUploadOptions(
+                                upload_condition=batchmodels.OutputFileUploadCondition.task_completion
+                            ),
+                        ),
+                        batchmodels.OutputFile(
+                            file_pattern=output_pattern,
                             destination=batchmodels.OutputFileDestination(
                                 container=batchmodels.OutputFileBlobContainerDestination(
                                     container_url=container_url,
@@ -146,14 +302,39 @@ def run_job(batch_service_client, input_files, pool_id, job_id):
                 )
             )
 
-        batch_service_client.task.add_collection(job_id, tasks)
+        with span("add_tasks", job_id=job_id, tasks=len(tasks)):
+            batch_service_client.task.add_collection(job_id, tasks)
+
+        task_tickers = {
+            task_id: [ticker_of(input_file) for input_file in task_files]
+            for (task_id, task_files) in bundles
+        }
+
+        def task_completed(task_id):
+            if on_task_complete is not None:
+                on_task_complete(task_id, task_tickers[task_id])
+
+        def delete_job_and_pool():
+            print(f"Deleting job [{job_id}]...")
+            batch_service_client.job.delete(job_id)
+            print(f"Deleting pool [{pool_id}]...")
+            batch_service_client.pool.delete(pool_id)
 
         # Pause execution until tasks reach Completed state.
-        wait_for_tasks_to_succeed(batch_service_client, job_id)
-        print(f"Deleting job [{job_id}]...")
-        batch_service_client.job.delete(job_id)
-        print(f"Deleting pool [{pool_id}]...")
-        batch_service_client.pool.delete(pool_id)
+        try:
+            with span("task_wait", job_id=job_id):
+                wait_for_tasks_to_succeed(
+                    batch_service_client, job_id, len(tasks), task_completed, backoff
+                )
+        except TasksFailed as e:
+            e.tickers = [
+                ticker for task_id in e.task_ids for ticker in task_tickers[task_id]
+            ]
+            # the outputs of the succeeded tasks were collected, so a rerun
+            # creates the job and pool again for the failed tickers only
+            delete_job_and_pool()
+            raise
+        delete_job_and_pool()
     except batchmodels.BatchErrorException as err:
         print_batch_exception(err)
         raise
@@ -205,26 +386,24 @@ def wait_for_all_nodes_state(
     batch_client: BatchServiceClient,
     pool_id: str,
     node_state: Set[batchmodels.ComputeNodeState],
+    backoff: Optional[Backoff] = None,
 ) -> List[batchmodels.ComputeNode]:
     """Waits for all nodes in pool to reach any specified state in set
     :param batch_client: The batch client to use.
     :param pool: The pool containing the node.
     :param node_state: node states to wait for
+    :param backoff: how long to sleep between polls
     :return: list of compute nodes
     """
+    if backoff is None:
+        backoff = Backoff()
+
     print(
         "Waiting for all pool nodes to be ready...",
         end="",
     )
     while True:
-        # refresh pool to ensure that there is no resize error
-        pool = batch_client.pool.get(pool_id)
-
-        if pool.resize_errors is not None:
-            resize_errors = "\n".join([repr(e) for e in pool.resize_errors])
-            raise RuntimeError(
-                f"resize error encountered for " f"pool {pool.id}:\n{resize_errors}"
-            )
+        pool = _get_pool(batch_client, pool_id)
         nodes = list(batch_client.compute_node.list(pool.id))
         if len(nodes) >= pool.target_dedicated_nodes and all(
             node.state in node_state for node in nodes
@@ -232,31 +411,127 @@ def wait_for_all_nodes_state(
             print()
             return nodes
 
-        time.sleep(10)
+        backoff.sleep()
         print(".", end="")
         sys.stdout.flush()
 
 
+def wait_for_idle_node(
+    batch_client: BatchServiceClient,
+    pool_id: str,
+    backoff: Optional[Backoff] = None,
+) -> batchmodels.ComputeNode:
+    """Waits for the first node in pool to be idle and returns it.
+
+    Only idle nodes are listed, so each poll stays small however large the
+    pool is. Raises if every node of the pool failed to start.
+    """
+    if backoff is None:
+        backoff = Backoff()
+
+    print("Waiting for a pool node to be ready...", end="")
+    idle_nodes = batchmodels.ComputeNodeListOptions(
+        filter="state eq 'idle'", select="id,state"
+    )
+    while True:
+        pool = _get_pool(batch_client, pool_id)
+        nodes = list(
+            batch_client.compute_node.list(
+                pool.id, compute_node_list_options=idle_nodes
+            )
+        )
+        if nodes:
+            print()
+            return nodes[0]
+
+        nodes = list(batch_client.compute_node.list(pool.id))
+        if (
+            nodes
+            and len(nodes) >= pool.target_dedicated_nodes
+            and all(node.state in NODE_FAILED_STATES for node in nodes)
+        ):
+            raise RuntimeError(f"all nodes of pool {pool_id} failed to start")
+
+        backoff.sleep()
+        print(".", end="")
+        sys.stdout.flush()
+
+
+def _get_pool(batch_client, pool_id):
+    # refresh pool to ensure that there is no resize error
+    pool = batch_client.pool.get(pool_id)
+
+    if pool.resize_errors is not None:
+        resize_errors = "\n".join([repr(e) for e in pool.resize_errors])
+        raise RuntimeError(
+            f"resize error encountered for " f"pool {pool.id}:\n{resize_errors}"
+        )
+
+    return pool
+
+
 def wait_for_tasks_to_succeed(
     batch_client: BatchServiceClient,
     job_id: str,
+    task_count: int,
+    on_task_complete: Optional[Callable[[str], None]] = None,
+    backoff: Optional[Backoff] = None,
 ):
     """
-    Returns when all tasks in the specified job reach the succeeded state.
+    Returns when all task_count tasks in the specified job reach the
+    succeeded state, or raises TasksFailed once all completed when some of
+    them failed.
+
+    Each poll only asks for the task counts of the job; the completed
+    tasks are listed, filtered and with their ids only, when the count of
+    completed tasks grew. As the counts may be out of date, the tasks are
+    also listed when they show nothing left to do, and the job is only
+    done once task_count tasks were listed as completed.
+    on_task_complete(task_id) is called once for every task that
+    succeeded, as soon as it is seen.
     """
+    if backoff is None:
+        backoff = Backoff()
+
     print("Waiting for all job tasks to be succeeded...", end="")
 
+    completed_tasks = batchmodels.TaskListOptions(
+        filter="state eq 'completed'", select="id,executionInfo"
+    )
+    seen = set()
+    failed = []
     while True:
         print(".", end="")
         sys.stdout.flush()
-        tasks = batch_client.task.list(job_id)
-        incomplete_tasks = [
-            task for task in tasks if task.state != batchmodels.TaskState.completed
-        ]
-        if not incomplete_tasks:
-            if batch_client.job.get_task_counts(job_id).task_counts.failed:
-                raise RuntimeError("There are failed tasks, please check!")
+        task_counts = batch_client.job.get_task_counts(job_id).task_counts
+
+        if task_counts.completed > len(seen) or (
+            not task_counts.active and not task_counts.running
+        ):
+            seen_before = len(seen)
+            for task in batch_client.task.list(
+                job_id, task_list_options=completed_tasks
+            ):
+                if task.id in seen:
+                    continue
+                seen.add(task.id)
+                if (
+                    task.execution_info is not None
+                    and task.execution_info.result
+                    == batchmodels.TaskExecutionResult.failure
+                ):
+                    failed.append(task.id)
+                elif on_task_complete is not None:
+                    on_task_complete(task.id)
+            if len(seen) > seen_before:
+                backoff.reset()
+
+        # the counts may lag behind or run ahead of the listing, so only the
+        # listed tasks tell when the job is done
+        if len(seen) >= task_count:
+            if failed:
+                raise TasksFailed(failed)
             print()
             return True
-        else:
-            time.sleep(10)
+
+        backoff.sleep()
@@ -1,27 +1,107 @@
+from multiprocessing import Pool, cpu_count
 from pathlib import Path
 
 import click
-import pandas as pd
 
+from stock_price_simulator.formats import WIRE_FORMATS, FrameWriter, read_frame
+from stock_price_simulator.instrument import span
+from stock_price_simulator.models import DEFAULT_MODEL, RETURN_MODELS
 from stock_price_simulator.simulate import simulate
 
+OUTPUT_DIR = "data/output"
+
+
+def simulate_ticker(
+    ticker,
+    filepath,
+    output_format="csv",
+    seed=None,
+    aggregate=False,
+    float32=False,
+    model=DEFAULT_MODEL,
+):
+    output_dir = OUTPUT_DIR
+    output_filename = f"Simulated_{ticker}{WIRE_FORMATS[output_format]}"
+
+    with span("read_input", ticker=ticker):
+        # in the format of its extension, see formats.WIRE_FORMATS
+        price_df = read_frame(filepath)
+
+    if aggregate:
+        # a few arrays per date instead of every path, read back with
+        # PathAggregate.load
+        path_aggregate = simulate(
+            ticker, price_df, seed=seed, aggregate=True, model=model
+        )
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        with span("write_output", ticker=ticker):
+            path_aggregate.save(Path(output_dir) / f"Aggregate_{ticker}.npz")
+        return
+
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    with span("write_output", ticker=ticker) as attributes, FrameWriter(
+        Path(output_dir) / output_filename, output_format, float32=float32
+    ) as writer:
+        # stream the simulation in chunks instead of building one frame
+        attributes["rows"] = simulate(
+            ticker, price_df, sink=writer, seed=seed, model=model
+        )
+
 
 @click.command()
 @click.option(
     "--ticker",
+    multiple=True,
+    help="Can be repeated to simulate a bundle of tickers in one task.",
 )
 @click.option(
     "--filepath",
+    multiple=True,
+    help="Input file of each --ticker, in the same order.",
+)
+@click.option(
+    "--output-format",
+    type=click.Choice(list(WIRE_FORMATS)),
+    default="csv",
+    show_default=True,
+    help="Format of Simulated_{ticker}.{csv,parquet,arrow}.",
 )
-def cli(ticker, filepath):
-    output_dir = "data/output"
-    output_filename = f"Simulated_{ticker}.csv"
+@click.option(
+    "--seed",
+    type=int,
+)
+@click.option(
+    "--aggregate",
+    is_flag=True,
+    help="Write per date statistics as Aggregate_{ticker}.npz instead of the paths.",
+)
+@click.option(
+    "--float32",
+    is_flag=True,
+    help="Store the simulated prices as float32 in parquet and arrow outputs.",
+)
+@click.option(
+    "--model",
+    type=click.Choice(list(RETURN_MODELS)),
+    default=DEFAULT_MODEL,
+    show_default=True,
+)
+def cli(ticker, filepath, output_format, seed, aggregate, float32, model):
+    if len(ticker) != len(filepath):
+        raise click.UsageError("expected one --filepath per --ticker")
 
-    price_df = pd.read_csv(filepath)
-    simulated_price_df = simulate(ticker, price_df)
+    args = [
+        (symbol, path, output_format, seed, aggregate, float32, model)
+        for (symbol, path) in zip(ticker, filepath)
+    ]
+    if len(args) == 1:
+        simulate_ticker(*args[0])
+        return
 
-    Path(output_dir).mkdir(parents=True, exist_ok=True)
-    simulated_price_df.to_csv(Path(output_dir) / output_filename, index=False)
+    # a bundle of tickers shares this interpreter's imports, and its
+    # tickers are simulated on all cores of the node
+    with Pool(processes=min(len(args), cpu_count())) as pool:
+        pool.starmap(simulate_ticker, args, chunksize=1)
 
 
 if __name__ == "__main__":
@@ -1,14 +1,37 @@
 import os
 import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
+import pandas as pd
+from az_utils import DEFAULT_MAX_CONCURRENCY
 from az_utils import blob_service_client as bsc
-from az_utils import blobs_to_df, create_container, upload_file_to_container
+from az_utils import (
+    blob_to_aggregate,
+    blob_to_df,
+    create_container,
+    upload_files_to_container,
+)
 from azure.batch import BatchServiceClient
 from azure.batch.batch_auth import SharedKeyCredentials
-from batch import create_job, create_pool, run_job
+from batch import TasksFailed, create_job, create_pool, run_job
 from dotenv import load_dotenv
+from wheelhouse import WHEELHOUSE_ARCHIVE, build_wheelhouse
 
-from stock_price_simulator.ticker import download_ticker_prices
+from stock_price_simulator import __version__
+from stock_price_simulator.aggregate import PathAggregate
+from stock_price_simulator.checkpoint import MANIFEST_FILENAME, Manifest
+from stock_price_simulator.formats import WIRE_FORMATS, read_frame, write_frame
+from stock_price_simulator.instrument import span
+from stock_price_simulator.memo import default_cache, simulation_key
+from stock_price_simulator.models import DEFAULT_MODEL
+from stock_price_simulator.simulate import next_year_trading_dates
+from stock_price_simulator.store import ResultStore
+from stock_price_simulator.ticker import (
+    TICKER_SYMBOLS,
+    download_ticker_prices,
+    read_universe,
+)
 
 
 def run():
@@ -19,6 +42,12 @@ def run():
     output_container_name = os.environ["output_container"]
     application_container_name = os.environ["application_container"]
 
+    # per date statistics of every ticker instead of its paths
+    aggregate = bool(os.environ.get("BATCH_AGGREGATE"))
+    store_dir = os.environ.get("BATCH_RESULT_STORE")
+    if aggregate and store_dir:
+        raise SystemExit("BATCH_RESULT_STORE cannot be combined with BATCH_AGGREGATE")
+
     print("Creating resource files...")
 
     def clear_dir(dir):
@@ -31,69 +60,258 @@ def run():
     resource_dir = "az_batch/node/resources"
     package_name = "stock-price-simulator-0.1.0.tar.gz"
 
+    # a resumed run keeps the outputs and the manifest of the previous runs
+    resume = bool(os.environ.get("BATCH_RESUME"))
     print("clear directories...")
     clear_dir(input_dir)
-    clear_dir(output_dir)
+    if not resume:
+        clear_dir(output_dir)
     clear_dir(resource_dir)
 
     # package code and then copy the package to the node folder
-    os.system("poetry build --format sdist > /dev/null")
-    shutil.copy(f"./dist/{package_name}", resource_dir)
+    wheelhouse_python = os.environ.get("WHEELHOUSE_PYTHON")
+    with span("build_package"):
+        if wheelhouse_python:
+            # prebuilt wheels of the project and its dependencies, so the
+            # nodes install offline instead of building from source
+            build_wheelhouse(resource_dir, python=wheelhouse_python)
+        else:
+            os.system("poetry build --format sdist > /dev/null")
+            shutil.copy(f"./dist/{package_name}", resource_dir)
+
+    # csv by default, parquet or arrow to exchange compressed binary files
+    wire_format = os.environ.get("BATCH_WIRE_FORMAT") or "csv"
+    extension = WIRE_FORMATS[wire_format]
+
+    seed = os.environ.get("SIMULATION_SEED")
+    model = os.environ.get("SIMULATION_MODEL") or None
+    float32 = bool(os.environ.get("BATCH_FLOAT32_PRICES"))
+
+    # every ticker is recorded once its output was saved, so a resumed run
+    # only simulates the tickers that failed or never completed
+    universe_file = os.environ.get("BATCH_UNIVERSE_FILE")
+    ticker_symbols = read_universe(universe_file) if universe_file else TICKER_SYMBOLS
+    manifest = Manifest(
+        os.path.join(output_dir, MANIFEST_FILENAME),
+        {
+            "version": __version__,
+            "seed": seed,
+            "model": model,
+            "output_format": wire_format,
+            "float32": float32,
+            "aggregate": aggregate,
+        },
+    )
+    manifest_lock = threading.Lock()
+    pending = manifest.pending(ticker_symbols)
+    print(
+        f"{len(ticker_symbols) - len(pending)} tickers already completed, "
+        f"{len(pending)} to simulate..."
+    )
+
+    def output_path(ticker):
+        if aggregate:
+            return os.path.join(output_dir, f"Aggregate_{ticker}.npz")
+        return os.path.join(output_dir, f"Simulated_{ticker}{extension}")
+
+    def save_output(ticker, output):
+        if aggregate:
+            output.save(output_path(ticker))
+            info = {"num_of_simulation": output.count}
+        else:
+            write_frame(output, output_path(ticker))
+            info = {"rows": len(output)}
+        with manifest_lock:
+            manifest.record(ticker, True, **info)
+
+    def read_output(ticker):
+        if aggregate:
+            return PathAggregate.load(output_path(ticker))
+        return read_frame(output_path(ticker))
 
     # download ticker data
-    ticker_price_df = download_ticker_prices()
-    for (ticker, price_df) in ticker_price_df.items():
-        price_df.to_csv(os.path.join(input_dir, f"{ticker}.csv"), index=False)
-
-    blob_service_client = bsc()
-    # Use the blob client to create the containers in Azure Storage
-    create_container(blob_service_client, input_container_name)
-    create_container(blob_service_client, output_container_name)
-    create_container(blob_service_client, application_container_name)
-
-    input_files = []
-    for folder, _, files in os.walk(input_dir):
-        for filename in files:
-            if filename.startswith("."):
-                continue  # ignore hidden files
-            filepath = os.path.join(folder, filename)
-            input_files.append(
-                upload_file_to_container(
-                    blob_service_client, input_container_name, filepath
-                )
+    with span("download"):
+        ticker_price_df = download_ticker_prices(pending)
+    for ticker in pending:
+        if ticker not in ticker_price_df:
+            manifest.record(ticker, False, error="no price history")
+
+    # seeded results of unchanged histories are reused from the cache
+    # instead of being uploaded and simulated again, the cache only holds
+    # frames
+    cache = default_cache()
+    keys = {}
+    cached_dfs = {}
+    if cache is not None and seed and not aggregate:
+        for (ticker, price_df) in ticker_price_df.items():
+            keys[ticker] = simulation_key(
+                ticker,
+                price_df["Adj Close"].to_numpy(),
+                next_year_trading_dates(price_df["Date"].max()),
+                # the tasks simulate the default 5 paths per ticker
+                5,
+                int(seed),
+                model=model or DEFAULT_MODEL,
+                output_format=wire_format,
+                float32=float32,
+                kind="batch",
             )
+            cached_df = cache.get(keys[ticker])
+            if cached_df is not None:
+                save_output(ticker, cached_df)
+                cached_dfs[ticker] = cached_df
+        ticker_price_df = {
+            ticker: price_df
+            for (ticker, price_df) in ticker_price_df.items()
+            if ticker not in cached_dfs
+        }
 
-    application_files = []
-    for folder, _, files in os.walk("az_batch/node"):
-        for filename in files:
-            if filename.startswith("."):
-                continue  # ignore hidden files
-            filepath = os.path.join(folder, filename)
-            application_files.append(
-                upload_file_to_container(
-                    blob_service_client, application_container_name, filepath
-                )
+    with span("write_inputs", tickers=len(ticker_price_df)):
+        for (ticker, price_df) in ticker_price_df.items():
+            write_frame(price_df, os.path.join(input_dir, f"{ticker}{extension}"))
+
+    downloads = {}
+    failed_tickers = []
+    # no Batch job when every ticker is cached
+    if ticker_price_df:
+        blob_service_client = bsc()
+        # Use the blob client to create the containers in Azure Storage
+        create_container(blob_service_client, input_container_name)
+        create_container(blob_service_client, output_container_name)
+        create_container(blob_service_client, application_container_name)
+
+        def list_files(dir):
+            return [
+                os.path.join(folder, filename)
+                for (folder, _, files) in os.walk(dir)
+                for filename in files
+                if not filename.startswith(".")  # ignore hidden files
+            ]
+
+        input_files = upload_files_to_container(
+            blob_service_client, input_container_name, list_files(input_dir)
+        )
+        application_files = upload_files_to_container(
+            blob_service_client, application_container_name, list_files("az_batch/node")
+        )
+
+        batch_service_client = BatchServiceClient(
+            credentials=SharedKeyCredentials(
+                os.environ["BATCH_ACCOUNT_NAME"], os.environ["BATCH_ACCOUNT_KEY"]
+            ),
+            batch_url=os.environ["BATCH_ACCOUNT_URL"],
+        )
+
+        with span("create_pool"):
+            pool_id = create_pool(
+                batch_service_client,
+                application_files,
+                package_name,
+                wheelhouse=WHEELHOUSE_ARCHIVE if wheelhouse_python else None,
+                # tasks start on the first node while the others boot
+                wait_for_all_nodes=False,
             )
+        job_id = create_job(batch_service_client, pool_id)
 
-    batch_service_client = BatchServiceClient(
-        credentials=SharedKeyCredentials(
-            os.environ["BATCH_ACCOUNT_NAME"], os.environ["BATCH_ACCOUNT_KEY"]
-        ),
-        batch_url=os.environ["BATCH_ACCOUNT_URL"],
-    )
+        bundle_size = os.environ.get("TASK_BUNDLE_SIZE")
+        container_client = blob_service_client.get_container_client(
+            output_container_name
+        )
+        with span(
+            "run_job", job_id=job_id, tickers=len(input_files)
+        ), ThreadPoolExecutor(max_workers=DEFAULT_MAX_CONCURRENCY) as downloader:
+
+            def download_output(ticker):
+                if aggregate:
+                    output = blob_to_aggregate(
+                        container_client,
+                        output_container_name,
+                        f"data/Aggregate_{ticker}.npz",
+                    )
+                else:
+                    output = blob_to_df(
+                        container_client,
+                        output_container_name,
+                        f"data/Simulated_{ticker}{extension}",
+                    )
+                save_output(ticker, output)
+                return output
 
-    pool_id = create_pool(batch_service_client, application_files, package_name)
-    job_id = create_job(batch_service_client, pool_id)
+            def collect(task_id, tickers):
+                # download the outputs of each task as soon as it succeeded,
+                # while the stragglers still run
+                for ticker in tickers:
+                    downloads[ticker] = downloader.submit(download_output, ticker)
 
-    run_job(batch_service_client, input_files, pool_id, job_id)
+            try:
+                run_job(
+                    batch_service_client,
+                    input_files,
+                    pool_id,
+                    job_id,
+                    seed=int(seed) if seed else None,
+                    bundle_size=int(bundle_size) if bundle_size else None,
+                    output_format=wire_format,
+                    float32=float32,
+                    model=model,
+                    aggregate=aggregate,
+                    on_task_complete=collect,
+                )
+            except TasksFailed as e:
+                # keep the outputs of the succeeded tasks
+                failed_tickers = e.tickers
+        for ticker in failed_tickers:
+            manifest.record(ticker, False, error="task failed")
+
+    with span("collect_outputs", blobs=len(downloads)):
+        outputs = {ticker: downloads[ticker].result() for ticker in downloads}
+    if cache is not None:
+        for ticker in keys.keys() & outputs.keys():
+            cache.put(keys[ticker], outputs[ticker])
+        print(f"Simulation cache: {cache.report()}")
+    outputs.update(cached_dfs)
+    # the tickers completed by previous runs are read back from their outputs
+    completed = set(manifest.completed)
+    for ticker in ticker_symbols:
+        if ticker in completed and ticker not in outputs:
+            outputs[ticker] = read_output(ticker)
+    if not outputs:
+        raise SystemExit("No ticker was simulated")
+
+    if aggregate:
+        # every task simulates all the paths of its tickers, so there is one
+        # aggregate per ticker
+        for ticker in sorted(outputs):
+            print(f"{ticker}: 95% VaR {outputs[ticker].value_at_risk():.2f}")
+            print(outputs[ticker].summary())
+        print(f"The aggregates saved in: {output_dir}")
+    else:
+        save_result(outputs, os.path.join(output_dir, f"result{extension}"), store_dir)
 
-    simulated_price_df = blobs_to_df(
-        blob_service_client, output_container_name, prefix="data"
+    failed = manifest.pending(ticker_symbols)
+    if failed:
+        raise SystemExit(
+            f"{len(failed)} tickers failed, rerun with BATCH_RESUME=1 to retry "
+            "only them"
+        )
+
+
+def save_result(simulated_dfs, output_filepath, store_dir=None):
+    simulated_price_df = pd.concat(
+        [simulated_dfs[ticker] for ticker in sorted(simulated_dfs)],
+        ignore_index=True,
     )
-    output_filepath = os.path.join(output_dir, "result.csv")
-    simulated_price_df.to_csv(output_filepath, index=False)
+    with span("write_result", rows=len(simulated_price_df)):
+        write_frame(simulated_price_df, output_filepath)
     print(f"The simulation result saved in: {output_filepath}")
 
+    # a memory-mapped copy, so readers can slice tickers and dates without
+    # parsing the whole result
+    if store_dir:
+        with span("write_store", rows=len(simulated_price_df)):
+            ResultStore.from_frame(store_dir, simulated_price_df)
+        print(f"The simulation result stored in: {store_dir}")
+
 
 if __name__ == "__main__":
     run()
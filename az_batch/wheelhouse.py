@@ -0,0 +1,88 @@
+import glob
+import os
+import shlex
+import shutil
+import subprocess
+import tarfile
+import tempfile
+
+WHEELHOUSE_ARCHIVE = "wheelhouse.tar.gz"
+PROJECT_NAME = "stock-price-simulator"
+# Extras of the project installed on the nodes, see pyproject.toml, parquet
+# for the parquet and arrow wire formats
+NODE_EXTRAS = "[parquet]"
+
+
+def wheelhouse_commands(wheelhouse_dir, python="python3", dist_dir="dist"):
+    """Commands building the project and all its dependencies as wheels.
+
+    The wheels must match the nodes' Python and platform, so run them with
+    the same Python version as the pool image (3.8 on Ubuntu 20.04), e.g.
+    inside a python:3.8 container. Dependencies only published as sdists
+    are built into wheels here, once, instead of on every node.
+    """
+    python = shlex.split(python)
+
+    return [
+        ["poetry", "build", "--format", "wheel"],
+        [
+            *python,
+            "-m",
+            "pip",
+            "wheel",
+            "--wheel-dir",
+            wheelhouse_dir,
+            "--find-links",
+            dist_dir,
+            f"{PROJECT_NAME}{NODE_EXTRAS}",
+        ],
+        # pip itself, so the nodes need no apt-get to install python3-pip
+        [*python, "-m", "pip", "download", "--dest", wheelhouse_dir, "pip"],
+    ]
+
+
+def build_wheelhouse(
+    resource_dir, python="python3", dist_dir="dist", run=subprocess.run
+):
+    """Build the wheelhouse archive staged as a resource file of the pool.
+
+    python can be a command line, e.g. running a container that mounts the
+    current directory, since the wheels are built in the relative dist_dir.
+    """
+    wheelhouse_dir = os.path.join(dist_dir, "wheelhouse")
+    shutil.rmtree(wheelhouse_dir, ignore_errors=True)
+    for command in wheelhouse_commands(wheelhouse_dir, python, dist_dir):
+        run(command, check=True)
+
+    return archive_wheelhouse(wheelhouse_dir, resource_dir)
+
+
+def archive_wheelhouse(wheelhouse_dir, resource_dir):
+    """Pack a directory of wheels into {resource_dir}/wheelhouse.tar.gz.
+
+    The pip wheel is also stored at the root of the archive as pip.whl,
+    which the start task runs directly to install everything offline.
+    """
+    pip_wheels = glob.glob(os.path.join(wheelhouse_dir, "pip-*.whl"))
+    if not pip_wheels:
+        raise FileNotFoundError(f"no pip wheel in {wheelhouse_dir}")
+
+    archive_path = os.path.join(resource_dir, WHEELHOUSE_ARCHIVE)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pip_path = os.path.join(tmp_dir, "pip.whl")
+        shutil.copy(pip_wheels[0], pip_path)
+        with tarfile.open(archive_path, "w:gz") as archive:
+            archive.add(wheelhouse_dir, arcname="wheelhouse")
+            archive.add(pip_path, arcname="pip.whl")
+
+    return archive_path
+
+
+def offline_install_commands(archive_name=WHEELHOUSE_ARCHIVE):
+    """Start task commands installing the project from the staged wheelhouse."""
+    return [
+        f"tar -xzf {archive_name}",
+        # pip can run from its own wheel, no pip is needed on the image
+        "sudo python3 pip.whl/pip install --no-index --find-links wheelhouse "
+        f"'{PROJECT_NAME}{NODE_EXTRAS}'",
+    ]
@@ -0,0 +1,316 @@
+"""Benchmarks of the simulation and orchestration hot paths.
+
+Everything runs on synthetic price histories, so no network is needed:
+
+    poetry run python benchmarks/bench.py --output report.json
+    poetry run python benchmarks/bench.py --save-baseline benchmarks/baseline.json
+    poetry run python benchmarks/bench.py --baseline benchmarks/baseline.json
+
+Each benchmark reports the best and median wall time of a few repeats.
+Compared to a baseline report, benchmarks whose best time grew by more
+than the threshold are flagged as regressions.
+"""
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from multiprocessing import cpu_count
+
+import click
+import pandas as pd
+
+from stock_price_simulator import __version__, trading_calendar
+from stock_price_simulator.run import run
+from stock_price_simulator.simulate import next_year_trading_dates, simulate
+from stock_price_simulator.sources import SyntheticSource
+from stock_price_simulator.ticker import download_ticker_prices
+
+HISTORY_START = "2020-01-01"
+HISTORY_END = "2021-12-31"
+
+FULL_SUITE = {
+    "num_of_simulation": [100, 1000, 10000],
+    "num_of_days": [21, 252],
+    "num_of_tickers": [1, 10],
+    "processes": [1, 2, 4],
+    "serialization_rows": 1_000_000,
+}
+QUICK_SUITE = {
+    "num_of_simulation": [100, 1000],
+    "num_of_days": [21],
+    "num_of_tickers": [1, 2],
+    "processes": [1, 2],
+    "serialization_rows": 10_000,
+}
+
+
+def measure(func, repeat=3):
+    """Best and median wall time of calling func repeat times."""
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start_time)
+
+    return {"best": min(timings), "median": statistics.median(timings)}
+
+
+def synthetic_prices(num_of_tickers, seed=0):
+    return download_ticker_prices(
+        [f"SYN{i:04d}" for i in range(num_of_tickers)],
+        start=HISTORY_START,
+        end=HISTORY_END,
+        source=SyntheticSource(seed),
+    )
+
+
+def bench_simulate(suite, repeat):
+    results = []
+    for num_of_tickers in suite["num_of_tickers"]:
+        ticker_price_df = synthetic_prices(num_of_tickers)
+        for num_of_days in suite["num_of_days"]:
+            trading_dates = pd.bdate_range("2022-01-03", periods=num_of_days).to_list()
+            for num_of_simulation in suite["num_of_simulation"]:
+
+                def simulate_all():
+                    for (ticker, price_df) in ticker_price_df.items():
+                        simulate(
+                            ticker,
+                            price_df,
+                            trading_dates,
+                            num_of_simulation,
+                            as_result=True,
+                            seed=0,
+                        )
+
+                timing = measure(simulate_all, repeat)
+                paths = num_of_tickers * num_of_simulation
+                results.append(
+                    {
+                        "name": "simulate",
+                        "params": {
+                            "num_of_tickers": num_of_tickers,
+                            "num_of_days": num_of_days,
+                            "num_of_simulation": num_of_simulation,
+                        },
+                        **timing,
+                        "paths_per_second": paths / timing["best"],
+                    }
+                )
+
+    return results
+
+
+def bench_trading_dates(suite, repeat):
+    def cold():
+        trading_calendar.clear_cache()
+        next_year_trading_dates(HISTORY_END)
+
+    def warm():
+        next_year_trading_dates(HISTORY_END)
+
+    results = [
+        {
+            "name": "get_trading_dates",
+            "params": {"cache": "cold"},
+            **measure(cold, repeat),
+        }
+    ]
+    next_year_trading_dates(HISTORY_END)
+    results.append(
+        {
+            "name": "get_trading_dates",
+            "params": {"cache": "warm"},
+            **measure(warm, repeat),
+        }
+    )
+
+    return results
+
+
+def bench_run(suite, repeat):
+    num_of_tickers = max(suite["num_of_tickers"])
+    num_of_simulation = max(suite["num_of_simulation"])
+    ticker_symbols = list(synthetic_prices(num_of_tickers))
+
+    results = []
+    for processes in suite["processes"]:
+        for chunk_size in [None, 256]:
+
+            def run_all():
+                run(
+                    as_result=True,
+                    seed=0,
+                    num_of_simulation=num_of_simulation,
+                    chunk_size=chunk_size,
+                    processes=processes,
+                    ticker_symbols=ticker_symbols,
+                    source=SyntheticSource(),
+                )
+
+            results.append(
+                {
+                    "name": "run",
+                    "params": {
+                        "num_of_tickers": num_of_tickers,
+                        "num_of_simulation": num_of_simulation,
+                        "processes": processes,
+                        "chunk_size": chunk_size,
+                    },
+                    **measure(run_all, repeat),
+                }
+            )
+
+    return results
+
+
+def bench_serialization(suite, repeat):
+    num_of_days = 252
+    num_of_simulation = max(1, suite["serialization_rows"] // num_of_days)
+    price_df = synthetic_prices(1)["SYN0000"]
+    trading_dates = pd.bdate_range("2022-01-03", periods=num_of_days).to_list()
+    simulated_price_df = simulate(
+        "SYN0000", price_df, trading_dates, num_of_simulation, seed=0
+    )
+
+    formats = {
+        "csv": (
+            lambda df, path: df.to_csv(path, index=False),
+            lambda path: pd.read_csv(path, parse_dates=["date"]),
+        ),
+    }
+    try:
+        import pyarrow  # noqa: F401
+
+        formats["parquet"] = (
+            lambda df, path: df.to_parquet(path, index=False),
+            pd.read_parquet,
+        )
+        formats["arrow"] = (
+            lambda df, path: df.to_feather(path),
+            pd.read_feather,
+        )
+    except ImportError:
+        print("pyarrow is not installed, skipping columnar formats", file=sys.stderr)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for (format, (write, read)) in formats.items():
+            path = os.path.join(tmp_dir, f"simulated.{format}")
+            write_timing = measure(lambda: write(simulated_price_df, path), repeat)
+            read_timing = measure(lambda: read(path), repeat)
+            params = {"format": format, "rows": len(simulated_price_df)}
+            results.append({"name": "write", "params": params, **write_timing})
+            results.append(
+                {
+                    "name": "read",
+                    "params": params,
+                    **read_timing,
+                    "bytes": os.path.getsize(path),
+                }
+            )
+
+    return results
+
+
+BENCHMARKS = {
+    "simulate": bench_simulate,
+    "trading_dates": bench_trading_dates,
+    "run": bench_run,
+    "serialization": bench_serialization,
+}
+
+
+def benchmark_key(result):
+    return result["name"], json.dumps(result["params"], sort_keys=True)
+
+
+def compare(report, baseline, threshold=0.2):
+    """Benchmarks of report whose best time exceeds the baseline's by threshold."""
+    baseline_results = {benchmark_key(result): result for result in baseline["results"]}
+
+    regressions = []
+    for result in report["results"]:
+        baseline_result = baseline_results.get(benchmark_key(result))
+        if baseline_result is None:
+            continue
+        ratio = result["best"] / baseline_result["best"]
+        if ratio > 1 + threshold:
+            regressions.append(
+                {**result, "baseline": baseline_result["best"], "ratio": ratio}
+            )
+
+    return regressions
+
+
+def run_benchmarks(names=None, quick=False, repeat=3):
+    suite = QUICK_SUITE if quick else FULL_SUITE
+    results = []
+    for (name, benchmark) in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        print(f"Benchmark {name}...", file=sys.stderr)
+        results.extend(benchmark(suite, repeat))
+
+    return {
+        "version": __version__,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": cpu_count(),
+        },
+        "suite": "quick" if quick else "full",
+        "results": results,
+    }
+
+
+@click.command()
+@click.option(
+    "--benchmark",
+    "names",
+    multiple=True,
+    type=click.Choice(list(BENCHMARKS)),
+    help="Only run these benchmarks, can be repeated.",
+)
+@click.option("--quick", is_flag=True, help="Run a small suite, e.g. for CI.")
+@click.option("--repeat", type=int, default=3, show_default=True)
+@click.option("--output", type=click.Path(), help="Write the JSON report here.")
+@click.option(
+    "--baseline", type=click.Path(exists=True), help="Compare to this report."
+)
+@click.option(
+    "--save-baseline", type=click.Path(), help="Store the report as baseline."
+)
+@click.option("--threshold", type=float, default=0.2, show_default=True)
+def cli(names, quick, repeat, output, baseline, save_baseline, threshold):
+    report = run_benchmarks(names, quick, repeat)
+
+    for result in report["results"]:
+        params = ", ".join(f"{k}={v}" for (k, v) in result["params"].items())
+        print(f"{result['name']:<18} {params:<70} {result['best'] * 1000:10.2f} ms")
+
+    for path in [output, save_baseline]:
+        if path:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare(report, json.load(f), threshold)
+        for regression in regressions:
+            print(
+                f"REGRESSION {regression['name']} {regression['params']}: "
+                f"{regression['baseline'] * 1000:.2f} ms -> "
+                f"{regression['best'] * 1000:.2f} ms ({regression['ratio']:.2f}x)"
+            )
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,243 @@
+import numpy as np
+import pandas as pd
+
+from stock_price_simulator.result import DEFAULT_QUANTILES
+
+# The quantile sketch counts log(price / reference_price) on a fixed grid of
+# DEFAULT_BINS bins spanning +-DEFAULT_LOG_RANGE, plus one bin below and one
+# above it. Bins are ~0.4% of the price wide, quantiles are interpolated
+# within a bin.
+DEFAULT_BINS = 2048
+DEFAULT_LOG_RANGE = 4.0
+
+
+class PathAggregate:
+    """Streaming statistics of the simulated prices of one ticker per date.
+
+    Keeps the count, mean and sum of squared deviations (Welford) and a
+    histogram on a fixed log price grid for every date, so memory grows
+    with the number of days only, not with the number of simulations.
+    Aggregates of disjoint simulations with the same grid merge exactly,
+    e.g. the chunks of a ticker simulated by different workers or tasks.
+    """
+
+    def __init__(
+        self,
+        ticker,
+        trading_dates,
+        reference_price,
+        bins=DEFAULT_BINS,
+        log_range=DEFAULT_LOG_RANGE,
+    ):
+        num_of_days = len(trading_dates)
+        self.ticker = ticker
+        self.dates = pd.Index(trading_dates)
+        self.reference_price = float(reference_price)
+        self.bins = bins
+        self.log_range = float(log_range)
+        self.count = 0
+        self.mean = np.zeros(num_of_days)
+        self.m2 = np.zeros(num_of_days)
+        self.min = np.full(num_of_days, np.inf)
+        self.max = np.full(num_of_days, -np.inf)
+        self.counts = np.zeros((num_of_days, bins + 2), dtype=np.int64)
+
+    def __repr__(self):
+        return (
+            f"PathAggregate(ticker={self.ticker!r}, "
+            f"num_of_simulation={self.count}, num_of_days={self.num_of_days})"
+        )
+
+    @property
+    def num_of_days(self):
+        return len(self.dates)
+
+    @property
+    def edges(self):
+        """Edges of the log price grid, relative to the reference price."""
+        return np.linspace(-self.log_range, self.log_range, self.bins + 1)
+
+    @classmethod
+    def from_result(cls, result, reference_price=None, **kwargs):
+        if reference_price is None:
+            reference_price = result.prices[0, 0] if result.prices.size else 1.0
+        aggregate = cls(result.ticker, result.dates, reference_price, **kwargs)
+        aggregate.update(result.prices)
+
+        return aggregate
+
+    def update(self, prices):
+        """Add a (simulations, days) block of simulated prices."""
+        prices = np.asarray(prices, dtype=np.float64)
+        if prices.ndim != 2 or prices.shape[1] != self.num_of_days:
+            raise ValueError(
+                f"expected prices of shape (simulations, {self.num_of_days}), "
+                f"got {prices.shape}"
+            )
+        if not len(prices):
+            return self
+
+        # Welford's update for a whole block at once (Chan et al.)
+        count = len(prices)
+        mean = prices.mean(axis=0)
+        m2 = np.square(prices - mean).sum(axis=0)
+        self._combine(count, mean, m2)
+
+        np.minimum(self.min, prices.min(axis=0), out=self.min)
+        np.maximum(self.max, prices.max(axis=0), out=self.max)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            log_prices = np.log(prices / self.reference_price)
+        bin_ids = np.searchsorted(self.edges, log_prices, side="right")
+        # one bincount over all days, offset by the day's row in counts
+        bin_ids += np.arange(self.num_of_days) * (self.bins + 2)
+        self.counts += np.bincount(bin_ids.ravel(), minlength=self.counts.size).reshape(
+            self.counts.shape
+        )
+
+        return self
+
+    def merge(self, other):
+        """Add the statistics of another aggregate of the same grid."""
+        if (
+            other.ticker != self.ticker
+            or not other.dates.equals(self.dates)
+            or other.reference_price != self.reference_price
+            or other.bins != self.bins
+            or other.log_range != self.log_range
+        ):
+            raise ValueError(f"cannot merge {other!r} into {self!r}, grids differ")
+        if not other.count:
+            return self
+
+        self._combine(other.count, other.mean, other.m2)
+        np.minimum(self.min, other.min, out=self.min)
+        np.maximum(self.max, other.max, out=self.max)
+        self.counts += other.counts
+
+        return self
+
+    @classmethod
+    def concat(cls, aggregates):
+        """Merge the aggregates of several chunks into a new aggregate."""
+        aggregates = list(aggregates)
+        first = aggregates[0]
+        merged = cls(
+            first.ticker,
+            first.dates,
+            first.reference_price,
+            bins=first.bins,
+            log_range=first.log_range,
+        )
+        for aggregate in aggregates:
+            merged.merge(aggregate)
+
+        return merged
+
+    def _combine(self, count, mean, m2):
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * (count / total)
+        self.m2 += m2 + np.square(delta) * (self.count * count / total)
+        self.count = total
+
+    @property
+    def std(self):
+        if self.count < 2:
+            return np.full(self.num_of_days, np.nan)
+
+        return np.sqrt(self.m2 / (self.count - 1))
+
+    def quantiles(self, q=DEFAULT_QUANTILES):
+        """Approximate price quantiles across simulations, one row per date."""
+        # per date, the log price edges of every bin, where the outer bins
+        # end at the smallest and largest price seen
+        with np.errstate(divide="ignore"):
+            log_min = np.log(self.min / self.reference_price)
+            log_max = np.log(self.max / self.reference_price)
+        edges = np.empty((self.num_of_days, self.bins + 3))
+        edges[:, 1:-1] = self.edges
+        edges[:, 0] = np.minimum(log_min, self.edges[0])
+        edges[:, -1] = np.maximum(log_max, self.edges[-1])
+
+        cum_counts = np.cumsum(self.counts, axis=1)
+        days = np.arange(self.num_of_days)
+        values = []
+        for quantile in q:
+            rank = quantile * self.count
+            bin_ids = np.minimum(
+                (cum_counts < rank).sum(axis=1), self.counts.shape[1] - 1
+            )
+            below = cum_counts[days, bin_ids] - self.counts[days, bin_ids]
+            fraction = np.clip(
+                (rank - below) / np.maximum(self.counts[days, bin_ids], 1), 0, 1
+            )
+            lower = edges[days, bin_ids]
+            upper = edges[days, bin_ids + 1]
+            log_prices = lower + fraction * (upper - lower)
+            values.append(
+                np.clip(self.reference_price * np.exp(log_prices), self.min, self.max)
+            )
+
+        return pd.DataFrame(
+            np.array(values).T,
+            index=self.dates.rename("date"),
+            columns=pd.Index(q, name="quantile"),
+        )
+
+    def summary(self, q=DEFAULT_QUANTILES):
+        """Mean, standard deviation and quantiles per date, like SimulationResult."""
+        summary_df = self.quantiles(q)
+        summary_df.columns = [f"{quantile:.0%}" for quantile in q]
+        summary_df.insert(0, "mean", self.mean)
+        summary_df.insert(1, "std", self.std)
+
+        return summary_df
+
+    def value_at_risk(self, level=0.95, price=None):
+        """Loss of the terminal price below price, not exceeded with level.
+
+        The loss is measured from price, by default the reference price,
+        which is the last known price for aggregates built by simulate.
+        """
+        if price is None:
+            price = self.reference_price
+        terminal_quantile = self.quantiles([1 - level]).iloc[-1, 0]
+
+        return price - terminal_quantile
+
+    def save(self, path):
+        """Store the aggregate as an .npz file, e.g. the output of a Batch task."""
+        np.savez(
+            path,
+            ticker=self.ticker,
+            dates=self.dates.to_numpy(),
+            reference_price=self.reference_price,
+            bins=self.bins,
+            log_range=self.log_range,
+            count=self.count,
+            mean=self.mean,
+            m2=self.m2,
+            min=self.min,
+            max=self.max,
+            counts=self.counts,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            aggregate = cls(
+                str(data["ticker"]),
+                pd.Index(data["dates"]),
+                float(data["reference_price"]),
+                bins=int(data["bins"]),
+                log_range=float(data["log_range"]),
+            )
+            aggregate.count = int(data["count"])
+            aggregate.mean = data["mean"]
+            aggregate.m2 = data["m2"]
+            aggregate.min = data["min"]
+            aggregate.max = data["max"]
+            aggregate.counts = data["counts"]
+
+        return aggregate
@@ -0,0 +1,345 @@
+"""Checkpointed runs over large ticker universes, resumable after failures.
+
+Every ticker is simulated and written to a dataset on its own, and a
+manifest next to the dataset durably records each ticker as soon as it
+completed or failed. Rerunning with the same output directory and
+parameters only simulates the tickers that failed or never completed, so a
+crash, a killed worker or a failed download costs the missing tickers
+rather than the whole run.
+"""
+import json
+import os
+import threading
+from multiprocessing import Pool, TimeoutError, cpu_count
+
+import click
+
+from stock_price_simulator import __version__
+from stock_price_simulator.instrument import span
+from stock_price_simulator.models import DEFAULT_MODEL, RETURN_MODELS
+from stock_price_simulator.rng import SHOCK_SOURCES
+from stock_price_simulator.simulate import next_year_trading_dates, simulate
+from stock_price_simulator.sink import DATASET_FORMATS, DatasetSink
+from stock_price_simulator.sources import default_source
+from stock_price_simulator.ticker import TICKER_SYMBOLS, read_universe
+
+# the leading underscore hides it from dataset readers
+MANIFEST_FILENAME = "_manifest.jsonl"
+# workers are replaced after this many tickers, which bounds the memory
+# leaked by long runs
+DEFAULT_MAX_TASKS_PER_CHILD = 100
+# a killed worker silently loses its ticker, so the run stops once no
+# ticker completed for this many seconds instead of waiting forever
+DEFAULT_TIMEOUT = 900
+
+# Set in every worker by _init_worker, shared by all tickers of a run
+_worker_state = {}
+
+
+class Manifest:
+    """Append-only record of the tickers a run completed or failed.
+
+    The first line holds the parameters of the run, and every other line
+    one JSON record per ticker, the last record of a ticker winning. Each
+    record is flushed and synced before record() returns, and a torn last
+    line of a crashed run is ignored. Opening the manifest of a run with
+    other parameters raises ValueError, as its results cannot be mixed,
+    while params=None opens any manifest, e.g. to inspect it.
+    """
+
+    def __init__(self, path, params=None):
+        self.path = str(path)
+        # compared as read back from JSON, e.g. tuples become lists
+        self.params = None
+        if params is not None:
+            self.params = json.loads(json.dumps(params, default=str))
+        self.records = {}
+
+        if os.path.exists(self.path) and os.path.getsize(self.path):
+            self._load()
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._append({"params": self.params or {}})
+
+    def __repr__(self):
+        return (
+            f"Manifest(path={self.path!r}, completed={len(self.completed)}, "
+            f"failed={len(self.failed)})"
+        )
+
+    @property
+    def completed(self):
+        return [ticker for (ticker, record) in self.records.items() if record["ok"]]
+
+    @property
+    def failed(self):
+        return {
+            ticker: record.get("error")
+            for (ticker, record) in self.records.items()
+            if not record["ok"]
+        }
+
+    def pending(self, tickers):
+        """The tickers among tickers that did not complete yet, in order."""
+        return [
+            ticker
+            for ticker in tickers
+            if not self.records.get(ticker, {}).get("ok", False)
+        ]
+
+    def record(self, ticker, ok, **info):
+        record = {"ticker": ticker, "ok": ok, **info}
+        self._append(record)
+        self.records[ticker] = record
+
+    def _load(self):
+        with open(self.path) as f:
+            lines = f.read().splitlines()
+
+        header = json.loads(lines[0])
+        if self.params is None:
+            self.params = header.get("params")
+        elif header.get("params") != self.params:
+            raise ValueError(
+                f"{self.path} records a run with other parameters "
+                f"{header.get('params')}, remove it to start over"
+            )
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # torn by a crash while appending
+            self.records[record["ticker"]] = record
+
+    def _append(self, record):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def run_checkpointed(
+    output_dir,
+    ticker_symbols=None,
+    start="2020-01-01",
+    end="2021-12-31",
+    source=None,
+    output_format="parquet",
+    num_of_simulation=5,
+    processes=None,
+    max_tasks_per_child=DEFAULT_MAX_TASKS_PER_CHILD,
+    max_in_flight=None,
+    timeout=DEFAULT_TIMEOUT,
+    seed=None,
+    model=DEFAULT_MODEL,
+    model_options=None,
+    shocks="pseudo",
+):
+    """Simulate every ticker to a dataset in output_dir, resuming past runs.
+
+    The tickers that an earlier run with the same parameters completed, as
+    recorded by the Manifest in output_dir, are skipped. The others are
+    handed to the pool with imap_unordered, each worker downloading and
+    simulating one ticker at a time, and at most max_in_flight tickers are
+    queued or running at once however large the universe. Workers are
+    replaced after max_tasks_per_child tickers. A ticker whose download or
+    simulation raises is recorded as failed and the run goes on.
+
+    When no ticker completed for timeout seconds, e.g. because a worker was
+    killed and its ticker lost, the pool is terminated and RuntimeError
+    raised; the completed tickers are kept for the next run. Returns the
+    Manifest, whose failed tickers are retried by the next run.
+    """
+    if ticker_symbols is None:
+        ticker_symbols = TICKER_SYMBOLS
+    if source is None:
+        source = default_source()
+    if processes is None:
+        processes = max(1, cpu_count() - 1)
+    if max_in_flight is None:
+        max_in_flight = 2 * processes
+
+    sink = DatasetSink(output_dir, output_format)
+    kwds = {
+        "seed": seed,
+        "model": model,
+        "model_options": model_options,
+        "shocks": shocks,
+    }
+    manifest = Manifest(
+        os.path.join(output_dir, MANIFEST_FILENAME),
+        {
+            "version": __version__,
+            "start": start,
+            "end": end,
+            "output_format": output_format,
+            "num_of_simulation": num_of_simulation,
+            **kwds,
+        },
+    )
+    pending = manifest.pending(ticker_symbols)
+    print(
+        f"{len(ticker_symbols) - len(pending)} tickers already completed, "
+        f"{len(pending)} to simulate..."
+    )
+    if not pending:
+        return manifest
+
+    in_flight = threading.BoundedSemaphore(max_in_flight)
+    # stops the pool's task feeder from waiting on tickers nobody collects
+    cancelled = threading.Event()
+
+    def tickers():
+        for ticker in pending:
+            while not in_flight.acquire(timeout=0.1):
+                if cancelled.is_set():
+                    return
+            yield ticker
+
+    with span("simulate_all", processes=processes, tickers=len(pending)), Pool(
+        processes,
+        initializer=_init_worker,
+        initargs=(source, sink, start, end, num_of_simulation, kwds),
+        maxtasksperchild=max_tasks_per_child,
+    ) as pool:
+        records = pool.imap_unordered(_simulate_ticker, tickers())
+        try:
+            for _ in pending:
+                try:
+                    record = records.next(timeout=timeout)
+                except TimeoutError:
+                    raise RuntimeError(
+                        f"no ticker completed for {timeout}s, rerun to resume "
+                        f"the {len(manifest.pending(pending))} missing tickers"
+                    ) from None
+                in_flight.release()
+                manifest.record(**record)
+                if not record["ok"]:
+                    print(f"{record['ticker']} failed: {record['error']}")
+        finally:
+            cancelled.set()
+
+    return manifest
+
+
+def _init_worker(source, sink, start, end, num_of_simulation, kwds):
+    _worker_state.update(
+        source=source,
+        sink=sink,
+        start=start,
+        end=end,
+        num_of_simulation=num_of_simulation,
+        kwds=kwds,
+    )
+
+
+def _simulate_ticker(ticker):
+    state = _worker_state
+    try:
+        price_df = state["source"].fetch(ticker, state["start"], state["end"])
+        if price_df.empty:  # in case failed download
+            raise ValueError("no price history")
+
+        # the workers only need the dates and the adjusted closes
+        price_df = price_df[["Date", "Adj Close"]]
+        # parts of an earlier run, e.g. of a worker killed midway
+        state["sink"].clear([ticker])
+        rows = simulate(
+            ticker,
+            price_df,
+            next_year_trading_dates(price_df["Date"].max()),
+            state["num_of_simulation"],
+            sink=state["sink"],
+            **state["kwds"],
+        )
+    except Exception as e:
+        return {"ticker": ticker, "ok": False, "error": f"{type(e).__name__}: {e}"}
+
+    return {"ticker": ticker, "ok": True, "rows": int(rows)}
+
+
+@click.command()
+@click.option(
+    "--universe",
+    type=click.Path(exists=True, dir_okay=False),
+    help="File of the tickers to simulate, one per line or a .csv with a ticker "
+    "column, defaults to the built-in tickers.",
+)
+@click.option(
+    "--output-dir",
+    required=True,
+    help="Dataset to write, rerun with the same directory to resume.",
+)
+@click.option(
+    "--output-format",
+    type=click.Choice(list(DATASET_FORMATS)),
+    default="parquet",
+    show_default=True,
+)
+@click.option("--seed", type=int, help="Seed for reproducible simulations.")
+@click.option("--num-of-simulation", type=int, default=5, show_default=True)
+@click.option(
+    "--processes",
+    type=int,
+    help="Number of worker processes, defaults to the number of CPUs minus one.",
+)
+@click.option(
+    "--max-tasks-per-child",
+    type=int,
+    default=DEFAULT_MAX_TASKS_PER_CHILD,
+    show_default=True,
+    help="Replace each worker after this many tickers.",
+)
+@click.option(
+    "--timeout",
+    type=float,
+    default=DEFAULT_TIMEOUT,
+    show_default=True,
+    help="Stop when no ticker completed for this many seconds.",
+)
+@click.option(
+    "--model",
+    type=click.Choice(list(RETURN_MODELS)),
+    default=DEFAULT_MODEL,
+    show_default=True,
+)
+@click.option(
+    "--shocks",
+    type=click.Choice(list(SHOCK_SOURCES)),
+    default="pseudo",
+    show_default=True,
+)
+def cli(
+    universe,
+    output_dir,
+    output_format,
+    seed,
+    num_of_simulation,
+    processes,
+    max_tasks_per_child,
+    timeout,
+    model,
+    shocks,
+):
+    manifest = run_checkpointed(
+        output_dir,
+        ticker_symbols=read_universe(universe) if universe else None,
+        output_format=output_format,
+        num_of_simulation=num_of_simulation,
+        processes=processes,
+        max_tasks_per_child=max_tasks_per_child,
+        timeout=timeout,
+        seed=seed,
+        model=model,
+        shocks=shocks,
+    )
+
+    print(f"{len(manifest.completed)} tickers saved in: {output_dir}")
+    if manifest.failed:
+        raise click.ClickException(
+            f"{len(manifest.failed)} tickers failed, rerun to retry them"
+        )
+
+
+if __name__ == "__main__":
+    cli()
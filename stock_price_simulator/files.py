@@ -0,0 +1,38 @@
+"""Helpers shared by the modules writing files.
+
+atomic_write makes sure readers never see a partially written file, and
+require_pyarrow imports the optional pyarrow of the Parquet and Arrow
+files.
+"""
+import os
+
+
+def atomic_write(path, write):
+    """Call write(tmp_path), then move the written file to path.
+
+    The temporary file is hidden next to path, on the same file system so
+    the move is atomic, and ignored by readers of the directory such as
+    pyarrow datasets. It is removed when write raises.
+    """
+    directory, filename = os.path.split(str(path))
+    tmp_path = os.path.join(directory, f".{filename}.{os.getpid()}.tmp")
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def require_pyarrow():
+    """Import pyarrow, or explain how to install the optional dependency."""
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ImportError(
+            "Parquet and Arrow files require pyarrow, "
+            "install it with `pip install pyarrow`"
+        ) from e
+
+    return pyarrow
@@ -0,0 +1,145 @@
+"""Wire formats of the frames exchanged between the runner and Batch tasks.
+
+CSV stays the default for compatibility. Parquet and Arrow IPC files are
+compressed, keep the column types, store the ticker dictionary encoded
+and can store the prices as float32, so they are smaller and much faster
+to parse. Both require pyarrow.
+"""
+import os
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from stock_price_simulator.files import require_pyarrow
+
+WIRE_FORMATS = {
+    "csv": ".csv",
+    "parquet": ".parquet",
+    "arrow": ".arrow",
+}
+COMPRESSION = "zstd"
+
+
+def format_of(path):
+    """The wire format of a file, from its extension."""
+    extension = os.path.splitext(str(path))[1]
+    for (format, format_extension) in WIRE_FORMATS.items():
+        if extension == format_extension:
+            return format
+
+    raise ValueError(
+        f"unknown wire format of {path}, "
+        f"expected one of the extensions {tuple(WIRE_FORMATS.values())}"
+    )
+
+
+def compact(df, float32=False):
+    """Dictionary encode the ticker and optionally downcast the prices."""
+    df = df.copy(deep=False)
+    if "ticker" in df:
+        df["ticker"] = df["ticker"].astype("category")
+    if float32 and "price" in df:
+        df["price"] = df["price"].astype(np.float32)
+
+    return df
+
+
+def read_frame(source, format=None):
+    """Read a frame from a path, or from bytes in the given format."""
+    if format is None:
+        format = format_of(source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = BytesIO(source)
+
+    if format == "csv":
+        return pd.read_csv(source)
+
+    require_pyarrow()
+    if format == "parquet":
+        df = pd.read_parquet(source)
+    else:
+        df = pd.read_feather(source)
+
+    # categories of different files do not concatenate, plain strings do
+    if "ticker" in df and isinstance(df["ticker"].dtype, pd.CategoricalDtype):
+        df["ticker"] = df["ticker"].astype(str)
+
+    return df
+
+
+def write_frame(df, path, format=None, float32=False):
+    """Write a frame to path in the given format, by default its extension's."""
+    with FrameWriter(path, format, float32=float32) as writer:
+        writer.write(df)
+
+    return path
+
+
+class FrameWriter:
+    """Append frames of the same columns to one file, e.g. as a sink.
+
+    Parquet files get a row group and Arrow files a record batch per
+    frame, so a simulation streamed in chunks is never held in memory.
+    """
+
+    def __init__(self, path, format=None, float32=False):
+        if format is None:
+            format = format_of(path)
+        if format not in WIRE_FORMATS:
+            raise ValueError(
+                f"unknown wire format: {format}, "
+                f"expected one of {tuple(WIRE_FORMATS)}"
+            )
+        if format != "csv":
+            require_pyarrow()
+        self.path = str(path)
+        self.format = format
+        self.float32 = float32
+        self._writer = None
+        self._schema = None
+        self._csv_header = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, df):
+        df = compact(df, self.float32)
+
+        if self.format == "csv":
+            df.to_csv(
+                self.path,
+                mode="w" if self._csv_header else "a",
+                header=self._csv_header,
+                index=False,
+            )
+            self._csv_header = False
+            return
+
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+        if self._writer is None:
+            self._schema = table.schema
+            self._writer = self._open(table.schema)
+        self._writer.write_table(table)
+
+    def _open(self, schema):
+        if self.format == "parquet":
+            import pyarrow.parquet as pq
+
+            return pq.ParquetWriter(self.path, schema, compression=COMPRESSION)
+
+        import pyarrow as pa
+
+        return pa.ipc.new_file(
+            self.path, schema, options=pa.ipc.IpcWriteOptions(compression=COMPRESSION)
+        )
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
@@ -0,0 +1,147 @@
+"""Timing spans and opt-in profiling for the runners.
+
+Spans are only recorded when SIMULATOR_TRACE_FILE is set, to a file path
+or to "-" for stderr. Every span is appended as one JSON line with its
+wall time, CPU time and the peak RSS of the process, so the lines written
+by Pool workers and Batch tasks can be collected in one file. Setting
+SIMULATOR_PROFILE_DIR additionally dumps a cProfile of the work done by
+every worker process to that directory.
+"""
+import cProfile
+import json
+import os
+import pickle
+import socket
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+TRACE_FILE_ENV = "SIMULATOR_TRACE_FILE"
+PROFILE_DIR_ENV = "SIMULATOR_PROFILE_DIR"
+
+# One profiler per process, accumulating every profiled call of the process
+_profiler = None
+
+
+def tracing_enabled():
+    return bool(os.environ.get(TRACE_FILE_ENV))
+
+
+@contextmanager
+def span(name, **attributes):
+    """Record the wall time, CPU time and peak RSS of the enclosed block.
+
+    Yields the attributes of the span, so the block can add to them, e.g.
+    the number of bytes transferred.
+    """
+    if not tracing_enabled():
+        yield attributes
+        return
+
+    start_time = time.time()
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    error = None
+    try:
+        yield attributes
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        record = {
+            "span": name,
+            "start": start_time,
+            "wall": time.perf_counter() - start_wall,
+            "cpu": time.process_time() - start_cpu,
+            "max_rss_kb": max_rss_kb(),
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            **attributes,
+        }
+        if error is not None:
+            record["error"] = error
+        emit(record)
+
+
+def emit(record):
+    path = os.environ.get(TRACE_FILE_ENV)
+    if not path:
+        return
+
+    line = json.dumps(record, default=str) + "\n"
+    if path == "-":
+        sys.stderr.write(line)
+        return
+
+    # one write per line in append mode, so lines of concurrent processes
+    # do not interleave
+    with open(path, "a") as f:
+        f.write(line)
+
+
+def max_rss_kb():
+    if resource is None:
+        return None
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":  # bytes instead of kilobytes
+        max_rss //= 1024
+
+    return max_rss
+
+
+@contextmanager
+def profiled(role):
+    """Profile the enclosed block into this process' profile of role.
+
+    The profile accumulates over every block of the process and is dumped
+    to {SIMULATOR_PROFILE_DIR}/{role}-{pid}.prof after each block.
+    """
+    profile_dir = os.environ.get(PROFILE_DIR_ENV)
+    if not profile_dir:
+        yield
+        return
+
+    global _profiler
+    if _profiler is None:
+        _profiler = cProfile.Profile()
+
+    _profiler.enable()
+    try:
+        yield
+    finally:
+        _profiler.disable()
+        os.makedirs(profile_dir, exist_ok=True)
+        _profiler.dump_stats(os.path.join(profile_dir, f"{role}-{os.getpid()}.prof"))
+
+
+@contextmanager
+def worker_span(name, **attributes):
+    """A span that is also profiled, for the work done in worker processes."""
+    with span(name, **attributes) as attributes, profiled(name):
+        yield attributes
+
+
+def call_pickled(func, *args, **kwargs):
+    """Call func in a worker and return its result pickled, timing the pickling.
+
+    Used instead of func when tracing, so the cost of sending results back
+    from Pool workers shows up as spans. Unpickle with unpickle().
+    """
+    result = func(*args, **kwargs)
+
+    with span("pickle", function=func.__name__) as attributes:
+        data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        attributes["bytes"] = len(data)
+
+    return data
+
+
+def unpickle(data):
+    with span("unpickle", bytes=len(data)):
+        return pickle.loads(data)
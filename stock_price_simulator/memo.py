@@ -0,0 +1,197 @@
+"""Content-addressed cache of simulation results.
+
+A seeded simulation only depends on its inputs, so its result is stored
+under a hash of the price series, the trading dates, the simulation count,
+the seed and the model parameters. Rerunning with unchanged histories and
+parameters then skips the simulation. Unseeded simulations are never
+cached, as they are meant to differ on every run.
+
+The cache has two tiers: the most recently used results in memory, and
+every result as a pickle file in a directory, evicting the least recently
+used files beyond max_bytes.
+"""
+import hashlib
+import json
+import os
+import pickle
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from stock_price_simulator.files import atomic_write
+
+# Set to a directory to cache seeded simulation results across runs
+CACHE_DIR_ENV = "SIMULATION_CACHE_DIR"
+# Optional, size of that directory beyond which old results are evicted
+CACHE_MAX_BYTES_ENV = "SIMULATION_CACHE_MAX_BYTES"
+
+# Part of every key. Bump it whenever a change of the models, the random
+# streams or the aggregation changes the simulated output, so results of
+# older code are not reused; the package version is not bumped for that.
+CACHE_FORMAT_VERSION = 1
+
+DEFAULT_MAX_ITEMS = 64
+DEFAULT_MAX_BYTES = 2**30
+
+
+def simulation_key(ticker, adj_close, trading_dates, num_of_simulation, seed, **params):
+    """Hash of everything a seeded simulation depends on.
+
+    params are the other parameters of the simulation, e.g. the model,
+    which must be JSON serializable or picklable. CACHE_FORMAT_VERSION is
+    part of the key, so results of older code are not reused once it was
+    bumped.
+    """
+    digest = hashlib.sha256()
+    header = {
+        "cache_format": CACHE_FORMAT_VERSION,
+        "ticker": str(ticker),
+        "num_of_simulation": int(num_of_simulation),
+        "seed": seed,
+        **params,
+    }
+    digest.update(json.dumps(header, sort_keys=True, default=_key_default).encode())
+    digest.update(np.ascontiguousarray(adj_close, dtype=np.float64).tobytes())
+    dates = pd.DatetimeIndex(trading_dates).values.astype("datetime64[ns]")
+    digest.update(dates.view(np.int64).tobytes())
+
+    return digest.hexdigest()
+
+
+class SimulationCache:
+    """Two tier LRU cache of simulation results by simulation_key.
+
+    Keeps up to max_items results in memory and, with a directory, every
+    result on disk until the directory grows beyond max_bytes. stats counts
+    the hits of each tier, the misses and the evictions. Not thread safe.
+    """
+
+    def __init__(
+        self, directory=None, max_items=DEFAULT_MAX_ITEMS, max_bytes=DEFAULT_MAX_BYTES
+    ):
+        self.directory = None if directory is None else str(directory)
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "puts": 0,
+            "evictions": 0,
+        }
+        self._memory = OrderedDict()
+
+    def __repr__(self):
+        return f"SimulationCache(directory={self.directory!r}, {self.report()})"
+
+    @property
+    def hits(self):
+        return self.stats["memory_hits"] + self.stats["disk_hits"]
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.stats["misses"]
+        return self.hits / lookups if lookups else 0.0
+
+    def report(self):
+        return (
+            f"{self.hits} hits ({self.stats['memory_hits']} in memory, "
+            f"{self.stats['disk_hits']} on disk), {self.stats['misses']} misses, "
+            f"{self.stats['evictions']} evictions"
+        )
+
+    def get(self, key):
+        """The result stored under key, or None."""
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return self._memory[key]
+
+        path = self._path(key)
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    value = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                value = None  # evicted or corrupted meanwhile
+            if value is not None:
+                # the modification time orders the files by last use
+                os.utime(path)
+                self.stats["disk_hits"] += 1
+                self._remember(key, value)
+                return value
+
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, key, value):
+        self.stats["puts"] += 1
+        self._remember(key, value)
+
+        path = self._path(key)
+        if path is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        atomic_write(path, lambda tmp_path: _pickle(value, tmp_path))
+        self._evict_files()
+
+    def clear(self):
+        self._memory.clear()
+        if self.directory is not None and os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".pkl"):
+                    os.remove(entry.path)
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def _path(self, key):
+        if self.directory is None:
+            return None
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def _evict_files(self):
+        entries = [
+            entry for entry in os.scandir(self.directory) if entry.name.endswith(".pkl")
+        ]
+        size = sum(entry.stat().st_size for entry in entries)
+        # least recently used first
+        for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+            if size <= self.max_bytes:
+                break
+            size -= entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue  # evicted by another process
+            self.stats["evictions"] += 1
+
+
+def default_cache():
+    """The cache configured by the environment, None when not configured."""
+    directory = os.environ.get(CACHE_DIR_ENV)
+    if not directory:
+        return None
+
+    max_bytes = os.environ.get(CACHE_MAX_BYTES_ENV)
+    return SimulationCache(
+        directory, max_bytes=int(max_bytes) if max_bytes else DEFAULT_MAX_BYTES
+    )
+
+
+def _key_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.dtype):
+        return value.str
+    # e.g. an already fitted model
+    return hashlib.sha256(pickle.dumps(value)).hexdigest()
+
+
+def _pickle(value, path):
+    with open(path, "wb") as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
@@ -0,0 +1,226 @@
+"""Models of the daily returns that drive the simulated paths.
+
+A model is fitted once per ticker from its adjusted close prices, and then
+generates the whole (simulations, days) matrix of simple daily returns in
+one call of ``sample(rng, size)``. ``sample`` fills the rows in order, so a
+chunk of simulations drawn from RandomStreams matches the same rows of a
+larger run. Models are small picklable objects, so the process pool and the
+Batch tasks select them by name and fit them where the prices are.
+
+For variance reduction, ``from_uniform(u)`` maps a matrix of uniforms to
+returns by inversion, so antithetic or quasi-random uniforms can drive any
+model; the normal models also have ``from_normal(z)``, so antithetic
+normals drive them without scipy. ``expected_growth(num_of_days)`` is the
+exact mean of the cumulative growth over num_of_days, used as a control
+variate.
+"""
+import numpy as np
+import pandas as pd
+
+DEFAULT_MODEL = "normal"
+
+
+class NormalModel:
+    """Zero drift normal returns, the original model of the simulator."""
+
+    def __init__(self, std):
+        self.std = std
+
+    @classmethod
+    def fit(cls, adj_close):
+        return cls(_returns(adj_close).std())
+
+    def sample(self, rng, size):
+        return rng.normal(0, self.std, size)
+
+    def from_normal(self, z):
+        return self.std * z
+
+    def from_uniform(self, u):
+        return self.from_normal(_ndtri(u))
+
+    def expected_growth(self, num_of_days):
+        return 1.0
+
+
+class GBMModel:
+    """Geometric Brownian motion, normal log returns with drift."""
+
+    def __init__(self, mu, sigma):
+        self.mu = mu
+        self.sigma = sigma
+
+    @classmethod
+    def fit(cls, adj_close):
+        log_returns = np.log1p(_returns(adj_close))
+        sigma = log_returns.std()
+
+        return cls(log_returns.mean() + sigma**2 / 2, sigma)
+
+    def sample(self, rng, size):
+        log_returns = rng.standard_normal(size)
+        log_returns *= self.sigma
+        log_returns += self.mu - self.sigma**2 / 2
+
+        return np.expm1(log_returns, out=log_returns)
+
+    def from_normal(self, z):
+        return np.expm1(self.mu - self.sigma**2 / 2 + self.sigma * z)
+
+    def from_uniform(self, u):
+        return self.from_normal(_ndtri(u))
+
+    def expected_growth(self, num_of_days):
+        return np.exp(self.mu * num_of_days)
+
+
+class StudentTModel:
+    """Fat tailed returns, Student-t scaled to the standard deviation."""
+
+    def __init__(self, std, dof=4.0, mean=0.0):
+        if dof <= 2:
+            raise ValueError(f"dof must be greater than 2, got {dof}")
+        self.std = std
+        self.dof = dof
+        self.mean = mean
+
+    @classmethod
+    def fit(cls, adj_close, dof=4.0):
+        returns = _returns(adj_close)
+
+        return cls(returns.std(), dof, returns.mean())
+
+    def sample(self, rng, size):
+        returns = rng.standard_t(self.dof, size)
+        # a Student-t variable has a variance of dof / (dof - 2)
+        returns *= self.std * np.sqrt((self.dof - 2) / self.dof)
+        returns += self.mean
+
+        return returns
+
+    def from_uniform(self, u):
+        special = _import_scipy_special()
+        returns = special.stdtrit(self.dof, u)
+
+        return self.mean + self.std * np.sqrt((self.dof - 2) / self.dof) * returns
+
+    def expected_growth(self, num_of_days):
+        return (1 + self.mean) ** num_of_days
+
+
+class BootstrapModel:
+    """Returns resampled with replacement from the historical returns."""
+
+    def __init__(self, returns):
+        self.returns = np.asarray(returns, dtype=np.float64)
+        if not len(self.returns):
+            raise ValueError("cannot bootstrap from an empty return history")
+
+    @classmethod
+    def fit(cls, adj_close):
+        return cls(_returns(adj_close).to_numpy())
+
+    def sample(self, rng, size):
+        return self.returns[rng.integers(0, len(self.returns), size)]
+
+    def from_uniform(self, u):
+        return self.returns[_uniform_to_index(u, len(self.returns))]
+
+    def expected_growth(self, num_of_days):
+        return (1 + self.returns.mean()) ** num_of_days
+
+
+class BlockBootstrapModel(BootstrapModel):
+    """Blocks of consecutive historical returns, keeping their autocorrelation.
+
+    Each path is a sequence of blocks of block_size days starting at random
+    days of the history, wrapping around at its end.
+    """
+
+    def __init__(self, returns, block_size=5):
+        super().__init__(returns)
+        if block_size < 1:
+            raise ValueError(f"block_size must be positive, got {block_size}")
+        self.block_size = block_size
+
+    @classmethod
+    def fit(cls, adj_close, block_size=5):
+        return cls(_returns(adj_close).to_numpy(), block_size)
+
+    def sample(self, rng, size):
+        num_of_simulation, num_of_days = size
+        num_of_blocks = -(-num_of_days // self.block_size)
+
+        starts = rng.integers(0, len(self.returns), (num_of_simulation, num_of_blocks))
+        indices = starts[:, :, np.newaxis] + np.arange(self.block_size)
+        indices = indices.reshape(num_of_simulation, -1)[:, :num_of_days]
+
+        return self.returns[indices % len(self.returns)]
+
+    def from_uniform(self, u):
+        # the first uniform of each block picks its start
+        num_of_simulation, num_of_days = u.shape
+        starts = _uniform_to_index(u[:, :: self.block_size], len(self.returns))
+        indices = starts[:, :, np.newaxis] + np.arange(self.block_size)
+        indices = indices.reshape(num_of_simulation, -1)[:, :num_of_days]
+
+        return self.returns[indices % len(self.returns)]
+
+    def expected_growth(self, num_of_days):
+        # blocks are independent, and each starts at any day of the history
+        # with the same probability
+        num_of_blocks, last_block_size = divmod(num_of_days, self.block_size)
+        block_growth = self._window_growth(self.block_size)
+
+        return block_growth**num_of_blocks * self._window_growth(last_block_size)
+
+    def _window_growth(self, size):
+        n = len(self.returns)
+        windows = (np.arange(n)[:, np.newaxis] + np.arange(size)) % n
+
+        return np.prod(1 + self.returns[windows], axis=1).mean()
+
+
+RETURN_MODELS = {
+    "normal": NormalModel,
+    "gbm": GBMModel,
+    "student_t": StudentTModel,
+    "bootstrap": BootstrapModel,
+    "block_bootstrap": BlockBootstrapModel,
+}
+
+
+def fit_model(name, adj_close, **options):
+    """Fit the return model registered as name to adjusted close prices."""
+    try:
+        model_class = RETURN_MODELS[name]
+    except KeyError:
+        raise ValueError(
+            f"unknown return model: {name}, expected one of {tuple(RETURN_MODELS)}"
+        ) from None
+
+    return model_class.fit(adj_close, **options)
+
+
+def _uniform_to_index(u, n):
+    return np.minimum((u * n).astype(np.int64), n - 1)
+
+
+def _ndtri(u):
+    return _import_scipy_special().ndtri(u)
+
+
+def _import_scipy_special():
+    try:
+        import scipy.special
+    except ImportError as e:
+        raise ImportError(
+            "Inverting the return distributions requires scipy, "
+            "install it with `pip install scipy`"
+        ) from e
+
+    return scipy.special
+
+
+def _returns(adj_close):
+    return pd.Series(adj_close, copy=False).pct_change().dropna()
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+
+from stock_price_simulator.instrument import span
+from stock_price_simulator.result import SimulationResult
+from stock_price_simulator.rng import RandomStreams
+
+
+def estimate_covariance(ticker_price_df):
+    """Covariance of the daily returns of all tickers.
+
+    Returns are aligned on their dates, and every pair of tickers uses the
+    dates both have prices for, so the diagonal matches the variance that
+    simulate uses for each ticker on its own.
+    """
+    adj_close = pd.concat(
+        {
+            ticker: price_df.set_index("Date")["Adj Close"]
+            for (ticker, price_df) in ticker_price_df.items()
+        },
+        axis=1,
+    ).sort_index()
+
+    return adj_close.pct_change().cov()
+
+
+def cholesky_factor(covariance):
+    """Lower triangular factor of a covariance matrix.
+
+    Covariances estimated on pairwise dates are not always positive
+    definite; such matrices are first projected onto the nearest positive
+    definite one by clipping their eigenvalues.
+    """
+    covariance = np.asarray(covariance, dtype=float)
+    try:
+        return np.linalg.cholesky(covariance)
+    except np.linalg.LinAlgError:
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        floor = 1e-12 * max(eigenvalues.max(), 1e-12)
+        eigenvalues = np.clip(eigenvalues, floor, None)
+        return np.linalg.cholesky((eigenvectors * eigenvalues) @ eigenvectors.T)
+
+
+def simulate_correlated(
+    ticker_price_df,
+    trading_dates,
+    num_of_simulation=5,
+    seed=None,
+    covariance=None,
+    dtype=None,
+):
+    """Simulate all tickers at once with correlated daily returns.
+
+    The standard normal shocks of every (simulation, day, ticker) are drawn
+    in one batch and correlated with the Cholesky factor of the joint
+    return covariance. Returns a dict of ticker to SimulationResult, each
+    with the same layout as the result of simulate for that ticker.
+    """
+    tickers = list(ticker_price_df)
+    if covariance is None:
+        covariance = estimate_covariance(ticker_price_df)
+    if isinstance(covariance, pd.DataFrame):
+        covariance = covariance.loc[tickers, tickers]
+    factor = cholesky_factor(covariance)
+    last_prices = np.array(
+        [price_df["Adj Close"].iat[-1] for price_df in ticker_price_df.values()]
+    )
+    num_of_days = len(trading_dates)
+
+    with span(
+        "simulate_correlated",
+        tickers=len(tickers),
+        num_of_simulation=num_of_simulation,
+    ):
+        # one stream for the whole universe, keyed by its tickers
+        streams = RandomStreams(seed, "|".join(tickers))
+        shocks = streams.draw(
+            lambda rng, rows: rng.standard_normal((rows, num_of_days, len(tickers))),
+            0,
+            num_of_simulation,
+        )
+
+        # correlate the shocks of each (simulation, day) across tickers
+        returns = np.tensordot(shocks, factor, axes=(2, 1))
+
+        # one contiguous (simulations, days) block per ticker
+        paths = np.ascontiguousarray(np.moveaxis(returns, 2, 0))
+        paths += 1
+        np.cumprod(paths, axis=2, out=paths)
+        paths *= last_prices[:, np.newaxis, np.newaxis]
+
+    return {
+        ticker: SimulationResult(
+            ticker, paths[i].astype(dtype, copy=False), trading_dates
+        )
+        for (i, ticker) in enumerate(tickers)
+    }
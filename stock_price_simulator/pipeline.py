@@ -0,0 +1,127 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool, cpu_count
+
+import pandas as pd
+
+from stock_price_simulator.instrument import span
+from stock_price_simulator.models import DEFAULT_MODEL
+from stock_price_simulator.simulate import next_year_trading_dates, simulate
+from stock_price_simulator.sink import DatasetSink
+from stock_price_simulator.sources import default_source
+from stock_price_simulator.ticker import TICKER_SYMBOLS
+
+
+def run_pipelined(
+    ticker_symbols=None,
+    start="2020-01-01",
+    end="2021-12-31",
+    source=None,
+    num_of_simulation=5,
+    processes=None,
+    fetch_concurrency=4,
+    max_pending=None,
+    seed=None,
+    sink=None,
+    as_result=False,
+    model=DEFAULT_MODEL,
+    model_options=None,
+    shocks="pseudo",
+):
+    """Simulate each ticker as soon as its price history is downloaded.
+
+    Up to fetch_concurrency threads download price histories while the
+    process pool simulates the tickers that have already arrived. At most
+    max_pending histories wait for or run in the pool at any time; when the
+    pool falls behind, the fetchers block instead of piling up frames in
+    memory. Returns the same values as run().
+    """
+    if ticker_symbols is None:
+        ticker_symbols = TICKER_SYMBOLS
+    if source is None:
+        source = default_source()
+    if processes is None:
+        processes = max(1, cpu_count() - 1)
+    if max_pending is None:
+        max_pending = 2 * processes
+
+    fetched = queue.Queue(maxsize=max_pending)
+    in_flight = threading.BoundedSemaphore(max_pending)
+    # stops the fetchers from waiting on a queue nobody reads anymore
+    cancelled = threading.Event()
+
+    def fetch(ticker):
+        if cancelled.is_set():
+            return
+        try:
+            with span("download", ticker=ticker):
+                price_df = source.fetch(ticker, start, end)
+        except Exception as e:
+            print(f"{ticker} download failed: {e}")
+            price_df = None
+        while not cancelled.is_set():
+            try:
+                fetched.put((ticker, price_df), timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def release(_):
+        in_flight.release()
+
+    async_results = {}
+    with ThreadPoolExecutor(max_workers=fetch_concurrency) as fetcher, Pool(
+        processes=processes
+    ) as pool:
+        for ticker in ticker_symbols:
+            fetcher.submit(fetch, ticker)
+
+        try:
+            for _ in ticker_symbols:
+                ticker, price_df = fetched.get()
+                if price_df is None or price_df.empty:  # in case failed download
+                    continue
+
+                # the workers only need the dates and the adjusted closes
+                price_df = price_df[["Date", "Adj Close"]]
+                trading_dates = next_year_trading_dates(price_df["Date"].max())
+
+                if isinstance(sink, DatasetSink):
+                    sink.clear([ticker])
+                in_flight.acquire()
+                async_results[ticker] = pool.apply_async(
+                    simulate,
+                    args=(ticker, price_df, trading_dates, num_of_simulation),
+                    kwds={
+                        "sink": sink,
+                        "as_result": as_result,
+                        "seed": seed,
+                        "model": model,
+                        "model_options": model_options,
+                        "shocks": shocks,
+                    },
+                    callback=release,
+                    error_callback=release,
+                )
+        except BaseException:
+            cancelled.set()
+            raise
+
+        pool.close()
+        pool.join()
+
+    # keep the order of ticker_symbols whatever order the downloads finished
+    results = [
+        async_results[ticker].get()
+        for ticker in ticker_symbols
+        if ticker in async_results
+    ]
+
+    if sink is not None:
+        return sum(results)
+
+    if as_result:
+        return {result.ticker: result for result in results}
+
+    return pd.concat(results, ignore_index=True)
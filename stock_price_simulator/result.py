@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+DEFAULT_QUANTILES = (0.05, 0.5, 0.95)
+
+
+class SimulationResult:
+    """Simulated prices of one ticker as a (simulations, days) array.
+
+    The ticker and the trading dates are stored once instead of on every
+    row; the long and wide frames are only built on request.
+    """
+
+    def __init__(self, ticker, prices, trading_dates, first_simulation_id=0):
+        prices = np.asarray(prices)
+        if prices.ndim != 2 or prices.shape[1] != len(trading_dates):
+            raise ValueError(
+                f"expected prices of shape (simulations, {len(trading_dates)}), "
+                f"got {prices.shape}"
+            )
+        self.ticker = ticker
+        self.prices = prices
+        self.dates = pd.Index(trading_dates)
+        self.first_simulation_id = first_simulation_id
+
+    def __repr__(self):
+        return (
+            f"SimulationResult(ticker={self.ticker!r}, "
+            f"num_of_simulation={self.num_of_simulation}, "
+            f"num_of_days={self.num_of_days}, dtype={self.prices.dtype})"
+        )
+
+    def __len__(self):
+        return self.prices.size
+
+    @property
+    def num_of_simulation(self):
+        return self.prices.shape[0]
+
+    @property
+    def num_of_days(self):
+        return self.prices.shape[1]
+
+    @property
+    def simulation_ids(self):
+        return np.arange(
+            self.first_simulation_id, self.first_simulation_id + self.num_of_simulation
+        )
+
+    @property
+    def terminal_prices(self):
+        return self.prices[:, -1]
+
+    def to_long_frame(self):
+        """One row per (simulation, date), the schema returned by simulate."""
+        num_of_simulation, num_of_days = self.prices.shape
+
+        return pd.DataFrame(
+            {
+                "ticker": np.full(self.prices.size, self.ticker, dtype=object),
+                "simulation_id": np.repeat(self.simulation_ids, num_of_days),
+                "date": self.dates.take(
+                    np.tile(np.arange(num_of_days), num_of_simulation)
+                ),
+                "price": self.prices.ravel(),
+            }
+        )
+
+    def to_wide_frame(self):
+        """One row per date and one column per simulation."""
+        return pd.DataFrame(
+            self.prices.T,
+            index=self.dates.rename("date"),
+            columns=pd.Index(self.simulation_ids, name="simulation_id"),
+        )
+
+    def quantiles(self, q=DEFAULT_QUANTILES):
+        """Price quantiles across simulations, one row per date."""
+        return pd.DataFrame(
+            np.quantile(self.prices, q, axis=0).T,
+            index=self.dates.rename("date"),
+            columns=pd.Index(q, name="quantile"),
+        )
+
+    def summary(self, q=DEFAULT_QUANTILES):
+        """Mean, standard deviation and quantiles across simulations per date."""
+        summary_df = self.quantiles(q)
+        summary_df.columns = [f"{quantile:.0%}" for quantile in q]
+        summary_df.insert(0, "mean", self.prices.mean(axis=0))
+        summary_df.insert(1, "std", self.prices.std(axis=0, ddof=1))
+
+        return summary_df
+
+    @classmethod
+    def concat(cls, results):
+        """Merge results of consecutive simulation chunks of one ticker."""
+        results = sorted(results, key=lambda result: result.first_simulation_id)
+
+        return cls(
+            results[0].ticker,
+            np.concatenate([result.prices for result in results]),
+            results[0].dates,
+            results[0].first_simulation_id,
+        )
@@ -0,0 +1,116 @@
+import hashlib
+
+import numpy as np
+
+# Simulations are drawn in blocks of this size, each block from its own
+# stream keyed by (seed, ticker, block id). Any split of the simulations
+# into chunks, processes or Batch tasks therefore yields the same paths.
+RNG_BLOCK_SIZE = 64
+
+# Sources of the uniforms behind the shocks: independent pseudo-random
+# numbers, antithetic pairs (u, 1 - u) in consecutive rows, or a scrambled
+# Sobol sequence per block. RNG_BLOCK_SIZE is even and a power of two, so
+# pairs never straddle blocks and each block is a balanced Sobol sample.
+SHOCK_SOURCES = ("pseudo", "antithetic", "sobol")
+
+# uniforms are kept strictly inside (0, 1) so inverse CDFs stay finite
+_UNIFORM_EPS = 2.0**-53
+
+
+class RandomStreams:
+    """Independent random streams for the simulations of one ticker.
+
+    Without a seed, fresh OS entropy is drawn once, so the simulations are
+    still independent across processes but not reproducible.
+    """
+
+    def __init__(self, seed, ticker):
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        self.seed = seed
+        self.ticker = ticker
+        self._ticker_key = ticker_key(ticker)
+
+    def __repr__(self):
+        return f"RandomStreams(seed={self.seed!r}, ticker={self.ticker!r})"
+
+    def block(self, block_id):
+        """Generator of one block of RNG_BLOCK_SIZE simulations."""
+        seed_sequence = np.random.SeedSequence(
+            self.seed, spawn_key=(self._ticker_key, block_id)
+        )
+        return np.random.Generator(np.random.PCG64(seed_sequence))
+
+    def draw(self, draw, start, stop):
+        """Stack draw(rng, rows) over the blocks of simulations start..stop.
+
+        draw must fill its rows in order from rng, so that the first rows of
+        a block are the same however many rows are requested.
+        """
+        if stop <= start:
+            return draw(self.block(0), 0)
+
+        rows = []
+        for block_id in range(start // RNG_BLOCK_SIZE, _ceil_div(stop, RNG_BLOCK_SIZE)):
+            block_start = block_id * RNG_BLOCK_SIZE
+            block_stop = min(stop, block_start + RNG_BLOCK_SIZE)
+            block_rows = draw(self.block(block_id), block_stop - block_start)
+            rows.append(block_rows[max(start - block_start, 0) :])
+
+        return np.concatenate(rows)
+
+
+def uniforms(rng, shocks, rows, num_of_days):
+    """A (rows, num_of_days) matrix of uniforms from one block's generator.
+
+    Rows are filled in order, like RandomStreams.draw requires.
+    """
+    if shocks == "pseudo":
+        u = rng.random((rows, num_of_days))
+    elif shocks == "antithetic":
+        half = rng.random((_ceil_div(rows, 2), num_of_days))
+        u = np.empty((2 * len(half), num_of_days))
+        u[0::2] = half
+        u[1::2] = 1 - half
+        u = u[:rows]
+    elif shocks == "sobol":
+        try:
+            from scipy.stats import qmc
+        except ImportError as e:
+            raise ImportError(
+                "Sobol shocks require scipy, install it with `pip install scipy`"
+            ) from e
+
+        # draw a power of two of points, the prefix of a balanced sample
+        sobol = qmc.Sobol(d=num_of_days, scramble=True, seed=rng)
+        u = sobol.random_base2(max(rows - 1, 0).bit_length())[:rows]
+    else:
+        raise ValueError(
+            f"unknown shock source: {shocks}, expected one of {SHOCK_SOURCES}"
+        )
+
+    return np.clip(u, _UNIFORM_EPS, 1 - _UNIFORM_EPS)
+
+
+def antithetic_normals(rng, rows, num_of_days):
+    """A (rows, num_of_days) matrix of standard normal pairs (z, -z).
+
+    The normal counterpart of antithetic uniforms, for the models that are
+    driven by normals and so need no inversion.
+    """
+    half = rng.standard_normal((_ceil_div(rows, 2), num_of_days))
+    z = np.empty((2 * len(half), num_of_days))
+    z[0::2] = half
+    z[1::2] = -half
+
+    return z[:rows]
+
+
+def ticker_key(ticker):
+    # hash() of strings is salted per process, so use a stable digest
+    digest = hashlib.sha256(str(ticker).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "little")
+
+
+def _ceil_div(a, b):
+    return -(-a // b)
@@ -1,32 +1,547 @@
 from multiprocessing import Pool, cpu_count
 
+import click
 import pandas as pd
 
-from stock_price_simulator.simulate import simulate
-from stock_price_simulator.ticker import download_ticker_prices
+from stock_price_simulator.aggregate import PathAggregate
+from stock_price_simulator.formats import write_frame
+from stock_price_simulator.instrument import (
+    call_pickled,
+    span,
+    tracing_enabled,
+    unpickle,
+)
+from stock_price_simulator.memo import (
+    CACHE_DIR_ENV,
+    CACHE_MAX_BYTES_ENV,
+    DEFAULT_MAX_BYTES,
+    SimulationCache,
+    simulation_key,
+)
+from stock_price_simulator.models import DEFAULT_MODEL, RETURN_MODELS
+from stock_price_simulator.multi_asset import simulate_correlated
+from stock_price_simulator.pipeline import run_pipelined
+from stock_price_simulator.rng import SHOCK_SOURCES
+from stock_price_simulator.scheduler import simulate_in_chunks
+from stock_price_simulator.shared_prices import pack_prices, simulate_shared
+from stock_price_simulator.simulate import (
+    DEFAULT_CHUNK_SIZE,
+    cache_params,
+    next_year_trading_dates,
+    simulate,
+)
+from stock_price_simulator.sink import DATASET_FORMATS, DatasetSink
+from stock_price_simulator.store import STORE_FORMAT, ResultStore
+from stock_price_simulator.ticker import download_ticker_prices, read_universe
+from stock_price_simulator.variance import simulate_adaptive
 
 
-def run():
-    ticker_price_df = download_ticker_prices()
+def run(
+    use_shared_memory=False,
+    output_dir=None,
+    output_format="parquet",
+    as_result=False,
+    seed=None,
+    num_of_simulation=5,
+    chunk_size=None,
+    processes=None,
+    ticker_symbols=None,
+    source=None,
+    multi_asset=False,
+    aggregate=False,
+    model=DEFAULT_MODEL,
+    model_options=None,
+    shocks="pseudo",
+    tolerance=None,
+    cache=None,
+):
+    """Simulate every ticker in a process pool.
 
-    number_of_processes = max(1, cpu_count() - 1)
-    pool = Pool(processes=number_of_processes)
+    Returns the concatenated simulation frame, or a dict of ticker to
+    SimulationResult when as_result is set. When output_dir is given, each
+    ticker's simulation is streamed in chunks to a partitioned dataset in
+    that directory and the number of rows written is returned instead. With
+    the "memmap" output_format, that directory is a store.ResultStore.
 
-    async_results = []
-    for (ticker, price_df) in ticker_price_df.items():
-        p_result = pool.apply_async(simulate, args=(ticker, price_df))
-        async_results.append(p_result)
+    By default every ticker is one Pool task. With a chunk_size, each
+    ticker's simulations are split into chunks that are load balanced
+    across the pool. With a seed, the simulation is reproducible whatever
+    the number of processes or the chunk size.
 
-    pool.close()
-    pool.join()
+    With multi_asset, all tickers are simulated in this process in one
+    batch, with daily returns correlated like their price histories.
 
-    result_dfs = [result.get() for result in async_results]
-    simulated_price_df = pd.concat(result_dfs, ignore_index=True)
+    With aggregate, a dict of ticker to PathAggregate is returned instead:
+    per date statistics reduced while the paths are simulated, without
+    ever holding all paths in memory.
+
+    model names the return model of every ticker, see models.RETURN_MODELS,
+    fitted with model_options, and shocks the source of its random numbers,
+    see rng.SHOCK_SOURCES.
+
+    With a tolerance, num_of_simulation is not fixed: each ticker is
+    simulated until the confidence intervals of its mean path and value at
+    risk are narrower than tolerance times its last price, with antithetic
+    shocks unless other than pseudo shocks are given, and a dict of ticker
+    to variance.AdaptiveResult is returned.
+
+    With a memo.SimulationCache and a seed, tickers whose results are
+    cached for the same prices and parameters are not simulated again.
+    """
+    if (aggregate or tolerance is not None) and output_dir is not None:
+        raise ValueError("aggregate and tolerance cannot be combined with output_dir")
+    if multi_asset and (
+        model != DEFAULT_MODEL or shocks != "pseudo" or tolerance is not None
+    ):
+        raise ValueError(
+            "multi_asset only supports the normal return model and pseudo shocks"
+        )
+
+    with span("download") as attributes:
+        ticker_price_df = download_ticker_prices(ticker_symbols, source=source)
+        attributes["tickers"] = len(ticker_price_df)
+
+    # All tickers share the same horizon, so the trading dates are computed
+    # once here instead of in every worker
+    with span("calendar"):
+        last_date = max(price_df["Date"].max() for price_df in ticker_price_df.values())
+        trading_dates = next_year_trading_dates(last_date)
+
+    sink = None
+    if output_dir is not None and output_format == STORE_FORMAT:
+        sink = ResultStore.create(
+            output_dir, list(ticker_price_df), trading_dates, num_of_simulation
+        )
+    elif output_dir is not None:
+        sink = DatasetSink(output_dir, output_format)
+        sink.clear(ticker_price_df)
+
+    # seeded results of unchanged histories and parameters are reused
+    keys = {}
+    cached_results = {}
+    if (
+        cache is not None
+        and seed is not None
+        and sink is None
+        and not multi_asset
+        and tolerance is None
+    ):
+        with span("cache_lookup") as attributes:
+            params = cache_params(
+                aggregate=aggregate,
+                chunk_size=chunk_size or DEFAULT_CHUNK_SIZE,
+                model=model,
+                model_options=model_options,
+                shocks=shocks,
+                merged_chunks=chunk_size is not None,
+            )
+            for (ticker, price_df) in ticker_price_df.items():
+                keys[ticker] = simulation_key(
+                    ticker,
+                    price_df["Adj Close"].to_numpy(),
+                    trading_dates,
+                    num_of_simulation,
+                    seed,
+                    **params,
+                )
+                result = cache.get(keys[ticker])
+                if result is not None:
+                    cached_results[ticker] = result
+            attributes["hits"] = len(cached_results)
+        ticker_price_df = {
+            ticker: price_df
+            for (ticker, price_df) in ticker_price_df.items()
+            if ticker not in cached_results
+        }
+
+    if processes is None:
+        processes = max(1, cpu_count() - 1)
+
+    with span("simulate_all", processes=processes, chunk_size=chunk_size):
+        if not ticker_price_df:
+            results = []
+        elif multi_asset:
+            ticker_results = simulate_correlated(
+                ticker_price_df, trading_dates, num_of_simulation, seed=seed
+            )
+            results = list(ticker_results.values())
+            if aggregate:
+                results = [
+                    PathAggregate.from_result(result, price_df["Adj Close"].iat[-1])
+                    for (result, price_df) in zip(results, ticker_price_df.values())
+                ]
+            elif sink is not None:
+                results = [_write_result(sink, result) for result in results]
+        elif tolerance is not None:
+            results = _simulate_adaptive_per_ticker(
+                ticker_price_df,
+                trading_dates,
+                processes,
+                tolerance,
+                seed=seed,
+                model=model,
+                model_options=model_options,
+                shocks="antithetic" if shocks == "pseudo" else shocks,
+            )
+        elif chunk_size is not None:
+            ticker_results = simulate_in_chunks(
+                ticker_price_df,
+                trading_dates,
+                num_of_simulation,
+                chunk_size=chunk_size,
+                processes=processes,
+                seed=seed,
+                sink=sink,
+                aggregate=aggregate,
+                model=model,
+                model_options=model_options,
+                shocks=shocks,
+            )
+            results = list(ticker_results.values())
+        else:
+            results = _simulate_per_ticker(
+                ticker_price_df,
+                trading_dates,
+                num_of_simulation,
+                processes,
+                use_shared_memory,
+                sink,
+                seed,
+                # cached as results, converted to frames below
+                as_result=as_result or bool(keys),
+                aggregate=aggregate,
+                model=model,
+                model_options=model_options,
+                shocks=shocks,
+            )
+
+    if keys:
+        for result in results:
+            cache.put(keys[result.ticker], result)
+        results_by_ticker = {result.ticker: result for result in results}
+        results_by_ticker.update(cached_results)
+        results = [results_by_ticker[ticker] for ticker in keys]
+
+    if sink is not None:
+        return sum(results)
+
+    if as_result or aggregate or tolerance is not None:
+        return {result.ticker: result for result in results}
+
+    with span("concat") as attributes:
+        result_dfs = [
+            result if isinstance(result, pd.DataFrame) else result.to_long_frame()
+            for result in results
+        ]
+        simulated_price_df = pd.concat(result_dfs, ignore_index=True)
+        attributes["rows"] = len(simulated_price_df)
 
     return simulated_price_df
 
 
-if __name__ == "__main__":
-    simulated_price_df = run()
+def _write_result(sink, result):
+    simulated_price_df = result.to_long_frame()
+    sink.write(simulated_price_df)
+
+    return len(simulated_price_df)
+
+
+def _simulate_per_ticker(
+    ticker_price_df,
+    trading_dates,
+    num_of_simulation,
+    processes,
+    use_shared_memory,
+    sink,
+    seed,
+    as_result=False,
+    aggregate=False,
+    model=DEFAULT_MODEL,
+    model_options=None,
+    shocks="pseudo",
+):
+    shm = None
+    if use_shared_memory:
+        # Workers only need the adjusted closes, so pack them into one shared
+        # memory block and send descriptors instead of frames. The block is
+        # created before the pool so the workers share this process'
+        # resource tracker and do not unlink it when they exit.
+        shm, descriptors = pack_prices(ticker_price_df)
+
+    kwds = {
+        "sink": sink,
+        "as_result": as_result,
+        "seed": seed,
+        "aggregate": aggregate,
+        "model": model,
+        "model_options": model_options,
+        "shocks": shocks,
+    }
+    # when tracing, the workers pickle their results themselves so the cost
+    # of sending them back is recorded
+    traced = tracing_enabled()
 
-    print(simulated_price_df)
+    try:
+        pool = Pool(processes=processes)
+
+        def submit(func, args):
+            if traced:
+                return pool.apply_async(call_pickled, args=(func, *args), kwds=kwds)
+            return pool.apply_async(func, args=args, kwds=kwds)
+
+        async_results = []
+        if use_shared_memory:
+            for descriptor in descriptors:
+                p_result = submit(
+                    simulate_shared,
+                    (shm.name, descriptor, trading_dates, num_of_simulation),
+                )
+                async_results.append(p_result)
+        else:
+            for (ticker, price_df) in ticker_price_df.items():
+                p_result = submit(
+                    simulate, (ticker, price_df, trading_dates, num_of_simulation)
+                )
+                async_results.append(p_result)
+
+        pool.close()
+        pool.join()
+    finally:
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+    if traced:
+        return [unpickle(result.get()) for result in async_results]
+
+    return [result.get() for result in async_results]
+
+
+def _simulate_adaptive_per_ticker(
+    ticker_price_df, trading_dates, processes, tolerance, **kwds
+):
+    with Pool(processes=processes) as pool:
+        async_results = [
+            pool.apply_async(
+                simulate_adaptive,
+                args=(ticker, price_df["Adj Close"].to_numpy(), trading_dates),
+                kwds={"tolerance": tolerance, **kwds},
+            )
+            for (ticker, price_df) in ticker_price_df.items()
+        ]
+
+        return [result.get() for result in async_results]
+
+
+@click.command()
+@click.option(
+    "--universe",
+    type=click.Path(exists=True, dir_okay=False),
+    help="File of the tickers to simulate, one per line or a .csv with a ticker "
+    "column, defaults to the built-in tickers.",
+)
+@click.option(
+    "--output-dir",
+    help="Stream the simulation to a dataset in this directory instead of printing it.",
+)
+@click.option(
+    "--output-file",
+    type=click.Path(dir_okay=False),
+    help="Write the simulation to this .csv, .parquet or .arrow file instead of "
+    "printing it.",
+)
+@click.option(
+    "--float32",
+    is_flag=True,
+    help="Store the prices as float32 in a .parquet or .arrow output file.",
+)
+@click.option(
+    "--output-format",
+    type=click.Choice([*DATASET_FORMATS, STORE_FORMAT]),
+    default="parquet",
+    show_default=True,
+)
+@click.option(
+    "--shared-memory",
+    is_flag=True,
+    help="Send price histories to the workers through shared memory.",
+)
+@click.option(
+    "--seed",
+    type=int,
+    help="Seed for reproducible simulations.",
+)
+@click.option(
+    "--num-of-simulation",
+    type=int,
+    default=5,
+    show_default=True,
+)
+@click.option(
+    "--chunk-size",
+    type=int,
+    help="Split each ticker's simulations into chunks of this size "
+    "and balance them across the processes.",
+)
+@click.option(
+    "--processes",
+    type=int,
+    help="Number of worker processes, defaults to the number of CPUs minus one.",
+)
+@click.option(
+    "--pipelined",
+    is_flag=True,
+    help="Simulate each ticker as soon as its price history is downloaded.",
+)
+@click.option(
+    "--multi-asset",
+    is_flag=True,
+    help="Simulate all tickers together with correlated returns.",
+)
+@click.option(
+    "--model",
+    type=click.Choice(list(RETURN_MODELS)),
+    default=DEFAULT_MODEL,
+    show_default=True,
+    help="Model of the daily returns, fitted to each ticker's history.",
+)
+@click.option(
+    "--shocks",
+    type=click.Choice(list(SHOCK_SOURCES)),
+    default="pseudo",
+    show_default=True,
+    help="Random numbers behind the returns: independent, antithetic pairs "
+    "or a scrambled Sobol sequence.",
+)
+@click.option(
+    "--tolerance",
+    type=float,
+    help="Simulate each ticker until the 95% confidence intervals of its mean "
+    "path and value at risk are within this fraction of its last price, "
+    "instead of --num-of-simulation times.",
+)
+@click.option(
+    "--cache-dir",
+    envvar=CACHE_DIR_ENV,
+    help="Reuse the results of seeded simulations cached in this directory, "
+    f"also set by {CACHE_DIR_ENV}.",
+)
+@click.option(
+    "--cache-max-bytes",
+    type=int,
+    envvar=CACHE_MAX_BYTES_ENV,
+    default=DEFAULT_MAX_BYTES,
+    show_default=True,
+    help="Evict the least recently used results beyond this size.",
+)
+@click.option(
+    "--aggregate",
+    is_flag=True,
+    help="Print per date statistics of each ticker instead of every path.",
+)
+def cli(
+    universe,
+    output_dir,
+    output_file,
+    float32,
+    output_format,
+    shared_memory,
+    seed,
+    num_of_simulation,
+    chunk_size,
+    processes,
+    pipelined,
+    multi_asset,
+    aggregate,
+    model,
+    shocks,
+    tolerance,
+    cache_dir,
+    cache_max_bytes,
+):
+    if output_dir is not None and output_file is not None:
+        raise click.UsageError("--output-dir and --output-file cannot be combined")
+    if output_file is not None and (aggregate or tolerance is not None):
+        # only the statistics are kept, there are no paths to write
+        raise click.UsageError(
+            "--output-file cannot be combined with --aggregate or --tolerance"
+        )
+
+    ticker_symbols = read_universe(universe) if universe else None
+
+    cache = None
+    if cache_dir:
+        cache = SimulationCache(cache_dir, max_bytes=cache_max_bytes)
+
+    if pipelined:
+        # run_pipelined simulates every path of a ticker as one task, as soon
+        # as its history is downloaded, and returns the same frames as run
+        for (option, value) in [
+            ("--aggregate", aggregate),
+            ("--tolerance", tolerance is not None),
+            ("--multi-asset", multi_asset),
+            ("--chunk-size", chunk_size is not None),
+            ("--shared-memory", shared_memory),
+            ("--cache-dir", cache is not None),
+        ]:
+            if value:
+                raise click.UsageError(f"--pipelined cannot be combined with {option}")
+        if output_dir is not None and output_format == STORE_FORMAT:
+            raise click.UsageError(
+                f"--pipelined cannot write to a {STORE_FORMAT} store, "
+                "whose tickers are allocated before the simulation"
+            )
+        sink = None
+        if output_dir is not None:
+            sink = DatasetSink(output_dir, output_format)
+        result = run_pipelined(
+            ticker_symbols=ticker_symbols,
+            num_of_simulation=num_of_simulation,
+            processes=processes,
+            seed=seed,
+            sink=sink,
+            model=model,
+            shocks=shocks,
+        )
+    else:
+        result = run(
+            use_shared_memory=shared_memory,
+            output_dir=output_dir,
+            output_format=output_format,
+            seed=seed,
+            num_of_simulation=num_of_simulation,
+            chunk_size=chunk_size,
+            processes=processes,
+            ticker_symbols=ticker_symbols,
+            multi_asset=multi_asset,
+            aggregate=aggregate,
+            model=model,
+            shocks=shocks,
+            tolerance=tolerance,
+            cache=cache,
+        )
+        if cache is not None:
+            print(f"Simulation cache: {cache.report()}")
+
+    if tolerance is not None:
+        for (ticker, adaptive_result) in result.items():
+            print(
+                f"{ticker}: {adaptive_result.num_of_simulation} simulations, "
+                f"95% VaR {adaptive_result.value_at_risk():.2f}"
+            )
+            print(adaptive_result.summary())
+    elif aggregate:
+        for (ticker, path_aggregate) in result.items():
+            print(f"{ticker}: 95% VaR {path_aggregate.value_at_risk():.2f}")
+            print(path_aggregate.summary())
+    elif output_file is not None:
+        write_frame(result, output_file, float32=float32)
+        print(f"{len(result)} simulated prices saved in: {output_file}")
+    elif output_dir is None:
+        print(result)
+    else:
+        print(f"{result} simulated prices saved in: {output_dir}")
+
+
+if __name__ == "__main__":
+    cli()
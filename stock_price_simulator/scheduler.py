@@ -0,0 +1,154 @@
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+
+from stock_price_simulator.aggregate import PathAggregate
+from stock_price_simulator.instrument import worker_span
+from stock_price_simulator.models import DEFAULT_MODEL, fit_model
+from stock_price_simulator.result import SimulationResult
+from stock_price_simulator.rng import RandomStreams
+from stock_price_simulator.simulate import DEFAULT_CHUNK_SIZE, simulate_paths
+
+# Set in every worker by _init_worker, shared by all chunks of a run
+_worker_state = {}
+
+
+def plan_chunks(num_of_simulation, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Split simulations 0..num_of_simulation into (start, stop) chunks."""
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+
+    return [
+        (start, min(start + chunk_size, num_of_simulation))
+        for start in range(0, num_of_simulation, chunk_size)
+    ]
+
+
+def simulate_in_chunks(
+    ticker_price_df,
+    trading_dates,
+    num_of_simulation=5,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    processes=None,
+    seed=None,
+    sink=None,
+    dtype=None,
+    aggregate=False,
+    model=DEFAULT_MODEL,
+    model_options=None,
+    shocks="pseudo",
+):
+    """Simulate every ticker as (ticker, chunk) work items in a process pool.
+
+    Each ticker's simulations are split into chunks of chunk_size, and the
+    chunks of all tickers are handed out one at a time to whichever worker
+    is free, so a single ticker with many simulations still uses every
+    core. Returns a dict of ticker to SimulationResult with the chunks
+    merged in simulation order, or, when a sink is given, the number of
+    rows written for each ticker. With aggregate, each worker reduces its
+    chunks to PathAggregates, which are merged into one per ticker in
+    simulation order.
+    """
+    if seed is None:
+        # one entropy for the whole run keeps the chunks of a ticker on
+        # distinct streams
+        seed = np.random.SeedSequence().entropy
+
+    # Workers only need the last price and the fitted return model of each
+    # ticker
+    ticker_params = {
+        ticker: (
+            price_df["Adj Close"].iat[-1],
+            fit_model(model, price_df["Adj Close"], **(model_options or {})),
+        )
+        for (ticker, price_df) in ticker_price_df.items()
+    }
+    work_items = [
+        (ticker, *ticker_params[ticker], start, stop)
+        for (start, stop) in plan_chunks(num_of_simulation, chunk_size)
+        for ticker in ticker_params
+    ]
+
+    if processes is None:
+        processes = max(1, cpu_count() - 1)
+
+    chunks = {ticker: [] for ticker in ticker_params}
+    with Pool(
+        processes=processes,
+        initializer=_init_worker,
+        initargs=(trading_dates, seed, sink, dtype, aggregate, shocks),
+    ) as pool:
+        # chunksize=1 hands out work items one at a time for load balancing
+        for (start, ticker, chunk) in pool.imap_unordered(
+            _simulate_chunk, work_items, chunksize=1
+        ):
+            chunks[ticker].append((start, chunk))
+    # merged in simulation order whatever order the chunks completed in, so
+    # the floating point sums of the aggregates are reproducible
+    chunks = {
+        ticker: [chunk for (_, chunk) in sorted(ticker_chunks, key=lambda c: c[0])]
+        for (ticker, ticker_chunks) in chunks.items()
+    }
+
+    if sink is not None:
+        return {ticker: sum(num_of_rows) for (ticker, num_of_rows) in chunks.items()}
+
+    if aggregate:
+        return {
+            ticker: PathAggregate.concat(ticker_chunks)
+            for (ticker, ticker_chunks) in chunks.items()
+        }
+
+    return {
+        ticker: SimulationResult.concat(ticker_chunks)
+        for (ticker, ticker_chunks) in chunks.items()
+    }
+
+
+def _init_worker(trading_dates, seed, sink, dtype, aggregate=False, shocks="pseudo"):
+    _worker_state.update(
+        trading_dates=trading_dates,
+        seed=seed,
+        sink=sink,
+        dtype=dtype,
+        aggregate=aggregate,
+        shocks=shocks,
+    )
+
+
+def _simulate_chunk(work_item):
+    ticker, last_price, model, start, stop = work_item
+    with worker_span("simulate_chunk", ticker=ticker, start=start, stop=stop):
+        return (start, *_run_chunk(ticker, last_price, model, start, stop))
+
+
+def _run_chunk(ticker, last_price, model, start, stop):
+    trading_dates = _worker_state["trading_dates"]
+
+    paths = simulate_paths(
+        last_price,
+        None,
+        stop - start,
+        len(trading_dates),
+        streams=RandomStreams(_worker_state["seed"], ticker),
+        first_simulation_id=start,
+        model=model,
+        shocks=_worker_state["shocks"],
+    )
+    result = SimulationResult(
+        ticker,
+        paths.astype(_worker_state["dtype"], copy=False),
+        trading_dates,
+        start,
+    )
+
+    if _worker_state["aggregate"]:
+        return ticker, PathAggregate.from_result(result, reference_price=last_price)
+
+    sink = _worker_state["sink"]
+    if sink is not None:
+        chunk_df = result.to_long_frame()
+        sink.write(chunk_df)
+        return ticker, len(chunk_df)
+
+    return ticker, result
@@ -0,0 +1,447 @@
+"""Asyncio service answering on-demand simulations, e.g. for dashboards.
+
+Requests name a ticker, a horizon in trading days, a number of paths and
+optionally a seed, and get the per date summary and value at risk of the
+simulated prices. The CPU work runs in a process pool; the event loop only
+schedules it:
+
+- identical requests in flight share one computation,
+- concurrent requests for the same ticker, horizon, model and seed are
+  simulated together in one vectorized run, after waiting batch_window
+  seconds for more of them: with a seed, each request takes the first
+  paths of the run, as simulate would return them, without one, each
+  takes its own range of the run's paths,
+- at most max_pending computations wait or run at any time; requests
+  beyond that are shed right away with ServiceOverloaded instead of
+  queueing without bound.
+
+start_server() exposes the service as newline-delimited JSON over TCP, with the
+responses of worker.py. Run it, or load test it on synthetic prices, with
+
+    poetry run python -m stock_price_simulator.service --synthetic
+    poetry run python -m stock_price_simulator.service --load-test 2000
+"""
+import asyncio
+import json
+import random
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import cpu_count, get_context
+
+import click
+import numpy as np
+
+from stock_price_simulator.models import DEFAULT_MODEL
+from stock_price_simulator.result import SimulationResult
+from stock_price_simulator.simulate import next_year_trading_dates, simulate_prices
+from stock_price_simulator.sources import SyntheticSource, default_source
+from stock_price_simulator.worker import DEFAULT_MAX_IN_FLIGHT, json_default, preload
+
+REQUEST_FIELDS = (
+    "ticker",
+    "num_of_days",
+    "num_of_simulation",
+    "seed",
+    "model",
+    "level",
+)
+
+
+class ServiceOverloaded(Exception):
+    """Raised when a request is shed because too much work is pending."""
+
+
+class SimulationService:
+    """Simulate requests in a process pool, coalesced and batched.
+
+    Use it as an async context manager, which starts and stops the pool.
+    Price histories are fetched from source once per ticker, in a thread,
+    and kept for the lifetime of the service.
+    """
+
+    def __init__(
+        self,
+        source=None,
+        processes=None,
+        max_pending=64,
+        batch_window=0.005,
+        max_batch_simulations=100_000,
+        max_num_of_simulation=100_000,
+        start="2020-01-01",
+        end="2021-12-31",
+    ):
+        if source is None:
+            source = default_source()
+        if processes is None:
+            processes = max(1, cpu_count() - 1)
+        self.source = source
+        self.processes = processes
+        self.max_pending = max_pending
+        self.batch_window = batch_window
+        self.max_batch_simulations = max_batch_simulations
+        self.max_num_of_simulation = max_num_of_simulation
+        self.start = start
+        self.end = end
+        self.stats = {
+            "requests": 0,
+            "coalesced": 0,
+            "shed": 0,
+            "batches": 0,
+            "simulations": 0,
+        }
+        self._executor = None
+        self._in_flight = {}
+        self._histories = {}
+        self._batches = {}
+
+    async def __aenter__(self):
+        # spawned rather than forked, so the workers do not inherit the
+        # sockets of the connections accepted meanwhile and keep them open
+        self._executor = ProcessPoolExecutor(
+            self.processes, mp_context=get_context("spawn"), initializer=preload
+        )
+        await asyncio.get_running_loop().run_in_executor(self._executor, preload)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._executor.shutdown(wait=True)
+        self._executor = None
+
+    @property
+    def pending(self):
+        return len(self._in_flight)
+
+    async def simulate(
+        self,
+        ticker,
+        num_of_days=None,
+        num_of_simulation=1000,
+        seed=None,
+        model=DEFAULT_MODEL,
+        level=0.95,
+    ):
+        """Summary and value at risk of num_of_simulation paths of ticker.
+
+        num_of_days limits the horizon to the first trading days of the
+        year after the price history, all of them by default.
+        """
+        if not 0 < num_of_simulation <= self.max_num_of_simulation:
+            raise ValueError(
+                f"num_of_simulation must be between 1 and "
+                f"{self.max_num_of_simulation}, got {num_of_simulation}"
+            )
+        if num_of_days is not None and num_of_days < 1:
+            raise ValueError(f"num_of_days must be positive, got {num_of_days}")
+        self.stats["requests"] += 1
+
+        key = (ticker, num_of_days, num_of_simulation, seed, model, level)
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        elif len(self._in_flight) >= self.max_pending:
+            self.stats["shed"] += 1
+            raise ServiceOverloaded(
+                f"{len(self._in_flight)} simulations pending, try again later"
+            )
+        else:
+            task = asyncio.ensure_future(self._compute(*key))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+
+        # a cancelled request does not cancel the computation it shares
+        return await asyncio.shield(task)
+
+    async def _compute(
+        self, ticker, num_of_days, num_of_simulation, seed, model, level
+    ):
+        adj_close, trading_dates = await self._history(ticker)
+        if num_of_days is not None:
+            trading_dates = trading_dates[:num_of_days]
+
+        loop = asyncio.get_running_loop()
+        batch_key = (ticker, len(trading_dates), seed, model)
+        batch = self._batches.get(batch_key)
+        if batch is None:
+            batch = {
+                "adj_close": adj_close,
+                "trading_dates": trading_dates,
+                "requests": [],
+                "num_of_simulation": 0,
+            }
+            self._batches[batch_key] = batch
+            loop.call_later(self.batch_window, self._flush, batch_key, batch)
+
+        future = loop.create_future()
+        batch["requests"].append((num_of_simulation, level, future))
+        batch["num_of_simulation"] += num_of_simulation
+        if batch["num_of_simulation"] >= self.max_batch_simulations:
+            self._flush(batch_key, batch)
+
+        return await future
+
+    def _flush(self, batch_key, batch):
+        if self._batches.get(batch_key) is not batch:
+            return  # already flushed when it was full
+        del self._batches[batch_key]
+        ticker, _, seed, model = batch_key
+
+        slices = []
+        num_of_simulation = 0
+        for (request_simulations, level, _) in batch["requests"]:
+            if seed is None:
+                # unseeded requests take disjoint ranges of the paths
+                start = num_of_simulation
+                num_of_simulation += request_simulations
+            else:
+                # seeded requests take the first paths, like simulate
+                start = 0
+                num_of_simulation = max(num_of_simulation, request_simulations)
+            slices.append((start, start + request_simulations, level))
+
+        self.stats["batches"] += 1
+        self.stats["simulations"] += num_of_simulation
+        computation = asyncio.get_running_loop().run_in_executor(
+            self._executor,
+            _simulate_batch,
+            ticker,
+            batch["adj_close"],
+            batch["trading_dates"],
+            num_of_simulation,
+            seed,
+            model,
+            slices,
+        )
+
+        def resolve(computation):
+            futures = [future for (_, _, future) in batch["requests"]]
+            if computation.exception() is not None:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(computation.exception())
+                return
+            for (future, response) in zip(futures, computation.result()):
+                if not future.done():
+                    future.set_result(response)
+
+        computation.add_done_callback(resolve)
+
+    async def _history(self, ticker):
+        task = self._histories.get(ticker)
+        if task is None:
+            task = asyncio.get_running_loop().run_in_executor(None, self._fetch, ticker)
+            self._histories[ticker] = task
+        try:
+            return await asyncio.shield(task)
+        except Exception:
+            # fetch again on the next request
+            if self._histories.get(ticker) is task:
+                del self._histories[ticker]
+            raise
+
+    def _fetch(self, ticker):
+        price_df = self.source.fetch(ticker, self.start, self.end)
+        if price_df.empty:
+            raise ValueError(f"no price history for {ticker}")
+
+        return (
+            price_df["Adj Close"].to_numpy(),
+            next_year_trading_dates(price_df["Date"].max()),
+        )
+
+
+def _simulate_batch(
+    ticker, adj_close, trading_dates, num_of_simulation, seed, model, slices
+):
+    result = simulate_prices(
+        ticker,
+        adj_close,
+        trading_dates,
+        num_of_simulation,
+        as_result=True,
+        seed=seed,
+        model=model,
+    )
+
+    responses = []
+    for (start, stop, level) in slices:
+        part = SimulationResult(ticker, result.prices[start:stop], result.dates, start)
+        terminal_quantile = np.quantile(part.terminal_prices, 1 - level)
+        responses.append(
+            {
+                "ticker": ticker,
+                "num_of_simulation": part.num_of_simulation,
+                "value_at_risk": adj_close[-1] - terminal_quantile,
+                "summary": part.summary().reset_index().to_dict(orient="list"),
+            }
+        )
+
+    return responses
+
+
+async def start_server(
+    service, host="127.0.0.1", port=8765, max_in_flight=DEFAULT_MAX_IN_FLIGHT
+):
+    """Serve the service as newline-delimited JSON, see worker.py.
+
+    Each line is a request with the fields of REQUEST_FIELDS and an id;
+    responses are written as they complete, so in any order. At most
+    max_in_flight requests of a connection are answered at once, reading
+    more of them waits for one to complete.
+    """
+
+    async def handle(reader, writer):
+        lock = asyncio.Lock()
+        in_flight = asyncio.Semaphore(max_in_flight)
+        # the event loop only keeps weak references to the tasks
+        responses = set()
+
+        async def write(response):
+            line = json.dumps(response, default=json_default) + "\n"
+            async with lock:
+                writer.write(line.encode("utf-8"))
+                await writer.drain()
+
+        async def respond(job):
+            response = {"id": job.get("id")}
+            try:
+                params = {name: job[name] for name in REQUEST_FIELDS if name in job}
+                response.update(ok=True, result=await service.simulate(**params))
+            except ServiceOverloaded as e:
+                response.update(ok=False, overloaded=True, error=str(e))
+            except Exception as e:
+                response.update(ok=False, error=f"{type(e).__name__}: {e}")
+            try:
+                await write(response)
+            finally:
+                in_flight.release()
+
+        async for line in reader:
+            if not line.strip():
+                continue
+            try:
+                job = json.loads(line)
+            except ValueError as e:
+                await write({"id": None, "ok": False, "error": f"invalid job: {e}"})
+                continue
+            await in_flight.acquire()
+            task = asyncio.ensure_future(respond(job))
+            responses.add(task)
+            task.add_done_callback(responses.discard)
+
+        await asyncio.gather(*responses)
+        writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+async def load_test(
+    service,
+    num_of_requests=1000,
+    concurrency=100,
+    num_of_tickers=10,
+    num_of_simulation=1000,
+    num_of_seeds=3,
+    num_of_days=21,
+    seed=0,
+):
+    """Send random concurrent requests to a service and measure latencies.
+
+    Requests pick one of num_of_tickers synthetic tickers and one of
+    num_of_seeds seeds or no seed, so some are identical and many share a
+    ticker. Returns the throughput, latency percentiles and the number of
+    shed requests next to the service's own counters.
+    """
+    rng = random.Random(seed)
+    seeds = [None, *range(num_of_seeds)]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    outcomes = {"completed": 0, "shed": 0, "failed": 0}
+
+    async def request():
+        ticker = f"SYN{rng.randrange(num_of_tickers):04d}"
+        request_seed = rng.choice(seeds)
+        async with semaphore:
+            start_time = time.perf_counter()
+            try:
+                await service.simulate(
+                    ticker,
+                    num_of_days=num_of_days,
+                    num_of_simulation=num_of_simulation,
+                    seed=request_seed,
+                )
+                outcomes["completed"] += 1
+            except ServiceOverloaded:
+                outcomes["shed"] += 1
+            except Exception:
+                outcomes["failed"] += 1
+            latencies.append(time.perf_counter() - start_time)
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*[request() for _ in range(num_of_requests)])
+    seconds = time.perf_counter() - start_time
+
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else []
+    return {
+        **outcomes,
+        "seconds": seconds,
+        "requests_per_second": num_of_requests / seconds,
+        "latency_p50": quantiles[49] if quantiles else None,
+        "latency_p95": quantiles[94] if quantiles else None,
+        "latency_max": max(latencies, default=None),
+        "service": dict(service.stats),
+    }
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", type=int, default=8765, show_default=True)
+@click.option(
+    "--processes",
+    type=int,
+    help="Number of worker processes, defaults to the number of CPUs minus one.",
+)
+@click.option(
+    "--max-pending",
+    type=int,
+    default=64,
+    show_default=True,
+    help="Shed requests beyond this many pending simulations.",
+)
+@click.option(
+    "--synthetic",
+    is_flag=True,
+    help="Serve random walk price histories instead of downloading them.",
+)
+@click.option(
+    "--load-test",
+    "num_of_requests",
+    type=int,
+    help="Instead of serving, send this many requests to a synthetic service "
+    "and print the measurements.",
+)
+@click.option("--concurrency", type=int, default=100, show_default=True)
+def cli(host, port, processes, max_pending, synthetic, num_of_requests, concurrency):
+    source = SyntheticSource() if synthetic or num_of_requests else None
+
+    async def main():
+        async with SimulationService(
+            source, processes=processes, max_pending=max_pending
+        ) as service:
+            if num_of_requests:
+                report = await load_test(
+                    service, num_of_requests, concurrency=concurrency
+                )
+                print(json.dumps(report, indent=2))
+                return
+
+            server = await start_server(service, host, port)
+            print(f"Serving simulations on {host}:{port}")
+            async with server:
+                await server.serve_forever()
+
+    asyncio.run(main())
+
+
+if __name__ == "__main__":
+    cli()
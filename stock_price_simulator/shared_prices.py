@@ -0,0 +1,81 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from stock_price_simulator.models import DEFAULT_MODEL
+from stock_price_simulator.simulate import simulate_prices
+
+PRICE_DTYPE = np.float64
+
+# Blocks attached by this process, kept open for the lifetime of the worker
+# so the zero-copy views stay valid
+_attached_blocks = {}
+
+
+def pack_prices(ticker_price_df, column="Adj Close"):
+    """Pack every ticker's prices into one shared memory block.
+
+    Returns the block and a list of (ticker, offset, length) descriptors
+    pointing into it. The caller owns the block and must close and unlink
+    it once all workers are done.
+    """
+    lengths = [len(price_df) for price_df in ticker_price_df.values()]
+    itemsize = np.dtype(PRICE_DTYPE).itemsize
+    shm = shared_memory.SharedMemory(create=True, size=max(1, sum(lengths)) * itemsize)
+
+    prices = np.ndarray((sum(lengths),), dtype=PRICE_DTYPE, buffer=shm.buf)
+    descriptors = []
+    offset = 0
+    for (ticker, price_df), length in zip(ticker_price_df.items(), lengths):
+        prices[offset : offset + length] = price_df[column].to_numpy(PRICE_DTYPE)
+        descriptors.append((ticker, offset, length))
+        offset += length
+
+    return shm, descriptors
+
+
+def attach_prices(shm_name, offset, length):
+    """Zero-copy view of one ticker's prices in a shared memory block."""
+    shm = _attached_blocks.get(shm_name)
+    if shm is None:
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _attached_blocks[shm_name] = shm
+
+    itemsize = np.dtype(PRICE_DTYPE).itemsize
+    prices = np.ndarray(
+        (length,), dtype=PRICE_DTYPE, buffer=shm.buf, offset=offset * itemsize
+    )
+    prices.flags.writeable = False
+
+    return prices
+
+
+def simulate_shared(
+    shm_name,
+    descriptor,
+    trading_dates,
+    num_of_simulation=5,
+    sink=None,
+    as_result=False,
+    seed=None,
+    aggregate=False,
+    model=DEFAULT_MODEL,
+    model_options=None,
+    shocks="pseudo",
+):
+    ticker, offset, length = descriptor
+    adj_close = attach_prices(shm_name, offset, length)
+
+    return simulate_prices(
+        ticker,
+        adj_close,
+        trading_dates,
+        num_of_simulation,
+        sink=sink,
+        as_result=as_result,
+        seed=seed,
+        aggregate=aggregate,
+        model=model,
+        model_options=model_options,
+        shocks=shocks,
+    )
@@ -2,53 +2,442 @@ from datetime import datetime, timedelta
 
 import numpy as np
 import pandas as pd
-import pandas_market_calendars as mcal
 
+from stock_price_simulator.aggregate import PathAggregate
+from stock_price_simulator.instrument import worker_span
+from stock_price_simulator.memo import simulation_key
+from stock_price_simulator.models import DEFAULT_MODEL, NormalModel, fit_model
+from stock_price_simulator.result import SimulationResult
+from stock_price_simulator.rng import (
+    RNG_BLOCK_SIZE,
+    RandomStreams,
+    antithetic_normals,
+    uniforms,
+)
+from stock_price_simulator.trading_calendar import get_trading_dates
 
-def simulate(ticker, price_df, trading_dates=None, num_of_simulation=5):
+SIMULATION_METHODS = ("vectorized", "loop")
+
+# Number of simulations generated at once when streaming to a sink, a
+# multiple of RNG_BLOCK_SIZE so chunks never share a random stream
+DEFAULT_CHUNK_SIZE = 1024
+
+
+def simulate(
+    ticker,
+    price_df,
+    trading_dates=None,
+    num_of_simulation=5,
+    method="vectorized",
+    sink=None,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    as_result=False,
+    dtype=None,
+    seed=None,
+    aggregate=False,
+    model=DEFAULT_MODEL,
+    model_options=None,
+    shocks="pseudo",
+    cache=None,
+):
+    if trading_dates is None:
+        trading_dates = next_year_trading_dates(price_df["Date"].max())
+
+    return simulate_prices(
+        ticker,
+        price_df["Adj Close"].to_numpy(),
+        trading_dates,
+        num_of_simulation,
+        method=method,
+        sink=sink,
+        chunk_size=chunk_size,
+        as_result=as_result,
+        dtype=dtype,
+        seed=seed,
+        aggregate=aggregate,
+        model=model,
+        model_options=model_options,
+        shocks=shocks,
+        cache=cache,
+    )
+
+
+def simulate_prices(
+    ticker,
+    adj_close,
+    trading_dates,
+    num_of_simulation=5,
+    method="vectorized",
+    sink=None,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    as_result=False,
+    dtype=None,
+    seed=None,
+    aggregate=False,
+    model=DEFAULT_MODEL,
+    model_options=None,
+    shocks="pseudo",
+    cache=None,
+):
+    """Simulate from an array of adjusted close prices instead of a frame.
+
+    Returns the long simulation frame, or a SimulationResult when as_result
+    is set. Paths are reproducible for a given seed, however the simulations
+    are split across chunks or processes. When a sink is given, the
+    simulation is streamed to ``sink.write`` in chunks of at most chunk_size
+    simulations and the number of rows written is returned instead.
+
+    With aggregate, only a PathAggregate of the paths is kept and returned,
+    updated chunk by chunk, so the paths are never materialized at once.
+
+    model is the name of a return model of models.RETURN_MODELS, fitted to
+    adj_close with model_options, or an already fitted model. shocks is the
+    source of its random numbers, one of rng.SHOCK_SOURCES.
+
+    With a memo.SimulationCache, seeded results that are not streamed to a
+    sink are looked up in and stored to the cache.
+    """
+    key = None
+    if cache is not None and seed is not None and sink is None:
+        key = simulation_key(
+            ticker,
+            adj_close,
+            trading_dates,
+            num_of_simulation,
+            seed,
+            **cache_params(
+                method, dtype, aggregate, chunk_size, model, model_options, shocks
+            ),
+        )
+        cached = cache.get(key)
+        if cached is not None:
+            return cached if as_result or aggregate else cached.to_long_frame()
+
+    with worker_span("simulate", ticker=ticker, num_of_simulation=num_of_simulation):
+        if isinstance(model, str):
+            model = fit_model(model, adj_close, **(model_options or {}))
+
+        if aggregate:
+            path_aggregate = PathAggregate(ticker, trading_dates, adj_close[-1])
+            for result in simulate_price_chunks(
+                ticker,
+                adj_close,
+                trading_dates,
+                num_of_simulation,
+                chunk_size,
+                method,
+                as_result=True,
+                seed=seed,
+                model=model,
+                shocks=shocks,
+            ):
+                path_aggregate.update(result.prices)
+            if key is not None:
+                cache.put(key, path_aggregate)
+            return path_aggregate
+
+        if sink is not None:
+            num_of_rows = 0
+            for chunk_df in simulate_price_chunks(
+                ticker,
+                adj_close,
+                trading_dates,
+                num_of_simulation,
+                chunk_size,
+                method,
+                dtype=dtype,
+                seed=seed,
+                model=model,
+                shocks=shocks,
+            ):
+                sink.write(chunk_df)
+                num_of_rows += len(chunk_df)
+            return num_of_rows
+
+        paths = simulate_paths(
+            adj_close[-1],
+            None,
+            num_of_simulation,
+            len(trading_dates),
+            method=method,
+            streams=RandomStreams(seed, ticker),
+            model=model,
+            shocks=shocks,
+        )
+        result = SimulationResult(
+            ticker, paths.astype(dtype, copy=False), trading_dates
+        )
+        if key is not None:
+            cache.put(key, result)
+
+        if as_result:
+            return result
+
+        return result.to_long_frame()
+
+
+def simulate_chunks(
+    ticker,
+    price_df,
+    trading_dates=None,
+    num_of_simulation=5,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    method="vectorized",
+    as_result=False,
+    dtype=None,
+    seed=None,
+    model=DEFAULT_MODEL,
+    model_options=None,
+    shocks="pseudo",
+):
+    """Like simulate, but yields the result in bounded chunks of simulations."""
+    if trading_dates is None:
+        trading_dates = next_year_trading_dates(price_df["Date"].max())
+
+    return simulate_price_chunks(
+        ticker,
+        price_df["Adj Close"].to_numpy(),
+        trading_dates,
+        num_of_simulation,
+        chunk_size,
+        method,
+        as_result=as_result,
+        dtype=dtype,
+        seed=seed,
+        model=model,
+        model_options=model_options,
+        shocks=shocks,
+    )
+
+
+def simulate_price_chunks(
+    ticker,
+    adj_close,
+    trading_dates,
+    num_of_simulation=5,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    method="vectorized",
+    as_result=False,
+    dtype=None,
+    seed=None,
+    model=DEFAULT_MODEL,
+    model_options=None,
+    shocks="pseudo",
+):
+    if isinstance(model, str):
+        model = fit_model(model, adj_close, **(model_options or {}))
+    streams = RandomStreams(seed, ticker)
+    for start in range(0, num_of_simulation, chunk_size):
+        stop = min(start + chunk_size, num_of_simulation)
+        paths = simulate_paths(
+            adj_close[-1],
+            None,
+            stop - start,
+            len(trading_dates),
+            method=method,
+            streams=streams,
+            first_simulation_id=start,
+            model=model,
+            shocks=shocks,
+        )
+        result = SimulationResult(
+            ticker, paths.astype(dtype, copy=False), trading_dates, start
+        )
+        yield result if as_result else result.to_long_frame()
+
+
+def pct_change_std(adj_close):
     # Calculates the percentage change between the current and a prior price
-    pct_change = price_df["Adj Close"].pct_change()
+    pct_change = pd.Series(adj_close, copy=False).pct_change()
 
     # Assume that the daily stock returns follow a Normal Distribution
-    pct_change_std = pct_change.std()
+    return pct_change.std()
 
-    if trading_dates is None:
-        # Simulate the stock price for the following year
-        start_time = price_df["Date"].max()
-        if isinstance(start_time, str):
-            start_time = datetime.strptime(start_time, "%Y-%m-%d")
-        end_time = start_time.replace(year=start_time.year + 1)
-
-        start_date = start_time.strftime("%Y-%m-%d")
-        end_date = end_time.strftime("%Y-%m-%d")
-
-        trading_dates = get_trading_dates(start_date, end_date)
-
-    ticker_price_list = []
-    for simulation_id in range(num_of_simulation):
-        for (idx, dt) in enumerate(trading_dates):
-            if idx == 0:
-                prev_price = price_df["Adj Close"].iat[-1]
-            else:
-                prev_price = ticker_price_list[-1]["price"]
-
-            price = prev_price * (1 + np.random.normal(0, pct_change_std))
-            ticker_price_list.append(
-                {
-                    "ticker": ticker,
-                    "simulation_id": simulation_id,
-                    "date": dt,
-                    "price": price,
-                }
+
+def cache_params(
+    method="vectorized",
+    dtype=None,
+    aggregate=False,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    model=DEFAULT_MODEL,
+    model_options=None,
+    shocks="pseudo",
+    merged_chunks=False,
+):
+    """The parameters besides the inputs that a cached result depends on.
+
+    merged_chunks is whether an aggregate is merged from the aggregates of
+    its chunks, as scheduler.simulate_in_chunks does, rather than updated
+    with one chunk after the other, which sums in another order.
+    """
+    params = {
+        "method": method,
+        "dtype": None if dtype is None else np.dtype(dtype).str,
+        "aggregate": aggregate,
+        "model": model,
+        "model_options": model_options,
+        "shocks": shocks,
+    }
+    if aggregate:
+        params["chunk_size"] = chunk_size
+        params["merged_chunks"] = merged_chunks
+
+    return params
+
+
+def simulate_paths(
+    last_price,
+    pct_change_std,
+    num_of_simulation,
+    num_of_days,
+    method="vectorized",
+    streams=None,
+    first_simulation_id=0,
+    model=None,
+    shocks="pseudo",
+):
+    """Simulate price paths as a (num_of_simulation, num_of_days) array.
+
+    Simulation ``first_simulation_id + i`` is drawn from ``streams``, the
+    ticker's RandomStreams, so a chunk of simulations is identical to the
+    same rows of a larger run. ``method="loop"`` is the original per-step
+    implementation, kept as a reference for equivalence tests; it consumes
+    the streams in the same order and returns identical paths.
+
+    The daily returns are drawn from model, a fitted return model, by
+    default the zero drift NormalModel of pct_change_std. With antithetic
+    or sobol shocks, the model is driven by those uniforms by inversion.
+    """
+    if streams is None:
+        streams = RandomStreams(None, None)
+    if model is None:
+        model = NormalModel(pct_change_std)
+
+    if method == "vectorized":
+        return _simulate_paths_vectorized(
+            last_price,
+            model,
+            num_of_simulation,
+            num_of_days,
+            streams,
+            first_simulation_id,
+            shocks,
+        )
+    elif method == "loop":
+        if not isinstance(model, NormalModel) or shocks != "pseudo":
+            raise ValueError(
+                "the loop method only supports the normal model and pseudo shocks"
             )
-    simulated_price_df = pd.DataFrame(ticker_price_list)
+        return _simulate_paths_loop(
+            last_price,
+            model.std,
+            num_of_simulation,
+            num_of_days,
+            streams,
+            first_simulation_id,
+        )
+    else:
+        raise ValueError(
+            f"unknown simulation method: {method}, "
+            f"expected one of {SIMULATION_METHODS}"
+        )
+
+
+def draw_returns(
+    model,
+    num_of_simulation,
+    num_of_days,
+    streams,
+    first_simulation_id=0,
+    shocks="pseudo",
+):
+    """The (num_of_simulation, num_of_days) daily returns behind the paths.
+
+    Row i holds the returns of simulation first_simulation_id + i, drawn
+    from model with the shocks of streams like simulate_paths.
+    """
+
+    def draw(rng, rows):
+        if shocks == "pseudo":
+            return model.sample(rng, (rows, num_of_days))
+        if shocks == "antithetic" and hasattr(model, "from_normal"):
+            return model.from_normal(antithetic_normals(rng, rows, num_of_days))
+        # antithetic or quasi-random uniforms, inverted to returns
+        return model.from_uniform(uniforms(rng, shocks, rows, num_of_days))
+
+    return streams.draw(
+        draw,
+        first_simulation_id,
+        first_simulation_id + num_of_simulation,
+    )
+
+
+def _simulate_paths_vectorized(
+    last_price,
+    model,
+    num_of_simulation,
+    num_of_days,
+    streams,
+    first_simulation_id,
+    shocks="pseudo",
+):
+    # Draw the whole shock matrix at once, one row per simulation
+    returns = draw_returns(
+        model, num_of_simulation, num_of_days, streams, first_simulation_id, shocks
+    )
+
+    # Prepend the last known price so the cumulative product multiplies in
+    # the same order as the step-by-step loop
+    growth = np.empty((num_of_simulation, num_of_days + 1))
+    growth[:, 0] = last_price
+    np.add(returns, 1, out=growth[:, 1:])
+
+    return np.cumprod(growth, axis=1)[:, 1:]
+
+
+def _simulate_paths_loop(
+    last_price,
+    pct_change_std,
+    num_of_simulation,
+    num_of_days,
+    streams,
+    first_simulation_id,
+):
+    paths = np.empty((num_of_simulation, num_of_days))
+    rng = None
+    for simulation_id in range(
+        first_simulation_id, first_simulation_id + num_of_simulation
+    ):
+        if rng is None or simulation_id % RNG_BLOCK_SIZE == 0:
+            block_id = simulation_id // RNG_BLOCK_SIZE
+            rng = streams.block(block_id)
+            # skip the simulations of this block before the first one
+            for _ in range((simulation_id - block_id * RNG_BLOCK_SIZE) * num_of_days):
+                rng.normal(0, pct_change_std)
+
+        prev_price = last_price
+        for idx in range(num_of_days):
+            price = prev_price * (1 + rng.normal(0, pct_change_std))
+            paths[simulation_id - first_simulation_id, idx] = price
+            prev_price = price
+
+    return paths
+
+
+def paths_to_frame(ticker, paths, trading_dates, first_simulation_id=0):
+    """Convert a (simulations, days) array to the long simulation frame."""
+    return SimulationResult(
+        ticker, paths, trading_dates, first_simulation_id
+    ).to_long_frame()
 
-    return simulated_price_df
 
+def next_year_trading_dates(start_time):
+    # Simulate the stock price for the following year
+    if isinstance(start_time, str):
+        start_time = datetime.strptime(start_time, "%Y-%m-%d")
+    end_time = start_time.replace(year=start_time.year + 1)
 
-def get_trading_dates(start_date, end_date):
-    # Create a calendar
-    nyse = mcal.get_calendar("NYSE")
+    start_date = start_time.strftime("%Y-%m-%d")
+    end_date = end_time.strftime("%Y-%m-%d")
 
-    # Get NYSE trading dates
-    return nyse.schedule(start_date, end_date).index.to_list()
+    return get_trading_dates(start_date, end_date)
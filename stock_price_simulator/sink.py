@@ -0,0 +1,87 @@
+import os
+import shutil
+
+from stock_price_simulator.files import atomic_write, require_pyarrow
+
+DATASET_FORMATS = {
+    "parquet": ".parquet",
+    "arrow": ".arrow",
+}
+
+
+class DatasetSink:
+    """Append simulation chunks to a ticker-partitioned dataset on disk.
+
+    Every chunk becomes one file under ``{root}/ticker={ticker}/`` named
+    after its first simulation id, so chunks written by several processes
+    never collide. A rerun with fewer simulations would leave the parts of
+    the earlier run behind, so the runners clear the partition of every
+    ticker before simulating it again. The sink only holds its
+    configuration and can be sent to Pool workers.
+    """
+
+    def __init__(self, root, format="parquet"):
+        if format not in DATASET_FORMATS:
+            raise ValueError(
+                f"unknown dataset format: {format}, "
+                f"expected one of {tuple(DATASET_FORMATS)}"
+            )
+        self.root = str(root)
+        self.format = format
+
+    def clear(self, tickers):
+        """Remove the partitions of tickers written by an earlier run."""
+        for ticker in tickers:
+            shutil.rmtree(
+                os.path.join(self.root, f"ticker={ticker}"), ignore_errors=True
+            )
+
+    def write(self, chunk_df):
+        pa = require_pyarrow()
+
+        ticker = chunk_df["ticker"].iat[0]
+        first_simulation_id = chunk_df["simulation_id"].iat[0]
+
+        partition_dir = os.path.join(self.root, f"ticker={ticker}")
+        os.makedirs(partition_dir, exist_ok=True)
+        filename = f"part-{first_simulation_id:08d}{DATASET_FORMATS[self.format]}"
+        filepath = os.path.join(partition_dir, filename)
+
+        # the ticker is restored from the partition directory when reading
+        table = pa.Table.from_pandas(
+            chunk_df.drop(columns="ticker"), preserve_index=False
+        )
+
+        if self.format == "parquet":
+            import pyarrow.parquet as pq
+
+            atomic_write(filepath, lambda path: pq.write_table(table, path))
+        else:
+            import pyarrow.feather as feather
+
+            atomic_write(filepath, lambda path: feather.write_feather(table, path))
+
+        return filepath
+
+
+def read_dataset(root, format="parquet", tickers=None):
+    """Read a dataset written by DatasetSink back into a long frame."""
+    require_pyarrow()
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(
+        str(root),
+        format="parquet" if format == "parquet" else "ipc",
+        partitioning="hive",
+    )
+    filter = None
+    if tickers is not None:
+        filter = ds.field("ticker").isin(list(tickers))
+
+    simulated_price_df = dataset.to_table(filter=filter).to_pandas()
+    simulated_price_df["ticker"] = simulated_price_df["ticker"].astype(str)
+    simulated_price_df = simulated_price_df.sort_values(
+        ["ticker", "simulation_id", "date"], kind="stable", ignore_index=True
+    )
+
+    return simulated_price_df[["ticker", "simulation_id", "date", "price"]]
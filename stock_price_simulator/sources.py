@@ -0,0 +1,208 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from stock_price_simulator.files import atomic_write
+from stock_price_simulator.rng import RandomStreams
+
+# Set to a directory of {ticker}.csv/.parquet files to run without network
+PRICE_SOURCE_DIR_ENV = "PRICE_SOURCE_DIR"
+# Set to a directory to cache downloaded price histories between runs
+PRICE_CACHE_DIR_ENV = "PRICE_CACHE_DIR"
+
+
+class YahooSource:
+    """Daily price histories from Yahoo Finance."""
+
+    def fetch(self, ticker, start, end):
+        """Prices of ticker from start (inclusive) to end (exclusive)."""
+        import yfinance as yf
+
+        price_df = yf.download(ticker, start=start, end=end)
+
+        return price_df.reset_index()
+
+
+class LocalDirectorySource:
+    """Price histories stored as {ticker}.parquet or {ticker}.csv files.
+
+    The files have the same columns as the frames downloaded from Yahoo,
+    e.g. the input files written by az_batch/run.py.
+    """
+
+    def __init__(self, directory):
+        self.directory = str(directory)
+
+    def fetch(self, ticker, start, end):
+        filepath = os.path.join(self.directory, f"{ticker}.parquet")
+        if os.path.exists(filepath):
+            price_df = pd.read_parquet(filepath)
+        else:
+            filepath = os.path.join(self.directory, f"{ticker}.csv")
+            if not os.path.exists(filepath):
+                return pd.DataFrame()
+            price_df = pd.read_csv(filepath, parse_dates=["Date"])
+
+        price_df = price_df.drop(columns="ticker", errors="ignore")
+
+        return _slice_dates(price_df, start, end)
+
+
+class SyntheticSource:
+    """Random walk price histories for benchmarks and tests, no network.
+
+    The prices of a ticker only depend on the seed, the ticker and the
+    requested dates. Every business day is a trading day.
+    """
+
+    def __init__(self, seed=0, volatility=0.02, start_price=100.0):
+        self.seed = seed
+        self.volatility = volatility
+        self.start_price = start_price
+
+    def fetch(self, ticker, start, end):
+        dates = pd.bdate_range(start, end, inclusive="left")
+        rng = RandomStreams(self.seed, ticker).block(0)
+        returns = rng.normal(0, self.volatility, len(dates))
+        prices = self.start_price * np.cumprod(1 + returns)
+
+        return pd.DataFrame(
+            {
+                "Date": dates,
+                "Close": prices,
+                "Adj Close": prices,
+                "Volume": rng.integers(10**5, 10**7, len(dates)),
+            }
+        )
+
+
+class CachedSource:
+    """Cache the price histories of another source in a local directory.
+
+    Each ticker is stored as a Parquet file next to a small JSON file with
+    the date range it covers, so only the missing dates before or after
+    that range are fetched from the wrapped source. The range only grows
+    over fetches that returned prices.
+    """
+
+    def __init__(self, source, cache_dir):
+        self.source = source
+        self.cache_dir = str(cache_dir)
+
+    def fetch(self, ticker, start, end):
+        start = pd.Timestamp(start)
+        end = pd.Timestamp(end)
+
+        cached_df, coverage = self._read(ticker)
+        if coverage is None:
+            fetch_ranges = [(start, end)]
+        else:
+            fetch_ranges = [
+                (range_start, range_end)
+                for (range_start, range_end) in [
+                    (min(start, coverage[0]), coverage[0]),
+                    (coverage[1], max(end, coverage[1])),
+                ]
+                if range_start < range_end
+            ]
+
+        price_dfs = []
+        for (range_start, range_end) in fetch_ranges:
+            price_df = self.source.fetch(
+                ticker,
+                range_start.strftime("%Y-%m-%d"),
+                range_end.strftime("%Y-%m-%d"),
+            )
+            # an empty range may be a failed download, so it is fetched again
+            # next time instead of being cached as a gap
+            if price_df.empty:
+                continue
+            price_dfs.append(price_df)
+            if coverage is None:
+                coverage = (range_start, range_end)
+            else:
+                coverage = (min(coverage[0], range_start), max(coverage[1], range_end))
+
+        if price_dfs:
+            if cached_df is not None:
+                price_dfs.insert(0, cached_df)
+            cached_df = (
+                pd.concat(price_dfs, ignore_index=True)
+                .drop_duplicates(subset="Date", keep="last")
+                .sort_values("Date", ignore_index=True)
+            )
+            # prices of today are not final yet, so never mark them as cached
+            today = pd.Timestamp.today().normalize()
+            self._write(ticker, cached_df, (coverage[0], min(coverage[1], today)))
+        elif cached_df is None:
+            return pd.DataFrame()  # nothing to cache in case failed download
+
+        return _slice_dates(cached_df, start, end)
+
+    def _paths(self, ticker):
+        return (
+            os.path.join(self.cache_dir, f"{ticker}.parquet"),
+            os.path.join(self.cache_dir, f"{ticker}.json"),
+        )
+
+    def _read(self, ticker):
+        data_path, coverage_path = self._paths(ticker)
+        if not (os.path.exists(data_path) and os.path.exists(coverage_path)):
+            return None, None
+
+        with open(coverage_path) as f:
+            coverage = json.load(f)
+
+        return pd.read_parquet(data_path), (
+            pd.Timestamp(coverage["start"]),
+            pd.Timestamp(coverage["end"]),
+        )
+
+    def _write(self, ticker, price_df, coverage):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        data_path, coverage_path = self._paths(ticker)
+
+        # the coverage is written last, so a partially written cache entry
+        # is never trusted
+        atomic_write(data_path, lambda path: price_df.to_parquet(path, index=False))
+        atomic_write(
+            coverage_path,
+            lambda path: _write_json(
+                path,
+                {
+                    "start": coverage[0].strftime("%Y-%m-%d"),
+                    "end": coverage[1].strftime("%Y-%m-%d"),
+                },
+            ),
+        )
+
+
+def default_source():
+    """The price source configured by the environment, Yahoo by default."""
+    source_dir = os.environ.get(PRICE_SOURCE_DIR_ENV)
+    if source_dir:
+        return LocalDirectorySource(source_dir)
+
+    source = YahooSource()
+    cache_dir = os.environ.get(PRICE_CACHE_DIR_ENV)
+    if cache_dir:
+        source = CachedSource(source, cache_dir)
+
+    return source
+
+
+def _slice_dates(price_df, start, end):
+    if price_df.empty:
+        return price_df
+
+    dates = pd.to_datetime(price_df["Date"])
+    in_range = (dates >= pd.Timestamp(start)) & (dates < pd.Timestamp(end))
+
+    return price_df[in_range].reset_index(drop=True)
+
+
+def _write_json(path, data):
+    with open(path, "w") as f:
+        json.dump(data, f)
@@ -0,0 +1,230 @@
+"""Memory-mapped store of simulated paths, sliceable without loading them.
+
+Each ticker's paths are one raw (simulations, days) array file in the
+store's directory, and ``index.json`` maps every ticker to its file,
+offset, dtype, shape and dates. Readers map the files with np.memmap, so
+slicing a ticker, a date range or some simulations only reads those pages,
+and any number of processes can read a store at the same time.
+"""
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from stock_price_simulator.files import atomic_write
+from stock_price_simulator.result import SimulationResult
+
+STORE_FORMAT = "memmap"
+INDEX_FILENAME = "index.json"
+STORE_VERSION = 1
+
+
+class ResultStore:
+    """Simulated paths of several tickers in memory-mapped files.
+
+    Open an existing store with ResultStore(root), or allocate a new one
+    with ResultStore.create. A store opened with mode="r+" is also a sink:
+    write() puts each chunk at the rows of its simulation ids, so chunks
+    written by several processes never overlap. The store only holds its
+    index and can be sent to Pool workers, which map the files themselves.
+    """
+
+    def __init__(self, root, mode="r"):
+        if mode not in ("r", "r+"):
+            raise ValueError(f"mode must be 'r' or 'r+', got {mode!r}")
+        self.root = str(root)
+        self.mode = mode
+        with open(os.path.join(self.root, INDEX_FILENAME)) as f:
+            index = json.load(f)
+        if index.get("version") != STORE_VERSION:
+            raise ValueError(
+                f"unsupported store version {index.get('version')} in {self.root}"
+            )
+        self._entries = index["tickers"]
+        self._maps = {}
+        self._dates = {}
+
+    def __repr__(self):
+        return f"ResultStore(root={self.root!r}, tickers={len(self._entries)})"
+
+    def __contains__(self, ticker):
+        return ticker in self._entries
+
+    def __getstate__(self):
+        # memory maps are reopened by each process
+        state = self.__dict__.copy()
+        state["_maps"] = {}
+        return state
+
+    @property
+    def tickers(self):
+        return list(self._entries)
+
+    @classmethod
+    def create(cls, root, tickers, trading_dates, num_of_simulation, dtype=None):
+        """Allocate the files of a store of num_of_simulation paths per ticker.
+
+        trading_dates and num_of_simulation are shared by every ticker, or
+        dicts of ticker to its own. The files are sparse until written.
+        Returns the store opened for writing.
+        """
+        dtype = np.dtype(np.float64 if dtype is None else dtype)
+        if isinstance(trading_dates, dict):
+            dates = {ticker: _isoformat(trading_dates[ticker]) for ticker in tickers}
+        else:
+            dates = dict.fromkeys(tickers, _isoformat(trading_dates))
+        if not isinstance(num_of_simulation, dict):
+            num_of_simulation = dict.fromkeys(tickers, num_of_simulation)
+        os.makedirs(root, exist_ok=True)
+
+        entries = {}
+        for (i, ticker) in enumerate(tickers):
+            filename = f"{i:05d}.bin"
+            shape = [num_of_simulation[ticker], len(dates[ticker])]
+            with open(os.path.join(root, filename), "wb") as f:
+                f.truncate(shape[0] * shape[1] * dtype.itemsize)
+            entries[ticker] = {
+                "file": filename,
+                "offset": 0,
+                "dtype": dtype.str,
+                "shape": shape,
+                "dates": dates[ticker],
+            }
+
+        # readers never see a partially written index
+        index = {"version": STORE_VERSION, "tickers": entries}
+        atomic_write(
+            os.path.join(root, INDEX_FILENAME),
+            lambda path: Path(path).write_text(json.dumps(index)),
+        )
+
+        return cls(root, mode="r+")
+
+    @classmethod
+    def from_frame(cls, root, simulated_price_df, dtype=None):
+        """Store a long simulation frame, e.g. the result of run() or Batch.
+
+        Every ticker keeps its own dates and number of simulations, e.g. of
+        Batch tasks whose histories ended on different days.
+        """
+        simulated_price_df = simulated_price_df.sort_values(
+            ["ticker", "simulation_id", "date"], kind="stable"
+        )
+        ticker_dfs = dict(list(simulated_price_df.groupby("ticker", sort=False)))
+        trading_dates = {
+            ticker: ticker_df["date"].drop_duplicates().sort_values()
+            for (ticker, ticker_df) in ticker_dfs.items()
+        }
+        num_of_simulation = {
+            ticker: ticker_df["simulation_id"].nunique()
+            for (ticker, ticker_df) in ticker_dfs.items()
+        }
+
+        store = cls.create(
+            root, list(ticker_dfs), trading_dates, num_of_simulation, dtype=dtype
+        )
+        for ticker_df in ticker_dfs.values():
+            store.write(ticker_df)
+        store.flush()
+
+        return store
+
+    def paths(self, ticker):
+        """The (simulations, days) memory map of a ticker's paths."""
+        paths = self._maps.get(ticker)
+        if paths is None:
+            entry = self._entry(ticker)
+            paths = np.memmap(
+                os.path.join(self.root, entry["file"]),
+                dtype=np.dtype(entry["dtype"]),
+                mode=self.mode,
+                offset=entry["offset"],
+                shape=tuple(entry["shape"]),
+            )
+            self._maps[ticker] = paths
+
+        return paths
+
+    def dates(self, ticker):
+        dates = self._dates.get(ticker)
+        if dates is None:
+            dates = pd.DatetimeIndex(self._entry(ticker)["dates"])
+            self._dates[ticker] = dates
+
+        return dates
+
+    def prices(self, ticker, start=None, end=None, simulations=None):
+        """Prices of a ticker between the dates start and end, inclusive.
+
+        simulations selects rows like numpy indexing, all by default. Slices
+        return a view of the memory map, lists of simulation ids a copy.
+        """
+        days = self.dates(ticker).slice_indexer(start, end)
+        if simulations is None:
+            simulations = slice(None)
+
+        return self.paths(ticker)[simulations, days]
+
+    def read(self, ticker, start=None, end=None, simulations=None):
+        """A SimulationResult viewing a slice of a ticker's paths.
+
+        simulations is a slice of consecutive simulation ids, all by default.
+        """
+        if simulations is None:
+            simulations = slice(None)
+        if not isinstance(simulations, slice) or simulations.step not in (None, 1):
+            raise ValueError("simulations must be a slice of consecutive ids")
+        days = self.dates(ticker).slice_indexer(start, end)
+        first_simulation_id = simulations.indices(len(self.paths(ticker)))[0]
+
+        return SimulationResult(
+            ticker,
+            self.paths(ticker)[simulations, days],
+            self.dates(ticker)[days],
+            first_simulation_id,
+        )
+
+    def to_long_frame(self, tickers=None):
+        """The long frame returned by simulate, for some or all tickers."""
+        if tickers is None:
+            tickers = self.tickers
+
+        return pd.concat(
+            [self.read(ticker).to_long_frame() for ticker in tickers],
+            ignore_index=True,
+        )
+
+    def write(self, chunk_df):
+        """Write a long frame chunk of one ticker, as a sink of simulate."""
+        ticker = chunk_df["ticker"].iat[0]
+        first_simulation_id = chunk_df["simulation_id"].iat[0]
+        paths = self.paths(ticker)
+
+        # long frames are ordered by simulation, then date
+        prices = chunk_df["price"].to_numpy().reshape(-1, paths.shape[1])
+        paths[first_simulation_id : first_simulation_id + len(prices)] = prices
+
+        return len(chunk_df)
+
+    def write_result(self, result):
+        """Write the paths of a SimulationResult at its simulation ids."""
+        start = result.first_simulation_id
+        self.paths(result.ticker)[
+            start : start + result.num_of_simulation
+        ] = result.prices
+
+    def flush(self):
+        for paths in self._maps.values():
+            paths.flush()
+
+    def _entry(self, ticker):
+        try:
+            return self._entries[ticker]
+        except KeyError:
+            raise KeyError(f"{ticker} is not in the store {self.root}") from None
+
+
+def _isoformat(trading_dates):
+    return [date.isoformat() for date in pd.DatetimeIndex(trading_dates)]
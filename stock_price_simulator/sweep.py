@@ -0,0 +1,372 @@
+"""Scenario sweeps driven by common random numbers.
+
+A sweep simulates the paths of a ticker under a grid of scenarios: shocked
+volatility, shorter horizons and other starting prices. The daily returns
+are drawn once, and every scenario rescales the same draws around the mean
+return of the model instead of drawing its own. A sweep of K scenarios
+then costs one simulation plus K cheap transforms, and the differences
+between scenarios are not buried in sampling noise, as simulation i is the
+same path under different shocks in every scenario.
+"""
+import itertools
+from multiprocessing import Pool, cpu_count
+
+import click
+import numpy as np
+import pandas as pd
+
+from stock_price_simulator.instrument import span, worker_span
+from stock_price_simulator.models import DEFAULT_MODEL, RETURN_MODELS, fit_model
+from stock_price_simulator.result import DEFAULT_QUANTILES, SimulationResult
+from stock_price_simulator.rng import SHOCK_SOURCES, RandomStreams
+from stock_price_simulator.simulate import draw_returns, next_year_trading_dates
+from stock_price_simulator.ticker import download_ticker_prices, read_universe
+
+# volatility_shock scales the deviations of the daily returns from their
+# mean, horizon is the number of trading days simulated, and the paths
+# start at start_price, by default price_shock times the last price
+SCENARIO_FIELDS = ("name", "volatility_shock", "horizon", "price_shock", "start_price")
+
+
+class SweepResult:
+    """Simulated paths of one ticker under every scenario of a sweep.
+
+    scenarios is a frame of the scenario parameters, one row per scenario,
+    and sweep_result[scenario] the SimulationResult of a scenario.
+    """
+
+    def __init__(self, ticker, scenarios, results):
+        self.ticker = ticker
+        self.scenarios = scenarios
+        self.results = results
+
+    def __repr__(self):
+        return (
+            f"SweepResult(ticker={self.ticker!r}, scenarios={len(self)}, "
+            f"num_of_simulation={self.num_of_simulation})"
+        )
+
+    def __len__(self):
+        return len(self.results)
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __getitem__(self, scenario):
+        return self.results[scenario]
+
+    @property
+    def num_of_simulation(self):
+        return next(iter(self.results.values())).num_of_simulation
+
+    def terminal_summary(self, level=0.95, q=DEFAULT_QUANTILES):
+        """Statistics of the terminal price of every scenario.
+
+        One row per scenario with its parameters, the mean, standard
+        deviation and quantiles of its terminal price, and the value at risk
+        at level, the loss from its start price.
+        """
+        rows = {}
+        for (scenario, result) in self.results.items():
+            terminal_prices = result.terminal_prices
+            quantiles = np.quantile(terminal_prices, [*q, 1 - level])
+            row = {"mean": terminal_prices.mean(), "std": terminal_prices.std(ddof=1)}
+            row.update(
+                (f"{quantile:.0%}", value) for (quantile, value) in zip(q, quantiles)
+            )
+            row["value_at_risk"] = (
+                self.scenarios.at[scenario, "start_price"] - quantiles[-1]
+            )
+            rows[scenario] = row
+
+        return self.scenarios.join(pd.DataFrame.from_dict(rows, orient="index"))
+
+    def differences(self, baseline=None):
+        """Mean change of the terminal price of every scenario from baseline.
+
+        The changes are measured path by path, which common random numbers
+        make meaningful, so their standard error is far smaller than that
+        of the difference of independent simulations. baseline is a
+        scenario, the first one by default.
+        """
+        if baseline is None:
+            baseline = next(iter(self.results))
+        baseline_prices = self.results[baseline].terminal_prices
+
+        rows = {}
+        for (scenario, result) in self.results.items():
+            difference = result.terminal_prices - baseline_prices
+            rows[scenario] = {
+                "mean_difference": difference.mean(),
+                "stderr": difference.std(ddof=1) / np.sqrt(len(difference)),
+            }
+
+        return pd.DataFrame.from_dict(rows, orient="index").rename_axis("scenario")
+
+    def to_long_frame(self):
+        """The long frame of simulate with a leading scenario column."""
+        result_dfs = []
+        for (scenario, result) in self.results.items():
+            result_df = result.to_long_frame()
+            result_df.insert(0, "scenario", scenario)
+            result_dfs.append(result_df)
+
+        return pd.concat(result_dfs, ignore_index=True)
+
+
+def scenario_grid(volatility_shocks=(1.0,), horizons=(None,), price_shocks=(1.0,)):
+    """Every combination of the given shocks and horizons, as scenarios.
+
+    A horizon of None is the whole horizon of the sweep.
+    """
+    return [
+        {
+            "volatility_shock": volatility_shock,
+            "horizon": horizon,
+            "price_shock": price_shock,
+        }
+        for (volatility_shock, horizon, price_shock) in itertools.product(
+            volatility_shocks, horizons, price_shocks
+        )
+    ]
+
+
+def simulate_sweep(
+    ticker,
+    adj_close,
+    trading_dates,
+    scenarios,
+    num_of_simulation=1000,
+    seed=None,
+    model=DEFAULT_MODEL,
+    model_options=None,
+    shocks="pseudo",
+    dtype=None,
+):
+    """Simulate the paths of a ticker under every scenario from one draw.
+
+    scenarios is a list of dicts of SCENARIO_FIELDS, e.g. of scenario_grid,
+    whose missing fields leave the simulation unchanged. The returns are
+    drawn once over all trading_dates like simulate_prices, so the paths of
+    the unchanged scenario are those of simulate_prices with the same seed,
+    up to rounding. Returns a SweepResult indexed by the scenario names, or
+    their positions.
+    """
+    adj_close = np.asarray(adj_close, dtype=np.float64)
+    scenarios = _scenario_frame(scenarios, len(trading_dates), adj_close[-1])
+
+    with worker_span(
+        "sweep",
+        ticker=ticker,
+        num_of_simulation=num_of_simulation,
+        scenarios=len(scenarios),
+    ):
+        if isinstance(model, str):
+            model = fit_model(model, adj_close, **(model_options or {}))
+
+        returns = draw_returns(
+            model,
+            num_of_simulation,
+            len(trading_dates),
+            RandomStreams(seed, ticker),
+            shocks=shocks,
+        )
+        # the standardized shocks are the deviations from the mean return,
+        # only needed up to the longest horizon of the sweep
+        mean = model.expected_growth(1) - 1
+        deviations = returns[:, : scenarios["horizon"].max()]
+        deviations -= mean
+
+        growths = {}
+        results = {}
+        for scenario in scenarios.itertuples():
+            # the cumulative growth is shared by the scenarios of a shock,
+            # which only differ in horizon or start price
+            growth = growths.get(scenario.volatility_shock)
+            if growth is None:
+                growth = deviations * scenario.volatility_shock
+                growth += 1 + mean
+                np.cumprod(growth, axis=1, out=growth)
+                growths[scenario.volatility_shock] = growth
+
+            prices = scenario.start_price * growth[:, : scenario.horizon]
+            results[scenario.Index] = SimulationResult(
+                ticker,
+                prices.astype(dtype, copy=False),
+                trading_dates[: scenario.horizon],
+            )
+
+    return SweepResult(ticker, scenarios, results)
+
+
+def sweep(
+    ticker_price_df,
+    scenarios,
+    trading_dates=None,
+    num_of_simulation=1000,
+    processes=None,
+    seed=None,
+    model=DEFAULT_MODEL,
+    model_options=None,
+    shocks="pseudo",
+):
+    """Sweep the scenarios of every ticker in a process pool.
+
+    scenarios is either one list of scenarios for every ticker or a dict
+    of ticker to its own list. The trading dates default to the year after
+    the last price of any ticker. Returns a dict of ticker to SweepResult.
+    """
+    if trading_dates is None:
+        last_date = max(price_df["Date"].max() for price_df in ticker_price_df.values())
+        trading_dates = next_year_trading_dates(last_date)
+    if processes is None:
+        processes = max(1, cpu_count() - 1)
+
+    kwds = {
+        "num_of_simulation": num_of_simulation,
+        "seed": seed,
+        "model": model,
+        "model_options": model_options,
+        "shocks": shocks,
+    }
+    with span("sweep_all", processes=processes), Pool(processes=processes) as pool:
+        async_results = {
+            ticker: pool.apply_async(
+                simulate_sweep,
+                args=(
+                    ticker,
+                    price_df["Adj Close"].to_numpy(),
+                    trading_dates,
+                    scenarios[ticker] if isinstance(scenarios, dict) else scenarios,
+                ),
+                kwds=kwds,
+            )
+            for (ticker, price_df) in ticker_price_df.items()
+        }
+
+        return {ticker: result.get() for (ticker, result) in async_results.items()}
+
+
+def _scenario_frame(scenarios, num_of_days, last_price):
+    rows = []
+    for scenario in scenarios:
+        unknown = set(scenario) - set(SCENARIO_FIELDS)
+        if unknown:
+            raise ValueError(
+                f"unknown scenario fields: {sorted(unknown)}, "
+                f"expected some of {SCENARIO_FIELDS}"
+            )
+
+        volatility_shock = float(scenario.get("volatility_shock", 1.0))
+        if volatility_shock < 0:
+            raise ValueError(
+                f"volatility_shock must not be negative, got {volatility_shock}"
+            )
+        horizon = scenario.get("horizon")
+        horizon = num_of_days if horizon is None else int(horizon)
+        if not 1 <= horizon <= num_of_days:
+            raise ValueError(f"horizon must be within 1..{num_of_days}, got {horizon}")
+        start_price = scenario.get("start_price")
+        if start_price is None:
+            start_price = float(scenario.get("price_shock", 1.0)) * last_price
+
+        rows.append(
+            {
+                "name": scenario.get("name"),
+                "volatility_shock": volatility_shock,
+                "horizon": horizon,
+                "price_shock": start_price / last_price,
+                "start_price": float(start_price),
+            }
+        )
+    if not rows:
+        raise ValueError("a sweep needs at least one scenario")
+
+    scenarios = pd.DataFrame(rows)
+    if scenarios["name"].notna().all():
+        if not scenarios["name"].is_unique:
+            raise ValueError("scenario names must be unique")
+        scenarios = scenarios.set_index("name")
+    else:
+        scenarios = scenarios.drop(columns="name")
+
+    return scenarios.rename_axis("scenario")
+
+
+@click.command()
+@click.option(
+    "--universe",
+    type=click.Path(exists=True, dir_okay=False),
+    help="File of the tickers to sweep, defaults to the built-in tickers.",
+)
+@click.option(
+    "--volatility-shock",
+    type=float,
+    multiple=True,
+    help="Factor of the volatility, can be repeated.",
+)
+@click.option(
+    "--horizon",
+    type=int,
+    multiple=True,
+    help="Number of trading days, can be repeated, the whole year by default.",
+)
+@click.option(
+    "--price-shock",
+    type=float,
+    multiple=True,
+    help="Factor of the starting price, can be repeated.",
+)
+@click.option("--seed", type=int, help="Seed for reproducible simulations.")
+@click.option("--num-of-simulation", type=int, default=1000, show_default=True)
+@click.option(
+    "--processes",
+    type=int,
+    help="Number of worker processes, defaults to the number of CPUs minus one.",
+)
+@click.option(
+    "--model",
+    type=click.Choice(list(RETURN_MODELS)),
+    default=DEFAULT_MODEL,
+    show_default=True,
+)
+@click.option(
+    "--shocks",
+    type=click.Choice(list(SHOCK_SOURCES)),
+    default="pseudo",
+    show_default=True,
+)
+def cli(
+    universe,
+    volatility_shock,
+    horizon,
+    price_shock,
+    seed,
+    num_of_simulation,
+    processes,
+    model,
+    shocks,
+):
+    scenarios = scenario_grid(
+        volatility_shock or (1.0,), horizon or (None,), price_shock or (1.0,)
+    )
+    ticker_price_df = download_ticker_prices(
+        read_universe(universe) if universe else None
+    )
+
+    sweep_results = sweep(
+        ticker_price_df,
+        scenarios,
+        num_of_simulation=num_of_simulation,
+        processes=processes,
+        seed=seed,
+        model=model,
+        shocks=shocks,
+    )
+    for (ticker, sweep_result) in sweep_results.items():
+        print(f"{ticker}:")
+        print(sweep_result.terminal_summary().join(sweep_result.differences()))
+
+
+if __name__ == "__main__":
+    cli()
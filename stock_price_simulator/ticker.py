@@ -1,33 +1,65 @@
-import yfinance as yf
-
-
-def download_ticker_prices():
-    ticker_symbols = [
-        "AMD",
-        "AAPL",
-        "AMZN",
-        "META",
-        "MSFT",
-        "NVDA",
-        "PYPL",
-        "TSLA",
-        "TWTR",
-    ]
+import os
+
+import pandas as pd
+
+from stock_price_simulator.instrument import span
+from stock_price_simulator.sources import default_source
+
+TICKER_SYMBOLS = [
+    "AMD",
+    "AAPL",
+    "AMZN",
+    "META",
+    "MSFT",
+    "NVDA",
+    "PYPL",
+    "TSLA",
+    "TWTR",
+]
+
+
+def download_ticker_prices(
+    ticker_symbols=None, start="2020-01-01", end="2021-12-31", source=None
+):
+    if ticker_symbols is None:
+        ticker_symbols = TICKER_SYMBOLS
+    if source is None:
+        source = default_source()
 
     print("Download ticker data...")
 
     ticker_price_df = {}
     for ticker in ticker_symbols:
         print(f"{ticker}...")
-        price_df = yf.download(
-            ticker,
-            start="2020-01-01",
-            end="2021-12-31",
-        )
+        with span("download_ticker", ticker=ticker):
+            price_df = source.fetch(ticker, start, end)
         if price_df.empty:  # in case failed download
             continue
-        price_df = price_df.reset_index()
         price_df.insert(0, "ticker", ticker)
         ticker_price_df[ticker] = price_df
 
     return ticker_price_df
+
+
+def read_universe(filepath):
+    """Ticker symbols of a universe file, in order and without duplicates.
+
+    The file is either a .csv with a ticker (or symbol) column, or plain
+    text with one symbol per line, where blank lines and # comments are
+    ignored.
+    """
+    filepath = str(filepath)
+    if os.path.splitext(filepath)[1].lower() == ".csv":
+        universe_df = pd.read_csv(filepath, dtype=str)
+        columns = {column.lower(): column for column in universe_df.columns}
+        column = columns.get("ticker", columns.get("symbol"))
+        if column is None:
+            raise ValueError(f"{filepath} has no ticker or symbol column")
+        symbols = universe_df[column].dropna()
+    else:
+        with open(filepath) as f:
+            symbols = [line.split("#", 1)[0] for line in f]
+
+    symbols = [symbol.strip() for symbol in symbols]
+
+    return list(dict.fromkeys(symbol for symbol in symbols if symbol))
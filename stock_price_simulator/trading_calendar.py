@@ -0,0 +1,92 @@
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from stock_price_simulator.files import atomic_write
+
+DEFAULT_CALENDAR = "NYSE"
+
+# Sessions are precomputed in year-aligned windows of this size
+WINDOW_YEARS = 10
+MAX_CACHED_WINDOWS = 8
+
+# Set to a directory to persist precomputed sessions across processes
+CACHE_DIR_ENV = "TRADING_CALENDAR_CACHE_DIR"
+
+
+def get_trading_dates(start_date, end_date, calendar_name=DEFAULT_CALENDAR):
+    """Trading dates between start_date and end_date, both inclusive."""
+    start = pd.Timestamp(start_date)
+    end = pd.Timestamp(end_date)
+
+    sessions = get_sessions(calendar_name, start.year, end.year)
+    lo = np.searchsorted(sessions, np.datetime64(start, "ns"), side="left")
+    hi = np.searchsorted(sessions, np.datetime64(end, "ns"), side="right")
+
+    return pd.DatetimeIndex(sessions[lo:hi]).to_list()
+
+
+def get_sessions(calendar_name, start_year, end_year):
+    """Precomputed sessions covering the years start_year..end_year."""
+    first_window = start_year - start_year % WINDOW_YEARS
+    windows = [
+        _window_sessions(calendar_name, window_start, _cache_dir())
+        for window_start in range(first_window, end_year + 1, WINDOW_YEARS)
+    ]
+    if len(windows) == 1:
+        return windows[0]
+
+    return np.concatenate(windows)
+
+
+def clear_cache():
+    """Drop the in-memory session and calendar caches."""
+    _window_sessions.cache_clear()
+    _calendar.cache_clear()
+
+
+def _cache_dir():
+    return os.environ.get(CACHE_DIR_ENV) or None
+
+
+@lru_cache(maxsize=MAX_CACHED_WINDOWS)
+def _window_sessions(calendar_name, window_start, cache_dir=None):
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = os.path.join(
+            cache_dir, f"{calendar_name}-{window_start}-{WINDOW_YEARS}.npy"
+        )
+        if os.path.exists(cache_path):
+            return _read_only(np.load(cache_path))
+
+    schedule = _calendar(calendar_name).schedule(
+        f"{window_start}-01-01", f"{window_start + WINDOW_YEARS - 1}-12-31"
+    )
+    sessions = schedule.index.values.astype("datetime64[ns]")
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        atomic_write(cache_path, lambda tmp_path: _save(sessions, tmp_path))
+
+    return _read_only(sessions)
+
+
+@lru_cache(maxsize=None)
+def _calendar(calendar_name):
+    import pandas_market_calendars as mcal
+
+    return mcal.get_calendar(calendar_name)
+
+
+def _read_only(sessions):
+    # the arrays are shared by every caller through the cache
+    sessions.flags.writeable = False
+    return sessions
+
+
+def _save(sessions, path):
+    # through a file object, as np.save would append .npy to the path
+    with open(path, "wb") as f:
+        np.save(f, sessions)
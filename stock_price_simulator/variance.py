@@ -0,0 +1,245 @@
+"""Variance reduction and adaptive stopping.
+
+simulate_adaptive simulates batches of paths until the confidence
+intervals of the chosen statistics are narrower than a tolerance, instead
+of guessing num_of_simulation up front. Antithetic or Sobol shocks make
+each block of RNG_BLOCK_SIZE paths far less noisy than independent draws,
+and the terminal price, whose mean is known exactly from the model, is
+used as a control variate for the mean path.
+"""
+from statistics import NormalDist
+
+import numpy as np
+
+from stock_price_simulator.aggregate import PathAggregate
+from stock_price_simulator.instrument import worker_span
+from stock_price_simulator.models import DEFAULT_MODEL, fit_model
+from stock_price_simulator.result import DEFAULT_QUANTILES
+from stock_price_simulator.rng import RNG_BLOCK_SIZE, RandomStreams
+from stock_price_simulator.simulate import simulate_paths
+
+ADAPTIVE_STATISTICS = ("mean", "value_at_risk", "quantiles")
+DEFAULT_BATCH_SIZE = 16 * RNG_BLOCK_SIZE
+DEFAULT_MAX_SIMULATIONS = 2**20
+
+
+def control_variate_mean(values, control, control_mean):
+    """Mean of the columns of values, corrected by a control of known mean.
+
+    values is a (replicates, n) array and control the (replicates,) values
+    of the control in the same replicates. Each column is corrected by the
+    fitted multiple of the control's error, which removes the part of its
+    variance explained by the control. Returns the estimates and their
+    standard errors.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    control = np.asarray(control, dtype=np.float64)
+    num_of_replicates = len(control)
+    if num_of_replicates < 3:
+        raise ValueError(
+            f"a control variate needs at least 3 replicates, got {num_of_replicates}"
+        )
+
+    control_error = control - control.mean()
+    control_variance = np.dot(control_error, control_error)
+    beta = np.zeros(values.shape[1])
+    if control_variance > 0:
+        beta = control_error @ (values - values.mean(axis=0)) / control_variance
+
+    adjusted = values - np.outer(control - control_mean, beta)
+    # one degree of freedom is spent on beta
+    stderr = adjusted.std(axis=0, ddof=2) / np.sqrt(num_of_replicates)
+
+    return adjusted.mean(axis=0), stderr
+
+
+class AdaptiveResult:
+    """Statistics of an adaptive simulation and their confidence intervals.
+
+    half_widths maps each statistic to the half-width of its confidence
+    interval, relative to the last price; converged is whether they all
+    fell below the tolerance before max_simulations.
+    """
+
+    def __init__(self, aggregate, mean, mean_half_width, half_widths, converged):
+        self.aggregate = aggregate
+        self.mean = mean
+        self.mean_half_width = mean_half_width
+        self.half_widths = half_widths
+        self.converged = converged
+
+    def __repr__(self):
+        return (
+            f"AdaptiveResult(ticker={self.ticker!r}, "
+            f"num_of_simulation={self.num_of_simulation}, "
+            f"converged={self.converged})"
+        )
+
+    @property
+    def ticker(self):
+        return self.aggregate.ticker
+
+    @property
+    def num_of_simulation(self):
+        return self.aggregate.count
+
+    def value_at_risk(self, level=0.95, price=None):
+        return self.aggregate.value_at_risk(level, price)
+
+    def summary(self, q=DEFAULT_QUANTILES):
+        """Like PathAggregate.summary, with the corrected mean and its interval."""
+        summary_df = self.aggregate.summary(q)
+        summary_df["mean"] = self.mean
+        summary_df.insert(1, "mean_half_width", self.mean_half_width)
+
+        return summary_df
+
+
+def simulate_adaptive(
+    ticker,
+    adj_close,
+    trading_dates,
+    tolerance=0.01,
+    statistics=("mean", "value_at_risk"),
+    level=0.95,
+    confidence=0.95,
+    batch_size=DEFAULT_BATCH_SIZE,
+    max_simulations=DEFAULT_MAX_SIMULATIONS,
+    shocks="antithetic",
+    control_variate=True,
+    seed=None,
+    model=DEFAULT_MODEL,
+    model_options=None,
+):
+    """Simulate batches of paths until the statistics are precise enough.
+
+    Stops as soon as the confidence interval of every statistic, at the
+    given confidence, is narrower than +-tolerance times the last price:
+    "mean" is the mean price of every date, "value_at_risk" the loss at
+    level of the terminal price and "quantiles" the DEFAULT_QUANTILES of
+    the terminal price. Returns an AdaptiveResult.
+
+    Paths are numbered like in simulate, so with a seed the paths are the
+    same as the first paths of simulate with the same shocks. The
+    replicates of the mean are the independent blocks of RNG_BLOCK_SIZE
+    paths, which stays valid for antithetic and Sobol shocks. Intervals of
+    the quantiles assume independent paths, which only overstates them for
+    antithetic and Sobol shocks.
+    """
+    unknown = set(statistics) - set(ADAPTIVE_STATISTICS)
+    if unknown:
+        raise ValueError(
+            f"unknown statistics: {sorted(unknown)}, "
+            f"expected some of {ADAPTIVE_STATISTICS}"
+        )
+    if batch_size < RNG_BLOCK_SIZE or batch_size % RNG_BLOCK_SIZE:
+        raise ValueError(
+            f"batch_size must be a positive multiple of {RNG_BLOCK_SIZE}, "
+            f"got {batch_size}"
+        )
+    if max_simulations < RNG_BLOCK_SIZE:
+        raise ValueError(
+            f"max_simulations must be at least {RNG_BLOCK_SIZE}, got {max_simulations}"
+        )
+
+    if isinstance(model, str):
+        model = fit_model(model, adj_close, **(model_options or {}))
+    last_price = float(np.asarray(adj_close)[-1])
+    num_of_days = len(trading_dates)
+    # the mean terminal price, known exactly from the model
+    terminal_mean = last_price * model.expected_growth(num_of_days)
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    quantiles = []
+    if "value_at_risk" in statistics:
+        quantiles.append(1 - level)
+    if "quantiles" in statistics:
+        quantiles.extend(DEFAULT_QUANTILES)
+
+    streams = RandomStreams(seed, ticker)
+    aggregate = PathAggregate(ticker, trading_dates, last_price)
+    block_means = []
+    terminal_prices = []
+    num_of_simulation = 0
+    # whole blocks, and no more than max_simulations
+    next_batch_size = min(
+        batch_size, RNG_BLOCK_SIZE * (max_simulations // RNG_BLOCK_SIZE)
+    )
+
+    with worker_span("simulate_adaptive", ticker=ticker, tolerance=tolerance):
+        while True:
+            paths = simulate_paths(
+                last_price,
+                None,
+                next_batch_size,
+                num_of_days,
+                streams=streams,
+                first_simulation_id=num_of_simulation,
+                model=model,
+                shocks=shocks,
+            )
+            num_of_simulation += next_batch_size
+            aggregate.update(paths)
+            block_means.append(
+                paths.reshape(-1, RNG_BLOCK_SIZE, num_of_days).mean(axis=1)
+            )
+            terminal_prices.append(paths[:, -1])
+
+            replicates = np.concatenate(block_means)
+            if control_variate and len(replicates) >= 3:
+                mean, stderr = control_variate_mean(
+                    replicates, replicates[:, -1], terminal_mean
+                )
+            elif len(replicates) > 1:
+                mean = replicates.mean(axis=0)
+                stderr = replicates.std(axis=0, ddof=1) / np.sqrt(len(replicates))
+            else:
+                # a single block gives no estimate of the error
+                mean = replicates[0]
+                stderr = np.full(num_of_days, np.inf)
+            mean_half_width = z * stderr
+
+            half_widths = {}
+            if "mean" in statistics:
+                half_widths["mean"] = float(mean_half_width.max() / last_price)
+            if quantiles:
+                widths = _quantile_half_widths(
+                    np.concatenate(terminal_prices), quantiles, z
+                )
+                if "value_at_risk" in statistics:
+                    half_widths["value_at_risk"] = float(widths[0] / last_price)
+                if "quantiles" in statistics:
+                    half_widths["quantiles"] = float(
+                        widths[-len(DEFAULT_QUANTILES) :].max() / last_price
+                    )
+
+            worst = max(half_widths.values(), default=0.0)
+            converged = worst <= tolerance
+            remaining = (max_simulations - num_of_simulation) // RNG_BLOCK_SIZE
+            if converged or remaining <= 0:
+                break
+
+            # interval widths shrink with the square root of the paths, so
+            # aim straight at the expected number of paths, at most doubling
+            needed = num_of_simulation * (worst / tolerance) ** 2
+            next_batch_size = int(
+                min(max(needed - num_of_simulation, batch_size), num_of_simulation)
+            )
+            next_batch_size = RNG_BLOCK_SIZE * min(
+                -(-next_batch_size // RNG_BLOCK_SIZE), remaining
+            )
+
+    return AdaptiveResult(aggregate, mean, mean_half_width, half_widths, converged)
+
+
+def _quantile_half_widths(values, quantiles, z):
+    # distribution free interval between two order statistics, whose ranks
+    # are binomially distributed around n * q
+    n = len(values)
+    q = np.asarray(quantiles)
+    spread = z * np.sqrt(n * q * (1 - q))
+    lower = np.clip(np.floor(n * q - spread), 0, n - 1).astype(np.int64)
+    upper = np.clip(np.ceil(n * q + spread), 0, n - 1).astype(np.int64)
+    ranks = np.unique(np.concatenate([lower, upper]))
+    ordered = np.partition(values, ranks)
+
+    return (ordered[upper] - ordered[lower]) / 2
@@ -0,0 +1,271 @@
+"""Long-lived worker that simulates jobs sent as newline-delimited JSON.
+
+Starting Python, importing numpy and pandas and building the trading
+calendar cost more than simulating a short job. The worker pays them once
+and then serves any number of jobs, read one JSON object per line from
+stdin or from the connections of a local socket. Each job is answered by
+one JSON line, in the order the jobs complete, e.g.
+
+    {"id": 1, "ticker": "AAPL", "adj_close": [...], "last_date": "2021-12-31",
+     "num_of_simulation": 1000, "seed": 7, "output": "summary"}
+
+is answered by {"id": 1, "ok": true, "ticker": "AAPL", "result": {...}}, or
+{"id": 1, "ok": false, "error": "..."} when it fails. Jobs name their
+prices either inline (adj_close and last_date or trading_dates) or as the
+filepath of a price frame. output is "summary" (statistics per date and the
+value at risk, the default), "paths" (every simulated price) or "file"
+(the long frame written to output_path). {"op": "ping"} checks the worker
+is alive and {"op": "shutdown"} stops it.
+
+This module only imports the simulation itself, so the worker never loads
+the download sources or the Azure SDKs.
+"""
+import json
+import os
+import socketserver
+import sys
+import threading
+from datetime import date
+from multiprocessing import Pool
+
+import click
+import numpy as np
+import pandas as pd
+
+from stock_price_simulator.formats import read_frame, write_frame
+from stock_price_simulator.instrument import span
+from stock_price_simulator.models import DEFAULT_MODEL
+from stock_price_simulator.result import DEFAULT_QUANTILES
+from stock_price_simulator.simulate import next_year_trading_dates, simulate_prices
+from stock_price_simulator.trading_calendar import DEFAULT_CALENDAR, get_sessions
+
+JOB_OUTPUTS = ("summary", "paths", "file")
+# jobs of a connection queued or running in the pool at once, so a client
+# streaming jobs faster than they complete waits instead of piling them up
+DEFAULT_MAX_IN_FLIGHT = 64
+
+
+def preload(calendar_names=(DEFAULT_CALENDAR,)):
+    """Build the sessions of the calendars around today once per process."""
+    year = date.today().year
+    for calendar_name in calendar_names:
+        get_sessions(calendar_name, year - 2, year + 1)
+
+
+def run_job(job):
+    """Simulate one job and return its JSON response."""
+    response = {"id": job.get("id")}
+    try:
+        op = job.get("op", "simulate")
+        if op == "ping":
+            response.update(ok=True, pid=os.getpid())
+        elif op == "simulate":
+            response.update(ok=True, ticker=job["ticker"], result=_simulate(job))
+        else:
+            raise ValueError(f"unknown op: {op}")
+    except Exception as e:
+        response.update(ok=False, error=f"{type(e).__name__}: {e}")
+
+    return response
+
+
+def serve(infile, outfile, pool=None, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+    """Answer the jobs read from infile on outfile until EOF or shutdown.
+
+    With a pool, the jobs run in its warm processes and are answered as
+    they complete, otherwise one after the other in this process. At most
+    max_in_flight jobs are in the pool at once, reading more jobs waits
+    for one to complete. Returns whether a shutdown was requested.
+    """
+    lock = threading.Lock()
+    in_flight = threading.BoundedSemaphore(max_in_flight)
+
+    def respond(response):
+        line = json.dumps(response, default=json_default)
+        with lock:
+            outfile.write(line + "\n")
+            outfile.flush()
+
+    def completed(response):
+        respond(response)
+        in_flight.release()
+
+    shutdown = False
+    for line in infile:
+        if not line.strip():
+            continue
+        try:
+            job = json.loads(line)
+        except ValueError as e:
+            respond({"id": None, "ok": False, "error": f"invalid job: {e}"})
+            continue
+
+        if job.get("op") == "shutdown":
+            shutdown = True
+            break
+        if pool is None or job.get("op") == "ping":
+            respond(run_job(job))
+        else:
+            in_flight.acquire()
+            pool.apply_async(
+                run_job,
+                (job,),
+                callback=completed,
+                # run_job answers its own errors, these are e.g. a job that
+                # could not be sent to the pool
+                error_callback=lambda e, job_id=job.get("id"): completed(
+                    {"id": job_id, "ok": False, "error": f"{type(e).__name__}: {e}"}
+                ),
+            )
+
+    # wait for the jobs still in the pool
+    for _ in range(max_in_flight):
+        in_flight.acquire()
+
+    return shutdown
+
+
+def serve_socket(path, pool=None):
+    """Serve the jobs of every connection to a Unix socket at path."""
+    if os.path.exists(path):
+        os.remove(path)
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            infile = (line.decode("utf-8") for line in self.rfile)
+            outfile = _TextWriter(self.wfile)
+            if serve(infile, outfile, pool):
+                # shutdown() waits for serve_forever, so call it from
+                # another thread
+                threading.Thread(target=self.server.shutdown).start()
+
+    with socketserver.ThreadingUnixStreamServer(path, Handler) as server:
+        server.daemon_threads = True
+        try:
+            server.serve_forever()
+        finally:
+            os.remove(path)
+
+
+def _simulate(job):
+    output = job.get("output", "summary")
+    if output not in JOB_OUTPUTS:
+        raise ValueError(f"unknown output: {output}, expected one of {JOB_OUTPUTS}")
+
+    if "filepath" in job:
+        price_df = read_frame(job["filepath"])
+        adj_close = price_df["Adj Close"].to_numpy()
+        last_date = pd.Timestamp(price_df["Date"].max())
+    else:
+        adj_close = np.asarray(job["adj_close"], dtype=np.float64)
+        last_date = job.get("last_date")
+    if "trading_dates" in job:
+        trading_dates = pd.DatetimeIndex(job["trading_dates"]).to_list()
+    elif last_date is not None:
+        trading_dates = next_year_trading_dates(pd.Timestamp(last_date))
+    else:
+        raise ValueError("a job needs a filepath, last_date or trading_dates")
+
+    kwargs = {
+        "seed": job.get("seed"),
+        "model": job.get("model", DEFAULT_MODEL),
+        "model_options": job.get("model_options"),
+        "shocks": job.get("shocks", "pseudo"),
+    }
+    num_of_simulation = job.get("num_of_simulation", 5)
+
+    with span("worker_job", ticker=job["ticker"], output=output):
+        if output == "summary":
+            path_aggregate = simulate_prices(
+                job["ticker"],
+                adj_close,
+                trading_dates,
+                num_of_simulation,
+                aggregate=True,
+                **kwargs,
+            )
+            summary_df = path_aggregate.summary(job.get("quantiles", DEFAULT_QUANTILES))
+            return {
+                "num_of_simulation": path_aggregate.count,
+                "value_at_risk": path_aggregate.value_at_risk(job.get("level", 0.95)),
+                "summary": summary_df.reset_index().to_dict(orient="list"),
+            }
+
+        result = simulate_prices(
+            job["ticker"],
+            adj_close,
+            trading_dates,
+            num_of_simulation,
+            as_result=True,
+            **kwargs,
+        )
+        if output == "paths":
+            return {
+                "dates": result.dates,
+                "first_simulation_id": result.first_simulation_id,
+                "prices": result.prices,
+            }
+
+        write_frame(
+            result.to_long_frame(),
+            job["output_path"],
+            float32=job.get("float32", False),
+        )
+        return {"output_path": job["output_path"], "rows": len(result)}
+
+
+def json_default(value):
+    """Convert the dates and arrays of responses for json.dumps."""
+    if isinstance(value, (pd.Timestamp, date)):
+        return value.isoformat()
+    if isinstance(value, pd.Index):
+        return [json_default(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class _TextWriter:
+    # the text interface serve expects, over a socket's binary file
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, text):
+        self.wfile.write(text.encode("utf-8"))
+
+    def flush(self):
+        self.wfile.flush()
+
+
+def _init_pool_worker():
+    preload()
+
+
+@click.command()
+@click.option("--socket", help="Serve a Unix socket at this path instead of stdin.")
+@click.option(
+    "--processes",
+    type=int,
+    help="Run the jobs in a pool of this many warm processes.",
+)
+def cli(socket, processes):
+    preload()
+    pool = None
+    if processes:
+        pool = Pool(processes, initializer=_init_pool_worker)
+
+    try:
+        if socket:
+            serve_socket(socket, pool)
+        else:
+            serve(sys.stdin, sys.stdout, pool)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+if __name__ == "__main__":
+    cli()
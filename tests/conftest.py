@@ -0,0 +1,15 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def price_df():
+    dates = pd.bdate_range("2021-01-01", periods=60)
+    prices = 100 * np.cumprod(1 + np.random.default_rng(0).normal(0, 0.02, 60))
+    return pd.DataFrame({"Date": dates, "Adj Close": prices})
+
+
+@pytest.fixture
+def trading_dates():
+    return pd.bdate_range("2022-01-03", periods=20).to_list()
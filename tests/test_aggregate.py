@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+
+from stock_price_simulator.aggregate import PathAggregate
+from stock_price_simulator.run import cli
+from stock_price_simulator.scheduler import simulate_in_chunks
+from stock_price_simulator.simulate import simulate
+
+
+def test_aggregate_matches_result(price_df, trading_dates):
+    result = simulate("AAA", price_df, trading_dates, 5000, as_result=True, seed=1)
+    path_aggregate = simulate(
+        "AAA", price_df, trading_dates, 5000, chunk_size=512, seed=1, aggregate=True
+    )
+
+    assert path_aggregate.count == 5000
+    np.testing.assert_allclose(path_aggregate.mean, result.prices.mean(axis=0))
+    np.testing.assert_allclose(path_aggregate.std, result.prices.std(axis=0, ddof=1))
+    np.testing.assert_array_equal(path_aggregate.min, result.prices.min(axis=0))
+
+    # quantiles are exact up to the width of a bin of the sketch
+    np.testing.assert_allclose(
+        path_aggregate.quantiles().to_numpy(), result.quantiles().to_numpy(), rtol=4e-3
+    )
+    assert list(path_aggregate.summary().columns) == list(result.summary().columns)
+
+    terminal_5 = np.quantile(result.terminal_prices, 0.05)
+    assert path_aggregate.value_at_risk(0.95) == pytest.approx(
+        price_df["Adj Close"].iat[-1] - terminal_5, rel=0.05
+    )
+
+
+def test_merge_is_exact(price_df, trading_dates):
+    result = simulate("AAA", price_df, trading_dates, 300, as_result=True, seed=2)
+    reference_price = price_df["Adj Close"].iat[-1]
+
+    whole = PathAggregate("AAA", trading_dates, reference_price).update(result.prices)
+    parts = [
+        PathAggregate("AAA", trading_dates, reference_price).update(prices)
+        for prices in np.array_split(result.prices, [7, 100, 101])
+    ]
+    merged = PathAggregate.concat(parts)
+
+    assert merged.count == whole.count
+    np.testing.assert_array_equal(merged.counts, whole.counts)
+    np.testing.assert_allclose(merged.mean, whole.mean)
+    np.testing.assert_allclose(merged.m2, whole.m2)
+    pd.testing.assert_frame_equal(merged.quantiles(), whole.quantiles())
+
+    with pytest.raises(ValueError):
+        merged.merge(PathAggregate("BBB", trading_dates, reference_price))
+
+
+def test_save_and_load(tmp_path, price_df, trading_dates):
+    path_aggregate = simulate(
+        "AAA", price_df, trading_dates, 100, seed=3, aggregate=True
+    )
+    path_aggregate.save(tmp_path / "aggregate.npz")
+
+    loaded = PathAggregate.load(tmp_path / "aggregate.npz")
+
+    assert loaded.ticker == "AAA"
+    assert loaded.dates.tolist() == trading_dates
+    pd.testing.assert_frame_equal(loaded.summary(), path_aggregate.summary())
+
+
+def test_aggregate_in_chunks(price_df, trading_dates):
+    aggregates = simulate_in_chunks(
+        {"AAA": price_df},
+        trading_dates,
+        200,
+        chunk_size=64,
+        processes=2,
+        seed=4,
+        aggregate=True,
+    )
+    expected = simulate("AAA", price_df, trading_dates, 200, seed=4, aggregate=True)
+
+    np.testing.assert_array_equal(aggregates["AAA"].counts, expected.counts)
+    np.testing.assert_allclose(aggregates["AAA"].mean, expected.mean)
+
+    # merged in simulation order, so bitwise the same whatever the pool
+    serial = simulate_in_chunks(
+        {"AAA": price_df},
+        trading_dates,
+        200,
+        chunk_size=64,
+        processes=1,
+        seed=4,
+        aggregate=True,
+    )
+    np.testing.assert_array_equal(aggregates["AAA"].mean, serial["AAA"].mean)
+    np.testing.assert_array_equal(aggregates["AAA"].m2, serial["AAA"].m2)
+
+
+def test_run_aggregate(monkeypatch, price_df):
+    from stock_price_simulator import run as run_module
+
+    monkeypatch.setattr(
+        run_module,
+        "download_ticker_prices",
+        lambda *args, **kwargs: {"AAA": price_df, "BBB": price_df},
+    )
+
+    aggregates = run_module.run(seed=5, num_of_simulation=50, aggregate=True)
+
+    assert list(aggregates) == ["AAA", "BBB"]
+    assert aggregates["AAA"].count == 50
+    with pytest.raises(ValueError):
+        run_module.run(output_dir="out", aggregate=True)
+
+
+@pytest.mark.parametrize("args", [["--aggregate"], ["--tolerance", "0.01"]])
+def test_cli_rejects_output_file_of_statistics(tmp_path, args):
+    output_file = str(tmp_path / "result.csv")
+
+    result = CliRunner().invoke(cli, [*args, "--output-file", output_file])
+
+    assert result.exit_code == 2
+    assert "--output-file cannot be combined" in result.output
@@ -0,0 +1,154 @@
+import os
+import sys
+import threading
+import time
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("azure.batch")
+pytest.importorskip("azure.storage.blob")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "az_batch"))
+
+import az_utils  # noqa: E402
+
+from stock_price_simulator.aggregate import PathAggregate  # noqa: E402
+
+
+class FakeBlobServiceClient:
+    """In-memory stand-in for a storage account, like Azurite but in process.
+
+    Records the highest number of concurrent transfers it served.
+    """
+
+    def __init__(self, latency=0.01):
+        self.blobs = {}
+        self.latency = latency
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def transfer(self):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.latency)
+        with self.lock:
+            self.active -= 1
+
+    def get_blob_client(self, container_name, blob_name):
+        service = self
+
+        class BlobClient:
+            def upload_blob(self, data, overwrite=False):
+                service.transfer()
+                service.blobs[(container_name, blob_name)] = data.read()
+
+        return BlobClient()
+
+    def get_container_client(self, container_name):
+        service = self
+
+        class Downloader:
+            def __init__(self, data):
+                self.data = data
+
+            def readall(self):
+                return self.data
+
+        class ContainerClient:
+            def list_blobs(self, name_starts_with=None):
+                return [
+                    type("Blob", (), {"name": blob_name})
+                    for (container, blob_name) in sorted(service.blobs)
+                    if container == container_name
+                    and blob_name.startswith(name_starts_with or "")
+                ]
+
+            def download_blob(self, blob_name):
+                service.transfer()
+                return Downloader(service.blobs[(container_name, blob_name)])
+
+        return ContainerClient()
+
+
+@pytest.fixture(autouse=True)
+def storage_env(monkeypatch):
+    monkeypatch.setenv("STORAGE_ACCOUNT_NAME", "account")
+    monkeypatch.setenv("STORAGE_ACCOUNT_KEY", "a2V5")
+
+
+def test_upload_files_to_container(tmp_path):
+    file_paths = []
+    for i in range(20):
+        file_path = tmp_path / f"T{i:02d}.csv"
+        file_path.write_text(f"price\n{i}\n")
+        file_paths.append(str(file_path))
+    client = FakeBlobServiceClient()
+
+    resource_files = az_utils.upload_files_to_container(
+        client, "input", file_paths, max_concurrency=4
+    )
+
+    assert [f.file_path for f in resource_files] == [
+        os.path.basename(path) for path in file_paths
+    ]
+    assert client.blobs[("input", "T03.csv")] == b"price\n3\n"
+    assert 1 < client.max_active <= 4
+    # one container SAS signs every URL
+    assert len({f.http_url.split("?")[1] for f in resource_files}) == 1
+
+
+def test_blobs_to_df():
+    client = FakeBlobServiceClient()
+    for i in range(12):
+        client.blobs[("output", f"data/Simulated_T{i:02d}.csv")] = (
+            pd.DataFrame({"ticker": [f"T{i:02d}"] * 2, "price": [i, i + 1]})
+            .to_csv(index=False)
+            .encode()
+        )
+    client.blobs[("output", "logs/stdout.txt")] = b"log"
+
+    df = az_utils.blobs_to_df(client, "output", prefix="data", max_concurrency=3)
+
+    assert df["ticker"].tolist() == [f"T{i:02d}" for i in range(12) for _ in range(2)]
+    assert 1 < client.max_active <= 3
+
+
+def test_blobs_to_df_parquet():
+    pytest.importorskip("pyarrow")
+    client = FakeBlobServiceClient()
+    for ticker in ["AAA", "BBB"]:
+        buffer = BytesIO()
+        pd.DataFrame({"ticker": [ticker] * 2, "price": [1.0, 2.0]}).astype(
+            {"ticker": "category"}
+        ).to_parquet(buffer)
+        client.blobs[("output", f"data/Simulated_{ticker}.parquet")] = buffer.getvalue()
+
+    df = az_utils.blobs_to_df(client, "output", prefix="data")
+
+    assert df["ticker"].tolist() == ["AAA", "AAA", "BBB", "BBB"]
+
+
+def test_blob_to_aggregate(tmp_path):
+    path_aggregate = PathAggregate("AAA", pd.bdate_range("2022-01-03", periods=3), 100)
+    path_aggregate.update(
+        100 * np.random.default_rng(0).lognormal(0, 0.02, (10, 3)).cumprod(axis=1)
+    )
+    path_aggregate.save(tmp_path / "Aggregate_AAA.npz")
+    client = FakeBlobServiceClient()
+    client.blobs[("output", "data/Aggregate_AAA.npz")] = (
+        tmp_path / "Aggregate_AAA.npz"
+    ).read_bytes()
+
+    downloaded = az_utils.blob_to_aggregate(
+        client.get_container_client("output"), "output", "data/Aggregate_AAA.npz"
+    )
+
+    assert downloaded.count == 10
+    pd.testing.assert_frame_equal(
+        downloaded.summary(), path_aggregate.summary(), check_freq=False
+    )
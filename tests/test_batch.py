@@ -0,0 +1,367 @@
+import os
+import sys
+import tarfile
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+
+pytest.importorskip("azure.batch")
+pytest.importorskip("azure.storage.blob")
+
+AZ_BATCH_DIR = os.path.join(os.path.dirname(__file__), os.pardir, "az_batch")
+sys.path.insert(0, os.path.join(AZ_BATCH_DIR, "node"))
+sys.path.insert(0, AZ_BATCH_DIR)
+
+import azure.batch.models as batchmodels  # noqa: E402
+import batch  # noqa: E402
+import task  # noqa: E402
+import wheelhouse  # noqa: E402
+
+
+class FakeOperations:
+    def __init__(self, **methods):
+        self.__dict__.update(methods)
+
+
+class FakeBatchClient:
+    """A local fake of the Batch service, advancing one tick per poll.
+
+    Node i of the pool is idle from tick i + 1 on, and a task completes
+    task_ticks[task id] ticks (default 1) after it was added. The task
+    counts show the job as it was counts_lag ticks ago. Records the pools
+    and tasks added, and how the service was queried.
+    """
+
+    def __init__(self, node_count=2, task_ticks=None, failed_tasks=(), counts_lag=0):
+        self.node_count = node_count
+        self.task_ticks = task_ticks or {}
+        self.failed_tasks = set(failed_tasks)
+        self.counts_lag = counts_lag
+        self.tick = 0
+        self.pools = []
+        self.tasks = {}
+        self.added_at = {}
+        self.added_tasks = []
+        self.full_task_listings = 0
+        self.pool = FakeOperations(add=self.pools.append, get=self.get_pool, delete=id)
+        self.compute_node = FakeOperations(list=self.list_nodes)
+        self.task = FakeOperations(add_collection=self.add_tasks, list=self.list_tasks)
+        self.job = FakeOperations(get_task_counts=self.get_task_counts, delete=id)
+
+    def get_pool(self, pool_id):
+        self.tick += 1
+        return SimpleNamespace(
+            id=pool_id, resize_errors=None, target_dedicated_nodes=self.node_count
+        )
+
+    def list_nodes(self, pool_id, compute_node_list_options=None):
+        nodes = [
+            SimpleNamespace(
+                id=f"node-{i}",
+                state=batchmodels.ComputeNodeState.idle
+                if self.tick > i
+                else batchmodels.ComputeNodeState.starting,
+            )
+            for i in range(self.node_count)
+        ]
+        if compute_node_list_options is not None:
+            assert compute_node_list_options.filter == "state eq 'idle'"
+            nodes = [n for n in nodes if n.state == batchmodels.ComputeNodeState.idle]
+        return nodes
+
+    def add_tasks(self, job_id, tasks):
+        self.added_tasks.extend(tasks)
+        for task_ in tasks:
+            self.tasks[task_.id] = self.tick + self.task_ticks.get(task_.id, 1)
+            self.added_at[task_.id] = self.tick
+
+    def completed(self, tick=None):
+        tick = self.tick if tick is None else tick
+        return [
+            task_id
+            for (task_id, completed_at) in self.tasks.items()
+            if completed_at <= tick
+        ]
+
+    def list_tasks(self, job_id, task_list_options=None):
+        if task_list_options is None:
+            self.full_task_listings += 1
+        else:
+            assert task_list_options.filter == "state eq 'completed'"
+        result = batchmodels.TaskExecutionResult
+        return [
+            SimpleNamespace(
+                id=task_id,
+                execution_info=SimpleNamespace(
+                    result=result.failure
+                    if task_id in self.failed_tasks
+                    else result.success
+                ),
+            )
+            for task_id in self.completed()
+        ]
+
+    def get_task_counts(self, job_id):
+        self.tick += 1
+        tick = self.tick - self.counts_lag
+        added = [t for (t, added_at) in self.added_at.items() if added_at <= tick]
+        completed = len(self.completed(tick))
+        failed = len(self.failed_tasks & set(self.completed(tick)))
+        return SimpleNamespace(
+            task_counts=SimpleNamespace(
+                active=len(added) - completed,
+                running=0,
+                completed=completed,
+                failed=failed,
+            )
+        )
+
+
+class FakeSleep:
+    def __init__(self):
+        self.intervals = []
+
+    def __call__(self, interval):
+        self.intervals.append(interval)
+
+
+@pytest.fixture
+def batch_env(monkeypatch):
+    monkeypatch.setenv("POOL_ID", "pool")
+    monkeypatch.setenv("POOL_VM_SIZE", "Standard_A2_v2")
+    monkeypatch.setenv("POOL_NODE_COUNT", "2")
+    monkeypatch.setenv("output_container", "output")
+    monkeypatch.setattr(
+        batch, "make_container_sas_url", lambda container: f"https://{container}"
+    )
+
+
+def input_files(tickers):
+    return [
+        batchmodels.ResourceFile(http_url=f"https://{t}", file_path=f"{t}.csv")
+        for t in tickers
+    ]
+
+
+def test_bundle_input_files():
+    files = input_files(["A", "B", "C", "D", "E"])
+
+    assert [task_id for (task_id, _) in batch.bundle_input_files(files)] == list(
+        "ABCDE"
+    )
+    bundles = batch.bundle_input_files(files, bundle_size=2)
+    assert [task_id for (task_id, _) in bundles] == [
+        "bundle-0000",
+        "bundle-0001",
+        "bundle-0002",
+    ]
+    assert [len(task_files) for (_, task_files) in bundles] == [2, 2, 1]
+    with pytest.raises(ValueError):
+        batch.bundle_input_files(files, bundle_size=0)
+
+
+def test_create_pool_installs_from_wheelhouse(batch_env):
+    client = FakeBatchClient()
+
+    batch.create_pool(
+        client,
+        input_files(["task"]),
+        "package.tar.gz",
+        wheelhouse=wheelhouse.WHEELHOUSE_ARCHIVE,
+        backoff=batch.Backoff(sleep=FakeSleep()),
+    )
+
+    command_line = client.pools[0].start_task.command_line
+    assert "apt-get" not in command_line
+    assert f"tar -xzf {wheelhouse.WHEELHOUSE_ARCHIVE}" in command_line
+    assert "--no-index" in command_line
+
+
+def test_run_job_bundles_tickers(batch_env):
+    client = FakeBatchClient()
+
+    batch.run_job(
+        client,
+        input_files(["A", "B", "C"]),
+        "pool",
+        "job",
+        bundle_size=2,
+        output_format="parquet",
+        float32=True,
+        backoff=batch.Backoff(sleep=FakeSleep()),
+    )
+
+    tasks = client.added_tasks
+    assert [t.id for t in tasks] == ["bundle-0000", "bundle-0001"]
+    assert "--ticker A --filepath A.csv --ticker B --filepath B.csv" in (
+        tasks[0].command_line
+    )
+    assert [f.file_path for f in tasks[0].resource_files] == ["A.csv", "B.csv"]
+    assert "--output-format parquet --float32" in tasks[0].command_line
+    assert tasks[0].output_files[-1].file_pattern == "data/output/*.parquet"
+
+
+def test_run_job_uploads_aggregates(batch_env):
+    client = FakeBatchClient()
+
+    batch.run_job(
+        client,
+        input_files(["A"]),
+        "pool",
+        "job",
+        aggregate=True,
+        backoff=batch.Backoff(sleep=FakeSleep()),
+    )
+
+    task = client.added_tasks[0]
+    assert task.command_line.endswith(' --aggregate"')
+    # the tasks write Aggregate_{ticker}.npz instead of the wire format
+    assert task.output_files[-1].file_pattern == "data/output/*.npz"
+
+
+def test_build_wheelhouse(tmp_path):
+    dist_dir = tmp_path / "dist"
+    commands = []
+
+    def run(command, check):
+        commands.append(command)
+        if "--dest" in command:  # fake the downloaded wheels
+            wheelhouse_dir = command[command.index("--dest") + 1]
+            os.makedirs(wheelhouse_dir, exist_ok=True)
+            for name in ["pip-23.0-py3-none-any.whl", "numpy-1.23.1.whl"]:
+                open(os.path.join(wheelhouse_dir, name), "w").close()
+
+    archive_path = wheelhouse.build_wheelhouse(
+        str(tmp_path), python="docker run python", dist_dir=str(dist_dir), run=run
+    )
+
+    assert commands[1][:3] == ["docker", "run", "python"]
+    with tarfile.open(archive_path) as archive:
+        names = archive.getnames()
+    assert "pip.whl" in names
+    assert "wheelhouse/numpy-1.23.1.whl" in names
+
+
+def test_task_simulates_a_bundle(tmp_path, monkeypatch):
+    dates = pd.bdate_range("2021-01-01", periods=60)
+    prices = 100 * np.cumprod(1 + np.random.default_rng(0).normal(0, 0.02, 60))
+    for ticker in ["AAA", "BBB"]:
+        pd.DataFrame({"Date": dates, "Adj Close": prices}).to_csv(
+            tmp_path / f"{ticker}.csv", index=False
+        )
+    monkeypatch.chdir(tmp_path)
+
+    result = CliRunner().invoke(
+        task.cli,
+        "--ticker AAA --filepath AAA.csv --ticker BBB --filepath BBB.csv --seed 1",
+    )
+
+    assert result.exit_code == 0, result.output
+    assert sorted(os.listdir(tmp_path / "data" / "output")) == [
+        "Simulated_AAA.csv",
+        "Simulated_BBB.csv",
+    ]
+
+
+def test_create_pool_returns_with_first_idle_node(batch_env):
+    client = FakeBatchClient(node_count=3)
+    sleep = FakeSleep()
+
+    batch.create_pool(
+        client,
+        input_files(["task"]),
+        "package.tar.gz",
+        wait_for_all_nodes=False,
+        backoff=batch.Backoff(sleep=sleep),
+    )
+
+    # node 0 is idle after the first poll, the others are still starting
+    assert client.tick == 1
+    assert sleep.intervals == []
+
+
+def test_harvest_tasks_as_they_complete(batch_env):
+    client = FakeBatchClient(task_ticks={"A": 1, "B": 6, "C": 2})
+    sleep = FakeSleep()
+    harvested = []
+
+    batch.run_job(
+        client,
+        input_files(["A", "B", "C"]),
+        "pool",
+        "job",
+        on_task_complete=lambda task_id, tickers: harvested.append(
+            (client.tick, task_id, tickers)
+        ),
+        backoff=batch.Backoff(interval=1, max_interval=4, sleep=sleep),
+    )
+
+    # the fast tasks are harvested before the straggler finished
+    assert harvested == [(1, "A", ["A"]), (2, "C", ["C"]), (6, "B", ["B"])]
+    assert client.full_task_listings == 0
+    # backoff grows while nothing completes, and resets on progress
+    assert sleep.intervals == [1, 1, 2, 4, 4]
+
+
+def test_wait_for_tasks_with_lagging_counts(batch_env):
+    # right after the tasks were added, the counts still show an empty job
+    client = FakeBatchClient(task_ticks={"A": 1, "B": 3}, counts_lag=2)
+    harvested = []
+
+    batch.run_job(
+        client,
+        input_files(["A", "B"]),
+        "pool",
+        "job",
+        on_task_complete=lambda task_id, tickers: harvested.append(
+            (client.tick, task_id)
+        ),
+        backoff=batch.Backoff(sleep=FakeSleep()),
+    )
+
+    # B is only listed once the counts caught up with it
+    assert harvested == [(1, "A"), (5, "B")]
+
+
+def test_failed_tasks_raise(batch_env):
+    client = FakeBatchClient(failed_tasks={"B"})
+    harvested = []
+
+    with pytest.raises(batch.TasksFailed) as excinfo:
+        batch.run_job(
+            client,
+            input_files(["A", "B"]),
+            "pool",
+            "job",
+            on_task_complete=lambda task_id, tickers: harvested.append(task_id),
+            backoff=batch.Backoff(sleep=FakeSleep()),
+        )
+
+    assert harvested == ["A"]
+    # a rerun only needs to retry the failed tickers
+    assert excinfo.value.tickers == ["B"]
+
+
+def test_task_reads_and_writes_parquet(tmp_path, monkeypatch):
+    pytest.importorskip("pyarrow")
+    dates = pd.bdate_range("2021-01-01", periods=60)
+    prices = 100 * np.cumprod(1 + np.random.default_rng(0).normal(0, 0.02, 60))
+    pd.DataFrame({"Date": dates, "Adj Close": prices}).to_parquet(
+        tmp_path / "AAA.parquet"
+    )
+    monkeypatch.chdir(tmp_path)
+
+    result = CliRunner().invoke(
+        task.cli,
+        "--ticker AAA --filepath AAA.parquet --output-format parquet --seed 1",
+    )
+
+    assert result.exit_code == 0, result.output
+    simulated_price_df = pd.read_parquet(
+        tmp_path / "data" / "output" / "Simulated_AAA.parquet"
+    )
+    assert simulated_price_df["ticker"].dtype == "category"
+    assert len(simulated_price_df) == 5 * simulated_price_df["date"].nunique()
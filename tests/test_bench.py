@@ -0,0 +1,33 @@
+from benchmarks.bench import compare, run_benchmarks
+
+
+def test_compare_flags_regressions():
+    baseline = {
+        "results": [
+            {"name": "simulate", "params": {"n": 1}, "best": 1.0},
+            {"name": "simulate", "params": {"n": 2}, "best": 1.0},
+        ]
+    }
+    report = {
+        "results": [
+            {"name": "simulate", "params": {"n": 1}, "best": 1.1},
+            {"name": "simulate", "params": {"n": 2}, "best": 1.5},
+            {"name": "simulate", "params": {"n": 3}, "best": 9.0},
+        ]
+    }
+
+    regressions = compare(report, baseline, threshold=0.2)
+
+    assert [regression["params"] for regression in regressions] == [{"n": 2}]
+    assert regressions[0]["ratio"] == 1.5
+
+
+def test_quick_suite():
+    report = run_benchmarks(["simulate", "serialization"], quick=True, repeat=1)
+
+    assert {result["name"] for result in report["results"]} >= {
+        "simulate",
+        "write",
+        "read",
+    }
+    assert all(result["best"] > 0 for result in report["results"])
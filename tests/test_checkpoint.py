@@ -0,0 +1,140 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from stock_price_simulator.checkpoint import (
+    MANIFEST_FILENAME,
+    Manifest,
+    run_checkpointed,
+)
+from stock_price_simulator.sink import read_dataset
+from stock_price_simulator.sources import SyntheticSource
+from stock_price_simulator.ticker import read_universe
+
+pytest.importorskip("pyarrow")
+
+TICKERS = ["AAA", "BBB", "CCC", "DDD"]
+
+
+class FlakySource(SyntheticSource):
+    """Synthetic prices, failing for the tickers listed in a file."""
+
+    def __init__(self, failures_path):
+        super().__init__()
+        self.failures_path = str(failures_path)
+
+    def fetch(self, ticker, start, end):
+        with open(self.failures_path) as f:
+            if ticker in f.read().split():
+                raise ConnectionError(f"{ticker} is unavailable")
+        # record every fetch to count the tickers simulated by each run
+        with open(f"{self.failures_path}.fetched", "a") as f:
+            f.write(f"{ticker}\n")
+
+        return super().fetch(ticker, start, end)
+
+
+def test_read_universe(tmp_path):
+    text_path = tmp_path / "universe.txt"
+    text_path.write_text("# large caps\nAAPL\n\nMSFT  # software\nAAPL\nBRK-B\n")
+    csv_path = tmp_path / "universe.csv"
+    pd.DataFrame({"Name": ["Apple", "Tesla"], "Symbol": ["AAPL", "TSLA"]}).to_csv(
+        csv_path, index=False
+    )
+
+    assert read_universe(text_path) == ["AAPL", "MSFT", "BRK-B"]
+    assert read_universe(csv_path) == ["AAPL", "TSLA"]
+
+
+def test_manifest(tmp_path):
+    path = tmp_path / MANIFEST_FILENAME
+    manifest = Manifest(path, {"seed": 1, "shocks": ("pseudo",)})
+    manifest.record("AAA", True, rows=10)
+    manifest.record("BBB", False, error="failed")
+    manifest.record("CCC", False, error="failed")
+    manifest.record("CCC", True, rows=10)
+    with open(path, "a") as f:
+        f.write('{"ticker": "DD')  # torn by a crash
+
+    manifest = Manifest(path, {"seed": 1, "shocks": ["pseudo"]})
+
+    assert manifest.completed == ["AAA", "CCC"]
+    assert manifest.failed == {"BBB": "failed"}
+    assert manifest.pending(["AAA", "BBB", "CCC", "DDD"]) == ["BBB", "DDD"]
+    with pytest.raises(ValueError):
+        Manifest(path, {"seed": 2})
+
+
+def test_resume_only_failed_tickers(tmp_path):
+    failures_path = tmp_path / "failures"
+    failures_path.write_text("BBB DDD")
+    source = FlakySource(failures_path)
+    output_dir = tmp_path / "simulated"
+    kwargs = {
+        "ticker_symbols": TICKERS,
+        "source": source,
+        "num_of_simulation": 20,
+        "processes": 2,
+        "max_tasks_per_child": 1,
+        "max_in_flight": 2,
+        "seed": 5,
+    }
+
+    manifest = run_checkpointed(output_dir, **kwargs)
+
+    assert sorted(manifest.completed) == ["AAA", "CCC"]
+    assert sorted(manifest.failed) == ["BBB", "DDD"]
+    assert "ConnectionError" in manifest.failed["BBB"]
+
+    failures_path.write_text("")
+    manifest = run_checkpointed(output_dir, **kwargs)
+
+    assert sorted(manifest.completed) == TICKERS
+    assert manifest.failed == {}
+    with open(f"{failures_path}.fetched") as f:
+        assert sorted(f.read().split()) == TICKERS
+
+    # the resumed dataset is the same as an uninterrupted run's
+    run_checkpointed(tmp_path / "uninterrupted", **kwargs)
+    pd.testing.assert_frame_equal(
+        read_dataset(output_dir), read_dataset(tmp_path / "uninterrupted")
+    )
+    with open(os.path.join(output_dir, MANIFEST_FILENAME)) as f:
+        header = json.loads(f.readline())
+    assert header["params"]["num_of_simulation"] == 20
+
+
+class CrashingSource(FlakySource):
+    """Kills the worker process instead of raising."""
+
+    def fetch(self, ticker, start, end):
+        with open(self.failures_path) as f:
+            if ticker in f.read().split():
+                os._exit(1)
+
+        return super().fetch(ticker, start, end)
+
+
+def test_resume_after_worker_died(tmp_path):
+    failures_path = tmp_path / "failures"
+    failures_path.write_text("CCC")
+    output_dir = tmp_path / "simulated"
+    kwargs = {
+        "ticker_symbols": TICKERS,
+        "source": CrashingSource(failures_path),
+        "processes": 2,
+        "timeout": 2,
+        "seed": 5,
+    }
+
+    # the ticker of the dead worker never completes
+    with pytest.raises(RuntimeError, match="rerun to resume"):
+        run_checkpointed(output_dir, **kwargs)
+    assert sorted(Manifest(output_dir / MANIFEST_FILENAME).completed) != TICKERS
+
+    failures_path.write_text("")
+    manifest = run_checkpointed(output_dir, **kwargs)
+
+    assert sorted(manifest.completed) == TICKERS
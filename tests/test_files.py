@@ -0,0 +1,45 @@
+import sys
+
+import pytest
+
+from stock_price_simulator.files import atomic_write, require_pyarrow
+
+
+def test_atomic_write(tmp_path):
+    path = tmp_path / "data.txt"
+    path.write_text("old")
+
+    def write(tmp_filepath):
+        # path is unchanged until the write completed
+        assert path.read_text() == "old"
+        with open(tmp_filepath, "w") as f:
+            f.write("new")
+
+    atomic_write(path, write)
+
+    assert path.read_text() == "new"
+    assert [p.name for p in tmp_path.iterdir()] == ["data.txt"]
+
+
+def test_failed_write_keeps_the_old_file(tmp_path):
+    path = tmp_path / "data.txt"
+    path.write_text("old")
+
+    def write(tmp_filepath):
+        with open(tmp_filepath, "w") as f:
+            f.write("partial")
+        raise OSError("disk full")
+
+    with pytest.raises(OSError, match="disk full"):
+        atomic_write(path, write)
+
+    assert path.read_text() == "old"
+    assert [p.name for p in tmp_path.iterdir()] == ["data.txt"]
+
+
+def test_require_pyarrow(monkeypatch):
+    # None in sys.modules makes the import fail like a missing package
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+
+    with pytest.raises(ImportError, match="pip install pyarrow"):
+        require_pyarrow()
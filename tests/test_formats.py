@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from stock_price_simulator.formats import (
+    FrameWriter,
+    format_of,
+    read_frame,
+    write_frame,
+)
+from stock_price_simulator.simulate import simulate
+
+pytest.importorskip("pyarrow")
+
+
+def test_format_of():
+    assert format_of("data/Simulated_AAA.parquet") == "parquet"
+    assert format_of("AAA.csv") == "csv"
+    with pytest.raises(ValueError):
+        format_of("AAA.json")
+
+
+@pytest.mark.parametrize("format", ["parquet", "arrow"])
+def test_binary_round_trip(tmp_path, price_df, trading_dates, format):
+    simulated_price_df = simulate("AAA", price_df, trading_dates, 200, seed=1)
+    path = tmp_path / f"Simulated_AAA.{format}"
+
+    write_frame(simulated_price_df, path)
+
+    pd.testing.assert_frame_equal(read_frame(path), simulated_price_df)
+    pd.testing.assert_frame_equal(
+        read_frame(path.read_bytes(), format), simulated_price_df
+    )
+    assert path.stat().st_size < len(simulated_price_df.to_csv(index=False))
+
+
+def test_float32_prices(tmp_path, price_df, trading_dates):
+    simulated_price_df = simulate("AAA", price_df, trading_dates, 7, seed=1)
+    path = write_frame(simulated_price_df, tmp_path / "AAA.parquet", float32=True)
+
+    read_df = read_frame(path)
+
+    assert read_df["price"].dtype == np.float32
+    np.testing.assert_allclose(read_df["price"], simulated_price_df["price"], rtol=1e-6)
+
+
+@pytest.mark.parametrize("format", ["csv", "parquet", "arrow"])
+def test_frame_writer_as_sink(tmp_path, price_df, trading_dates, format):
+    path = tmp_path / f"Simulated_AAA.{format}"
+
+    with FrameWriter(path) as writer:
+        num_of_rows = simulate(
+            "AAA", price_df, trading_dates, 10, sink=writer, chunk_size=4, seed=2
+        )
+
+    expected_df = simulate("AAA", price_df, trading_dates, 10, seed=2)
+    read_df = read_frame(path)
+    assert num_of_rows == len(read_df) == len(expected_df)
+    if format == "csv":
+        read_df["date"] = pd.to_datetime(read_df["date"]).astype(
+            expected_df["date"].dtype
+        )
+    pd.testing.assert_frame_equal(read_df, expected_df)
@@ -0,0 +1,64 @@
+import json
+import pickle
+
+import pytest
+
+from stock_price_simulator import instrument
+from stock_price_simulator.instrument import call_pickled, span, unpickle, worker_span
+
+
+@pytest.fixture
+def trace_file(tmp_path, monkeypatch):
+    trace_file = tmp_path / "trace.jsonl"
+    monkeypatch.setenv(instrument.TRACE_FILE_ENV, str(trace_file))
+    return trace_file
+
+
+def read_spans(trace_file):
+    return [json.loads(line) for line in trace_file.read_text().splitlines()]
+
+
+def test_span_records_timings(trace_file):
+    with span("download", ticker="AAA") as attributes:
+        attributes["rows"] = 3
+
+    with pytest.raises(KeyError):
+        with span("simulate"):
+            raise KeyError("AAA")
+
+    download, simulate = read_spans(trace_file)
+    assert download["span"] == "download"
+    assert download["ticker"] == "AAA"
+    assert download["rows"] == 3
+    assert download["wall"] >= 0 and download["cpu"] >= 0
+    assert simulate["error"] == "KeyError"
+
+
+def test_span_is_silent_without_trace_file(tmp_path, monkeypatch):
+    monkeypatch.delenv(instrument.TRACE_FILE_ENV, raising=False)
+
+    with span("download") as attributes:
+        attributes["rows"] = 3
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_worker_span_dumps_profile(tmp_path, monkeypatch):
+    monkeypatch.delenv(instrument.TRACE_FILE_ENV, raising=False)
+    monkeypatch.setenv(instrument.PROFILE_DIR_ENV, str(tmp_path))
+
+    with worker_span("simulate"):
+        sum(range(1000))
+
+    assert [path.name.split("-")[0] for path in tmp_path.iterdir()] == ["simulate"]
+
+
+def test_call_pickled(trace_file):
+    data = call_pickled(dict, ticker="AAA")
+
+    assert pickle.loads(data) == {"ticker": "AAA"}
+    assert unpickle(data) == {"ticker": "AAA"}
+    assert [record["span"] for record in read_spans(trace_file)] == [
+        "pickle",
+        "unpickle",
+    ]
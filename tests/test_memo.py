@@ -0,0 +1,142 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from stock_price_simulator import memo
+from stock_price_simulator import run as run_module
+from stock_price_simulator.memo import SimulationCache, simulation_key
+from stock_price_simulator.simulate import DEFAULT_CHUNK_SIZE, simulate
+
+
+def test_key_depends_on_every_input(price_df, trading_dates):
+    adj_close = price_df["Adj Close"].to_numpy()
+    key = simulation_key("AAA", adj_close, trading_dates, 10, 1, model="normal")
+
+    assert key == simulation_key("AAA", adj_close, trading_dates, 10, 1, model="normal")
+    assert key != simulation_key("BBB", adj_close, trading_dates, 10, 1, model="normal")
+    assert key != simulation_key(
+        "AAA", adj_close * 1.01, trading_dates, 10, 1, model="normal"
+    )
+    assert key != simulation_key(
+        "AAA", adj_close, trading_dates[:-1], 10, 1, model="normal"
+    )
+    assert key != simulation_key("AAA", adj_close, trading_dates, 11, 1, model="normal")
+    assert key != simulation_key("AAA", adj_close, trading_dates, 10, 2, model="normal")
+    assert key != simulation_key("AAA", adj_close, trading_dates, 10, 1, model="gbm")
+
+
+def test_key_depends_on_cache_format(monkeypatch, price_df, trading_dates):
+    adj_close = price_df["Adj Close"].to_numpy()
+    key = simulation_key("AAA", adj_close, trading_dates, 10, 1)
+
+    monkeypatch.setattr(memo, "CACHE_FORMAT_VERSION", memo.CACHE_FORMAT_VERSION + 1)
+
+    assert key != simulation_key("AAA", adj_close, trading_dates, 10, 1)
+
+
+def test_memory_lru():
+    cache = SimulationCache(max_items=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats["memory_hits"] == 3
+    assert cache.stats["misses"] == 1
+
+
+def test_disk_tier(tmp_path):
+    SimulationCache(tmp_path).put("a", np.arange(10))
+
+    cache = SimulationCache(tmp_path)
+    np.testing.assert_array_equal(cache.get("a"), np.arange(10))
+    cache.get("a")
+
+    assert cache.stats["disk_hits"] == 1
+    assert cache.stats["memory_hits"] == 1
+    assert cache.hit_rate == 1.0
+
+
+def test_disk_eviction(tmp_path):
+    # room for two of the ~1KB results
+    cache = SimulationCache(tmp_path, max_items=1, max_bytes=2000)
+    cache.put("a", np.zeros(100))
+    cache.put("b", np.zeros(100))
+    os.utime(tmp_path / "a.pkl", (0, 0))
+    cache.put("c", np.zeros(100))
+
+    # the least recently used file is evicted first
+    assert cache.stats["evictions"] == 1
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["b.pkl", "c.pkl"]
+    assert cache.get("a") is None
+
+
+def test_simulate_cached(tmp_path, price_df, trading_dates):
+    cache = SimulationCache(tmp_path)
+    simulated_price_df = simulate(
+        "AAA", price_df, trading_dates, 20, seed=1, cache=cache
+    )
+
+    cached_df = simulate("AAA", price_df, trading_dates, 20, seed=1, cache=cache)
+    result = simulate(
+        "AAA", price_df, trading_dates, 20, seed=1, as_result=True, cache=cache
+    )
+
+    pd.testing.assert_frame_equal(cached_df, simulated_price_df)
+    pd.testing.assert_frame_equal(result.to_long_frame(), simulated_price_df)
+    assert cache.stats == {
+        "memory_hits": 2,
+        "disk_hits": 0,
+        "misses": 1,
+        "puts": 1,
+        "evictions": 0,
+    }
+
+    # only seeded simulations are reproducible
+    simulate("AAA", price_df, trading_dates, 20, cache=cache)
+    assert cache.stats["puts"] == 1
+
+
+def test_run_skips_cached_tickers(monkeypatch, tmp_path, price_df):
+    changed_df = price_df.assign(**{"Adj Close": price_df["Adj Close"] * 1.1})
+    ticker_price_df = {"AAA": price_df, "BBB": price_df}
+    monkeypatch.setattr(
+        run_module, "download_ticker_prices", lambda *args, **kwargs: ticker_price_df
+    )
+    cache = SimulationCache(tmp_path)
+
+    expected_df = run_module.run(seed=3, num_of_simulation=10, processes=1)
+    run_module.run(seed=3, num_of_simulation=10, processes=1, cache=cache)
+    ticker_price_df["BBB"] = changed_df
+    cached_df = run_module.run(seed=3, num_of_simulation=10, processes=1, cache=cache)
+
+    assert cache.stats["memory_hits"] == 1
+    assert cache.stats["misses"] == 3
+    pd.testing.assert_frame_equal(
+        cached_df[cached_df["ticker"] == "AAA"],
+        expected_df[expected_df["ticker"] == "AAA"],
+    )
+    assert not cached_df[cached_df["ticker"] == "BBB"].equals(
+        expected_df[expected_df["ticker"] == "BBB"].reset_index(drop=True)
+    )
+
+
+def test_aggregate_reductions_are_cached_apart(monkeypatch, tmp_path, price_df):
+    monkeypatch.setattr(
+        run_module,
+        "download_ticker_prices",
+        lambda *args, **kwargs: {"AAA": price_df},
+    )
+    cache = SimulationCache(tmp_path)
+    options = dict(
+        seed=3, num_of_simulation=10, processes=1, aggregate=True, cache=cache
+    )
+
+    run_module.run(**options)
+    run_module.run(chunk_size=DEFAULT_CHUNK_SIZE, **options)
+
+    # updated one chunk after the other, or merged from chunk aggregates
+    assert cache.stats["misses"] == 2
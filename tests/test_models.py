@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+from stock_price_simulator.models import (
+    RETURN_MODELS,
+    BlockBootstrapModel,
+    BootstrapModel,
+    GBMModel,
+    StudentTModel,
+    fit_model,
+)
+from stock_price_simulator.scheduler import simulate_in_chunks
+from stock_price_simulator.simulate import simulate, simulate_chunks
+
+
+@pytest.mark.parametrize("model", list(RETURN_MODELS))
+def test_chunks_match_whole_run(price_df, trading_dates, model):
+    result = simulate(
+        "AAA", price_df, trading_dates, 150, as_result=True, seed=1, model=model
+    )
+    chunks = simulate_chunks(
+        "AAA",
+        price_df,
+        trading_dates,
+        150,
+        chunk_size=64,
+        as_result=True,
+        seed=1,
+        model=model,
+    )
+
+    assert result.prices.shape == (150, 20)
+    np.testing.assert_array_equal(
+        np.concatenate([chunk.prices for chunk in chunks]), result.prices
+    )
+
+
+def test_scheduler_selects_model(price_df, trading_dates):
+    results = simulate_in_chunks(
+        {"AAA": price_df},
+        trading_dates,
+        100,
+        chunk_size=32,
+        processes=2,
+        seed=2,
+        model="block_bootstrap",
+        model_options={"block_size": 3},
+    )
+    expected = simulate(
+        "AAA",
+        price_df,
+        trading_dates,
+        100,
+        as_result=True,
+        seed=2,
+        model="block_bootstrap",
+        model_options={"block_size": 3},
+    )
+
+    np.testing.assert_array_equal(results["AAA"].prices, expected.prices)
+
+
+def test_gbm_fit():
+    rng = np.random.default_rng(3)
+    prices = 100 * np.exp(np.cumsum(rng.normal(0.001 - 0.02**2 / 2, 0.02, 5000)))
+
+    model = GBMModel.fit(prices)
+
+    assert model.sigma == pytest.approx(0.02, rel=0.05)
+    assert model.mu == pytest.approx(0.001, abs=0.0006)
+    returns = model.sample(np.random.default_rng(4), (20000, 10))
+    assert returns.mean() == pytest.approx(model.mu, abs=0.0003)
+
+
+def test_student_t_matches_std():
+    model = StudentTModel(0.02, dof=5)
+
+    returns = model.sample(np.random.default_rng(5), (20000, 10))
+
+    assert returns.std() == pytest.approx(0.02, rel=0.05)
+    with pytest.raises(ValueError):
+        StudentTModel(0.02, dof=2)
+
+
+def test_bootstrap_resamples_history():
+    returns = np.array([0.01, -0.02, 0.03, 0.0, -0.01])
+
+    sampled = BootstrapModel(returns).sample(np.random.default_rng(6), (50, 20))
+    assert set(np.unique(sampled)) <= set(returns)
+
+    sampled = BlockBootstrapModel(returns, block_size=3).sample(
+        np.random.default_rng(6), (50, 7)
+    )
+    indices = np.searchsorted(np.sort(returns), sampled)
+    positions = np.argsort(returns)[indices]
+    # within a block, the returns are consecutive days of the history
+    assert ((positions[:, 1:3] - positions[:, 0:2]) % len(returns) == 1).all()
+
+
+def test_unknown_model(price_df):
+    with pytest.raises(ValueError):
+        fit_model("heston", price_df["Adj Close"])
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from stock_price_simulator.multi_asset import (
+    cholesky_factor,
+    estimate_covariance,
+    simulate_correlated,
+)
+from stock_price_simulator.simulate import pct_change_std
+
+
+@pytest.fixture
+def ticker_price_df():
+    rng = np.random.default_rng(0)
+    covariance = np.array([[4.0, 3.0, 0.0], [3.0, 4.0, 0.0], [0.0, 0.0, 1.0]]) * 1e-4
+    returns = rng.multivariate_normal(np.zeros(3), covariance, 500)
+    dates = pd.bdate_range("2020-01-01", periods=501)
+    return {
+        ticker: pd.DataFrame(
+            {
+                "Date": dates,
+                "Adj Close": 100 * np.cumprod(np.r_[1, 1 + returns[:, i]]),
+            }
+        )
+        for (i, ticker) in enumerate(["AAA", "BBB", "CCC"])
+    }
+
+
+@pytest.fixture
+def trading_dates():
+    return pd.bdate_range("2022-01-03", periods=30).to_list()
+
+
+def test_estimate_covariance(ticker_price_df):
+    covariance = estimate_covariance(ticker_price_df)
+
+    assert list(covariance.columns) == ["AAA", "BBB", "CCC"]
+    for ticker in covariance:
+        np.testing.assert_allclose(
+            covariance.loc[ticker, ticker],
+            pct_change_std(ticker_price_df[ticker]["Adj Close"]) ** 2,
+        )
+    correlation = covariance.loc["AAA", "BBB"] / np.sqrt(
+        covariance.loc["AAA", "AAA"] * covariance.loc["BBB", "BBB"]
+    )
+    assert correlation == pytest.approx(0.75, abs=0.1)
+
+
+def test_cholesky_factor_of_indefinite_matrix():
+    factor = cholesky_factor([[1.0, 1.0], [1.0, 1.0 - 1e-9]])
+
+    np.testing.assert_allclose(factor @ factor.T, [[1.0, 1.0], [1.0, 1.0]], atol=1e-6)
+
+
+def test_simulate_correlated(ticker_price_df, trading_dates):
+    results = simulate_correlated(ticker_price_df, trading_dates, 4000, seed=1)
+
+    assert list(results) == ["AAA", "BBB", "CCC"]
+    for (ticker, result) in results.items():
+        assert result.prices.shape == (4000, 30)
+        assert result.prices.flags.c_contiguous
+        assert result.to_long_frame()["ticker"].unique().tolist() == [ticker]
+
+    returns = {
+        ticker: result.prices[:, 1:] / result.prices[:, :-1] - 1
+        for (ticker, result) in results.items()
+    }
+    assert np.corrcoef(returns["AAA"].ravel(), returns["BBB"].ravel())[
+        0, 1
+    ] == pytest.approx(0.75, abs=0.1)
+    assert np.corrcoef(returns["AAA"].ravel(), returns["CCC"].ravel())[
+        0, 1
+    ] == pytest.approx(0, abs=0.05)
+
+
+def test_simulate_correlated_is_reproducible(ticker_price_df, trading_dates):
+    first = simulate_correlated(ticker_price_df, trading_dates, 5, seed=2)
+    second = simulate_correlated(ticker_price_df, trading_dates, 5, seed=2)
+
+    for ticker in first:
+        np.testing.assert_array_equal(first[ticker].prices, second[ticker].prices)
+
+
+def test_run_multi_asset(monkeypatch, ticker_price_df):
+    from stock_price_simulator import run as run_module
+
+    monkeypatch.setattr(
+        run_module, "download_ticker_prices", lambda *args, **kwargs: ticker_price_df
+    )
+
+    results = run_module.run(as_result=True, seed=3, multi_asset=True)
+
+    assert list(results) == ["AAA", "BBB", "CCC"]
+    assert results["AAA"].prices.shape[0] == 5
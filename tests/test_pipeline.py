@@ -0,0 +1,90 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from click.testing import CliRunner
+
+from stock_price_simulator.pipeline import run_pipelined
+from stock_price_simulator.run import cli
+from stock_price_simulator.simulate import simulate
+
+
+class SlowSource:
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.fetching = 0
+        self.max_fetching = 0
+
+    def fetch(self, ticker, start, end):
+        with self.lock:
+            self.fetching += 1
+            self.max_fetching = max(self.max_fetching, self.fetching)
+        time.sleep(self.delay)
+        with self.lock:
+            self.fetching -= 1
+
+        if ticker == "FAIL":
+            raise ConnectionError("no route to host")
+
+        rng = np.random.default_rng(len(ticker))
+        return pd.DataFrame(
+            {
+                "Date": pd.bdate_range(start, periods=30),
+                "Adj Close": 100 * np.cumprod(1 + rng.normal(0, 0.02, 30)),
+            }
+        )
+
+
+def test_run_pipelined(capsys):
+    source = SlowSource()
+    ticker_symbols = ["A", "BB", "FAIL", "CCC", "DDDD", "EEEEE"]
+
+    results = run_pipelined(
+        ticker_symbols,
+        start="2021-01-01",
+        source=source,
+        num_of_simulation=3,
+        processes=2,
+        fetch_concurrency=2,
+        max_pending=1,
+        seed=2,
+        as_result=True,
+    )
+
+    assert list(results) == ["A", "BB", "CCC", "DDDD", "EEEEE"]
+    assert source.max_fetching <= 2
+    assert "FAIL download failed" in capsys.readouterr().out
+
+    price_df = source.fetch("CCC", "2021-01-01", None)
+    expected = simulate("CCC", price_df, num_of_simulation=3, as_result=True, seed=2)
+    np.testing.assert_array_equal(results["CCC"].prices, expected.prices)
+    assert results["CCC"].dates.equals(expected.dates)
+
+
+def test_run_pipelined_frame():
+    simulated_price_df = run_pipelined(
+        ["A", "BB"],
+        start="2021-01-01",
+        source=SlowSource(0),
+        num_of_simulation=2,
+        processes=1,
+    )
+
+    assert simulated_price_df["ticker"].unique().tolist() == ["A", "BB"]
+
+
+def test_cli_rejects_options_pipelined_ignores():
+    for args in [
+        ["--aggregate"],
+        ["--tolerance", "0.01"],
+        ["--multi-asset"],
+        ["--chunk-size", "8"],
+        ["--shared-memory"],
+        ["--cache-dir", "cache"],
+    ]:
+        result = CliRunner().invoke(cli, ["--pipelined", *args])
+
+        assert result.exit_code == 2
+        assert f"cannot be combined with {args[0]}" in result.output
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from stock_price_simulator.result import SimulationResult
+from stock_price_simulator.simulate import simulate
+
+
+def test_long_frame_matches_simulate(price_df, trading_dates):
+    result = simulate("AAA", price_df, trading_dates, 6, as_result=True, seed=11)
+    expected_df = simulate("AAA", price_df, trading_dates, 6, seed=11)
+
+    assert result.prices.shape == (6, 20)
+    pd.testing.assert_frame_equal(result.to_long_frame(), expected_df)
+
+
+def test_wide_frame_and_quantiles(price_df, trading_dates):
+    result = simulate("AAA", price_df, trading_dates, 50, as_result=True)
+
+    wide_df = result.to_wide_frame()
+    assert wide_df.shape == (20, 50)
+    assert wide_df.index.tolist() == trading_dates
+    np.testing.assert_array_equal(wide_df.to_numpy(), result.prices.T)
+
+    quantile_df = result.quantiles([0.1, 0.9])
+    assert (quantile_df[0.1] <= quantile_df[0.9]).all()
+
+    summary_df = result.summary()
+    assert list(summary_df.columns) == ["mean", "std", "5%", "50%", "95%"]
+    np.testing.assert_allclose(summary_df["mean"], result.prices.mean(axis=0))
+
+
+def test_float32_prices(price_df, trading_dates):
+    result = simulate(
+        "AAA", price_df, trading_dates, 4, as_result=True, dtype=np.float32
+    )
+
+    assert result.prices.dtype == np.float32
+
+
+def test_concat_chunks(trading_dates):
+    prices = np.arange(5 * 20, dtype=float).reshape(5, 20)
+    chunks = [
+        SimulationResult("AAA", prices[3:], trading_dates, 3),
+        SimulationResult("AAA", prices[:3], trading_dates, 0),
+    ]
+
+    result = SimulationResult.concat(chunks)
+
+    np.testing.assert_array_equal(result.prices, prices)
+    assert result.simulation_ids.tolist() == [0, 1, 2, 3, 4]
+
+
+def test_shape_mismatch(trading_dates):
+    with pytest.raises(ValueError):
+        SimulationResult("AAA", np.ones((2, 3)), trading_dates)
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from stock_price_simulator import run as run_module
+from stock_price_simulator.scheduler import plan_chunks, simulate_in_chunks
+from stock_price_simulator.simulate import simulate
+
+
+@pytest.fixture
+def ticker_price_df():
+    rng = np.random.default_rng(0)
+    return {
+        ticker: pd.DataFrame(
+            {
+                "Date": pd.bdate_range("2021-01-01", periods=40),
+                "Adj Close": 100 * np.cumprod(1 + rng.normal(0, 0.02, 40)),
+            }
+        )
+        for ticker in ["AAA", "BBB"]
+    }
+
+
+@pytest.fixture
+def trading_dates():
+    return pd.bdate_range("2022-01-03", periods=10).to_list()
+
+
+def test_plan_chunks():
+    assert plan_chunks(10, 4) == [(0, 4), (4, 8), (8, 10)]
+    assert plan_chunks(0, 4) == []
+    with pytest.raises(ValueError):
+        plan_chunks(10, 0)
+
+
+@pytest.mark.parametrize("processes, chunk_size", [(1, 100), (2, 7), (3, 64)])
+def test_chunks_match_simulate(ticker_price_df, trading_dates, processes, chunk_size):
+    results = simulate_in_chunks(
+        ticker_price_df,
+        trading_dates,
+        100,
+        chunk_size=chunk_size,
+        processes=processes,
+        seed=4,
+    )
+
+    assert list(results) == ["AAA", "BBB"]
+    for (ticker, price_df) in ticker_price_df.items():
+        expected = simulate(
+            ticker, price_df, trading_dates, 100, as_result=True, seed=4
+        )
+        np.testing.assert_array_equal(results[ticker].prices, expected.prices)
+
+
+def test_run_with_chunks(ticker_price_df, monkeypatch):
+    monkeypatch.setattr(
+        run_module, "download_ticker_prices", lambda *args, **kwargs: ticker_price_df
+    )
+
+    expected_df = run_module.run(seed=8, num_of_simulation=20)
+    chunked_df = run_module.run(seed=8, num_of_simulation=20, chunk_size=6)
+
+    pd.testing.assert_frame_equal(chunked_df, expected_df)
@@ -0,0 +1,125 @@
+import asyncio
+import json
+
+import numpy as np
+
+from stock_price_simulator.service import (
+    ServiceOverloaded,
+    SimulationService,
+    load_test,
+    start_server,
+)
+from stock_price_simulator.simulate import next_year_trading_dates, simulate
+from stock_price_simulator.sources import SyntheticSource
+
+
+def _service(**kwargs):
+    return SimulationService(SyntheticSource(), processes=1, **kwargs)
+
+
+def test_coalesces_identical_requests():
+    async def main():
+        async with _service() as service:
+            responses = await asyncio.gather(
+                *[service.simulate("AAA", 10, 100) for _ in range(5)]
+            )
+            return service.stats, responses
+
+    stats, responses = asyncio.run(main())
+
+    assert stats["coalesced"] == 4
+    assert stats["batches"] == 1
+    assert all(response is responses[0] for response in responses)
+
+
+def test_batches_requests_of_a_ticker():
+    async def main():
+        async with _service() as service:
+            seeded = await asyncio.gather(
+                service.simulate("AAA", 10, 100, seed=1),
+                service.simulate("AAA", 10, 300, seed=1),
+            )
+            seeded_stats = dict(service.stats)
+            unseeded = await asyncio.gather(
+                service.simulate("AAA", 10, 100),
+                service.simulate("AAA", 10, 300),
+            )
+            return seeded_stats, service.stats, seeded, unseeded
+
+    seeded_stats, stats, seeded, unseeded = asyncio.run(main())
+
+    # seeded requests take the first paths of one run, like simulate
+    assert seeded_stats["batches"] == 1
+    assert seeded_stats["simulations"] == 300
+    price_df = SyntheticSource().fetch("AAA", "2020-01-01", "2021-12-31")
+    trading_dates = next_year_trading_dates(price_df["Date"].max())[:10]
+    expected = simulate("AAA", price_df, trading_dates, 100, seed=1, as_result=True)
+    np.testing.assert_allclose(
+        seeded[0]["summary"]["mean"], expected.prices.mean(axis=0)
+    )
+    # unseeded requests take disjoint paths of one run
+    assert stats["batches"] == 2
+    assert stats["simulations"] == 700
+    assert [response["num_of_simulation"] for response in unseeded] == [100, 300]
+
+
+def test_sheds_load():
+    async def main():
+        async with _service(max_pending=2) as service:
+            return await asyncio.gather(
+                *[service.simulate(f"T{i}", 5, 50) for i in range(5)],
+                return_exceptions=True,
+            )
+
+    responses = asyncio.run(main())
+
+    assert sum(isinstance(r, ServiceOverloaded) for r in responses) == 3
+    assert sum(isinstance(r, dict) for r in responses) == 2
+
+
+def test_server():
+    async def main():
+        async with _service() as service:
+            # one request at a time, the others wait to be read
+            server = await start_server(service, port=0, max_in_flight=1)
+            port = server.sockets[0].getsockname()[1]
+            async with server:
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                for job in [
+                    {
+                        "id": 1,
+                        "ticker": "AAA",
+                        "num_of_days": 5,
+                        "num_of_simulation": 20,
+                    },
+                    {"id": 2, "ticker": "AAA", "num_of_simulation": 0},
+                    {"id": 3, "ticker": "AAA", "num_of_days": 0},
+                    {"id": 4, "ticker": "BBB", "num_of_days": 3},
+                ]:
+                    writer.write((json.dumps(job) + "\n").encode())
+                writer.write_eof()
+                responses = [json.loads(line) async for line in reader]
+                writer.close()
+            return responses
+
+    responses = {response["id"]: response for response in asyncio.run(main())}
+
+    assert responses[1]["ok"]
+    assert len(responses[1]["result"]["summary"]["date"]) == 5
+    assert "ValueError" in responses[2]["error"]
+    assert responses[3]["error"] == "ValueError: num_of_days must be positive, got 0"
+    assert len(responses[4]["result"]["summary"]["date"]) == 3
+
+
+def test_load_test():
+    async def main():
+        async with _service(max_pending=4) as service:
+            return await load_test(
+                service, 60, concurrency=20, num_of_tickers=3, num_of_simulation=50
+            )
+
+    report = asyncio.run(main())
+
+    assert report["completed"] + report["shed"] == 60
+    assert report["failed"] == 0
+    assert report["service"]["batches"] <= report["completed"]
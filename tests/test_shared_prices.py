@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from stock_price_simulator import run as run_module
+from stock_price_simulator.shared_prices import (
+    attach_prices,
+    pack_prices,
+    simulate_shared,
+)
+from stock_price_simulator.simulate import simulate
+
+
+@pytest.fixture
+def ticker_price_df():
+    rng = np.random.default_rng(0)
+    ticker_price_df = {}
+    for (ticker, periods) in [("AAA", 40), ("BBB", 25), ("CCC", 60)]:
+        ticker_price_df[ticker] = pd.DataFrame(
+            {
+                "Date": pd.bdate_range("2021-01-01", periods=periods),
+                "Adj Close": 100 * np.cumprod(1 + rng.normal(0, 0.02, periods)),
+            }
+        )
+    return ticker_price_df
+
+
+@pytest.fixture
+def shared_prices(ticker_price_df):
+    shm, descriptors = pack_prices(ticker_price_df)
+    yield shm, descriptors
+    shm.close()
+    shm.unlink()
+
+
+def test_pack_and_attach(ticker_price_df, shared_prices):
+    shm, descriptors = shared_prices
+
+    assert [d[0] for d in descriptors] == list(ticker_price_df)
+    for (ticker, offset, length) in descriptors:
+        np.testing.assert_array_equal(
+            attach_prices(shm.name, offset, length),
+            ticker_price_df[ticker]["Adj Close"].to_numpy(),
+        )
+
+
+def test_simulate_shared_matches_simulate(ticker_price_df, shared_prices):
+    shm, descriptors = shared_prices
+    trading_dates = pd.bdate_range("2022-01-03", periods=10).to_list()
+
+    shared_df = simulate_shared(shm.name, descriptors[1], trading_dates, 3, seed=7)
+    expected_df = simulate("BBB", ticker_price_df["BBB"], trading_dates, 3, seed=7)
+
+    pd.testing.assert_frame_equal(shared_df, expected_df)
+
+
+def test_run_with_shared_memory(ticker_price_df, monkeypatch):
+    monkeypatch.setattr(
+        run_module, "download_ticker_prices", lambda *args, **kwargs: ticker_price_df
+    )
+
+    simulated_price_df = run_module.run(use_shared_memory=True)
+
+    assert set(simulated_price_df["ticker"]) == set(ticker_price_df)
+    assert len(simulated_price_df) == 3 * 5 * simulated_price_df["date"].nunique()
+
+
+def test_run_with_seed_is_reproducible(ticker_price_df, monkeypatch):
+    monkeypatch.setattr(
+        run_module, "download_ticker_prices", lambda *args, **kwargs: ticker_price_df
+    )
+
+    first_df = run_module.run(seed=3)
+
+    pd.testing.assert_frame_equal(
+        run_module.run(use_shared_memory=True, seed=3), first_df
+    )
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from stock_price_simulator.result import SimulationResult
+from stock_price_simulator.simulate import simulate, simulate_chunks
+
+
+def test_vectorized_matches_loop(price_df, trading_dates):
+    loop_df = simulate("AAA", price_df, trading_dates, 70, method="loop", seed=42)
+    vectorized_df = simulate(
+        "AAA", price_df, trading_dates, 70, method="vectorized", seed=42
+    )
+
+    pd.testing.assert_frame_equal(loop_df, vectorized_df)
+
+
+def test_simulate_schema(price_df, trading_dates):
+    simulated_df = simulate("AAA", price_df, trading_dates, 3)
+
+    assert list(simulated_df.columns) == ["ticker", "simulation_id", "date", "price"]
+    assert len(simulated_df) == 3 * len(trading_dates)
+    assert (simulated_df["ticker"] == "AAA").all()
+    assert simulated_df["simulation_id"].tolist() == [
+        i for i in range(3) for _ in trading_dates
+    ]
+    assert simulated_df["date"].tolist() == trading_dates * 3
+    assert pd.api.types.is_datetime64_any_dtype(simulated_df["date"])
+
+
+def test_unknown_method(price_df, trading_dates):
+    with pytest.raises(ValueError):
+        simulate("AAA", price_df, trading_dates, method="unknown")
+
+
+def test_seed_is_reproducible(price_df, trading_dates):
+    first_df = simulate("AAA", price_df, trading_dates, 3, seed=1)
+
+    pd.testing.assert_frame_equal(
+        simulate("AAA", price_df, trading_dates, 3, seed=1), first_df
+    )
+    assert not simulate("AAA", price_df, trading_dates, 3, seed=2).equals(first_df)
+    assert not simulate("BBB", price_df, trading_dates, 3, seed=1)["price"].equals(
+        first_df["price"]
+    )
+
+
+def test_seed_is_independent_of_chunking(price_df, trading_dates):
+    expected = simulate("AAA", price_df, trading_dates, 150, as_result=True, seed=9)
+
+    for chunk_size in [1, 7, 64, 100]:
+        chunks = simulate_chunks(
+            "AAA",
+            price_df,
+            trading_dates,
+            150,
+            chunk_size=chunk_size,
+            as_result=True,
+            seed=9,
+        )
+        result = SimulationResult.concat(list(chunks))
+        np.testing.assert_array_equal(result.prices, expected.prices)
+
+
+def test_unseeded_simulations_differ(price_df, trading_dates):
+    first_df = simulate("AAA", price_df, trading_dates, 3)
+
+    assert not simulate("AAA", price_df, trading_dates, 3).equals(first_df)
@@ -0,0 +1,51 @@
+import pandas as pd
+import pytest
+
+from stock_price_simulator import run as run_module
+from stock_price_simulator.simulate import simulate, simulate_chunks
+from stock_price_simulator.sink import DatasetSink, read_dataset
+
+pytest.importorskip("pyarrow")
+
+
+def test_chunks_match_simulate(price_df, trading_dates):
+    chunk_dfs = list(
+        simulate_chunks("AAA", price_df, trading_dates, 7, chunk_size=3, seed=3)
+    )
+    expected_df = simulate("AAA", price_df, trading_dates, 7, seed=3)
+
+    assert [chunk_df["simulation_id"].nunique() for chunk_df in chunk_dfs] == [3, 3, 1]
+    pd.testing.assert_frame_equal(pd.concat(chunk_dfs, ignore_index=True), expected_df)
+
+
+@pytest.mark.parametrize("format", ["parquet", "arrow"])
+def test_dataset_sink_round_trip(price_df, trading_dates, tmp_path, format):
+    sink = DatasetSink(tmp_path, format)
+
+    num_of_rows = simulate(
+        "AAA", price_df, trading_dates, 5, sink=sink, chunk_size=2, seed=5
+    )
+    expected_df = simulate("AAA", price_df, trading_dates, 5, seed=5)
+
+    assert num_of_rows == len(expected_df)
+    assert len(list((tmp_path / "ticker=AAA").iterdir())) == 3
+    pd.testing.assert_frame_equal(
+        read_dataset(tmp_path, format), expected_df, check_dtype=False
+    )
+
+
+def test_rerun_replaces_the_dataset(price_df, tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        run_module,
+        "download_ticker_prices",
+        lambda *args, **kwargs: {"AAA": price_df},
+    )
+    kwargs = {"output_dir": tmp_path, "seed": 4, "chunk_size": 2, "processes": 1}
+
+    run_module.run(num_of_simulation=6, **kwargs)
+    num_of_rows = run_module.run(num_of_simulation=3, **kwargs)
+
+    # no parts of the first run with more simulations are left behind
+    simulated_price_df = read_dataset(tmp_path)
+    assert len(simulated_price_df) == num_of_rows
+    assert simulated_price_df["simulation_id"].max() == 2
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from stock_price_simulator.sources import CachedSource, LocalDirectorySource
+from stock_price_simulator.ticker import download_ticker_prices
+
+pytest.importorskip("pyarrow")
+
+
+class FakeSource:
+    def __init__(self):
+        self.requests = []
+
+    def fetch(self, ticker, start, end):
+        self.requests.append((ticker, start, end))
+        dates = pd.bdate_range(start, end, inclusive="left")
+        return pd.DataFrame(
+            {"Date": dates, "Adj Close": np.arange(len(dates), dtype=float)}
+        )
+
+
+def test_cached_source_fetches_missing_ranges(tmp_path):
+    source = FakeSource()
+    cached_source = CachedSource(source, tmp_path)
+
+    price_df = cached_source.fetch("AAA", "2021-02-01", "2021-03-01")
+    assert source.requests == [("AAA", "2021-02-01", "2021-03-01")]
+
+    pd.testing.assert_frame_equal(
+        cached_source.fetch("AAA", "2021-02-01", "2021-03-01"), price_df
+    )
+    assert len(source.requests) == 1
+
+    extended_df = cached_source.fetch("AAA", "2021-01-01", "2021-04-01")
+    assert source.requests[1:] == [
+        ("AAA", "2021-01-01", "2021-02-01"),
+        ("AAA", "2021-03-01", "2021-04-01"),
+    ]
+    assert extended_df["Date"].tolist() == list(
+        pd.bdate_range("2021-01-01", "2021-04-01", inclusive="left")
+    )
+
+    # a fresh cache instance reads the same entries from disk
+    CachedSource(source, tmp_path).fetch("AAA", "2021-01-15", "2021-03-15")
+    assert len(source.requests) == 3
+
+
+class FlakySource(FakeSource):
+    """Returns no prices, like a failed download, while down is set."""
+
+    down = False
+
+    def fetch(self, ticker, start, end):
+        if self.down:
+            self.requests.append((ticker, start, end))
+            return pd.DataFrame()
+        return super().fetch(ticker, start, end)
+
+
+def test_cached_source_retries_failed_ranges(tmp_path):
+    source = FlakySource()
+    cached_source = CachedSource(source, tmp_path)
+    cached_source.fetch("AAA", "2021-02-01", "2021-03-01")
+
+    source.down = True
+    price_df = cached_source.fetch("AAA", "2021-01-01", "2021-04-01")
+    assert price_df["Date"].min() == pd.Timestamp("2021-02-01")
+
+    # the outage is not cached as a gap
+    source.down = False
+    price_df = cached_source.fetch("AAA", "2021-01-01", "2021-04-01")
+    assert source.requests[-2:] == [
+        ("AAA", "2021-01-01", "2021-02-01"),
+        ("AAA", "2021-03-01", "2021-04-01"),
+    ]
+    assert price_df["Date"].tolist() == list(
+        pd.bdate_range("2021-01-01", "2021-04-01", inclusive="left")
+    )
+
+
+def test_local_directory_source(tmp_path):
+    pd.DataFrame(
+        {
+            "ticker": "AAA",
+            "Date": pd.bdate_range("2021-01-01", periods=30),
+            "Adj Close": np.linspace(10, 20, 30),
+        }
+    ).to_csv(tmp_path / "AAA.csv", index=False)
+
+    ticker_price_df = download_ticker_prices(
+        ["AAA", "MISSING"],
+        start="2021-01-05",
+        end="2021-01-12",
+        source=LocalDirectorySource(tmp_path),
+    )
+
+    assert list(ticker_price_df) == ["AAA"]
+    price_df = ticker_price_df["AAA"]
+    assert list(price_df.columns) == ["ticker", "Date", "Adj Close"]
+    assert price_df["Date"].tolist() == list(pd.bdate_range("2021-01-05", "2021-01-11"))
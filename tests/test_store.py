@@ -0,0 +1,124 @@
+import pickle
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from stock_price_simulator import run as run_module
+from stock_price_simulator.simulate import simulate
+from stock_price_simulator.store import ResultStore
+
+
+@pytest.fixture
+def store(tmp_path, price_df, trading_dates):
+    store = ResultStore.create(tmp_path, ["AAA", "BBB"], trading_dates, 100)
+    for ticker in store.tickers:
+        simulate(
+            ticker,
+            price_df,
+            trading_dates,
+            100,
+            sink=store,
+            chunk_size=30,
+            seed=1,
+        )
+    store.flush()
+
+    return ResultStore(tmp_path)
+
+
+def _terminal_mean(store, ticker):
+    return store.prices(ticker, start="2022-01-21").mean()
+
+
+def test_chunks_written_at_their_rows(store, price_df, trading_dates):
+    expected = simulate("BBB", price_df, trading_dates, 100, as_result=True, seed=1)
+
+    np.testing.assert_array_equal(store.paths("BBB"), expected.prices)
+    assert store.tickers == ["AAA", "BBB"]
+    assert "CCC" not in store
+    with pytest.raises(KeyError):
+        store.paths("CCC")
+
+
+def test_slices_are_views(store):
+    prices = store.prices("AAA", "2022-01-05", "2022-01-07", simulations=slice(10, 20))
+
+    assert prices.shape == (10, 3)
+    assert isinstance(prices, np.memmap)
+    assert not prices.flags.writeable
+    np.testing.assert_array_equal(prices, store.paths("AAA")[10:20, 2:5])
+    assert store.prices("AAA", simulations=[3, 1]).shape == (2, 20)
+
+
+def test_read(store):
+    result = store.read("AAA", start="2022-01-10", simulations=slice(40, 50))
+
+    assert result.dates[0] == pd.Timestamp("2022-01-10")
+    assert list(result.simulation_ids) == list(range(40, 50))
+    with pytest.raises(ValueError):
+        store.read("AAA", simulations=[1, 2])
+
+
+def test_concurrent_readers(store):
+    assert pickle.loads(pickle.dumps(store)).tickers == store.tickers
+
+    with Pool(2) as pool:
+        means = pool.starmap(_terminal_mean, [(store, "AAA"), (store, "BBB")])
+
+    assert means == [_terminal_mean(store, "AAA"), _terminal_mean(store, "BBB")]
+
+
+def test_from_frame_round_trip(tmp_path, store):
+    simulated_price_df = store.to_long_frame()
+
+    copy = ResultStore.from_frame(tmp_path / "copy", simulated_price_df)
+
+    pd.testing.assert_frame_equal(copy.to_long_frame(), simulated_price_df)
+
+
+def test_from_frame_with_dates_per_ticker(tmp_path, price_df, trading_dates):
+    simulated_price_df = pd.concat(
+        [
+            simulate("AAA", price_df, trading_dates, 4, seed=1),
+            # a history ending a day later, and fewer simulations
+            simulate(
+                "BBB", price_df, trading_dates[1:] + [pd.Timestamp("2022-01-31")], 2
+            ),
+        ],
+        ignore_index=True,
+    )
+
+    store = ResultStore.from_frame(tmp_path, simulated_price_df)
+
+    assert store.paths("AAA").shape == (4, 20)
+    assert store.paths("BBB").shape == (2, 20)
+    assert store.dates("BBB")[-1] == pd.Timestamp("2022-01-31")
+    pd.testing.assert_frame_equal(
+        store.to_long_frame(), simulated_price_df, check_index_type=False
+    )
+
+
+def test_run_to_store(tmp_path, monkeypatch, price_df):
+    monkeypatch.setattr(
+        run_module,
+        "download_ticker_prices",
+        lambda *args, **kwargs: {"AAA": price_df, "BBB": price_df},
+    )
+
+    num_of_rows = run_module.run(
+        output_dir=tmp_path,
+        output_format="memmap",
+        seed=2,
+        num_of_simulation=40,
+        chunk_size=16,
+        processes=2,
+    )
+
+    store = ResultStore(tmp_path)
+    expected_df = run_module.run(seed=2, num_of_simulation=40)
+    assert num_of_rows == len(expected_df)
+    pd.testing.assert_frame_equal(
+        store.to_long_frame(), expected_df, check_dtype=False, check_index_type=False
+    )
@@ -0,0 +1,131 @@
+import numpy as np
+import pytest
+
+from stock_price_simulator.simulate import simulate_prices
+from stock_price_simulator.sweep import scenario_grid, simulate_sweep, sweep
+
+
+def _sweep(price_df, trading_dates, scenarios, **kwargs):
+    return simulate_sweep(
+        "AAA",
+        price_df["Adj Close"].to_numpy(),
+        trading_dates,
+        scenarios,
+        num_of_simulation=200,
+        seed=3,
+        **kwargs,
+    )
+
+
+@pytest.mark.parametrize("model", ["normal", "gbm", "bootstrap"])
+def test_unchanged_scenario_matches_simulate(price_df, trading_dates, model):
+    sweep_result = _sweep(price_df, trading_dates, [{}], model=model)
+
+    expected = simulate_prices(
+        "AAA",
+        price_df["Adj Close"].to_numpy(),
+        trading_dates,
+        200,
+        as_result=True,
+        seed=3,
+        model=model,
+    )
+    np.testing.assert_allclose(sweep_result[0].prices, expected.prices, rtol=1e-12)
+    assert list(sweep_result[0].dates) == trading_dates
+
+
+def test_scenarios_transform_the_same_draws(price_df, trading_dates):
+    last_price = price_df["Adj Close"].iat[-1]
+    scenarios = scenario_grid(
+        volatility_shocks=(1.0, 0.0, 2.0), horizons=(None, 5), price_shocks=(1.0, 0.8)
+    )
+
+    sweep_result = _sweep(price_df, trading_dates, scenarios)
+
+    assert len(sweep_result) == 12
+    full, short, shocked = sweep_result[0], sweep_result[2], sweep_result[1]
+    # a shorter horizon is a prefix of the same paths
+    assert list(short.dates) == trading_dates[:5]
+    np.testing.assert_array_equal(short.prices, full.prices[:, :5])
+    # a starting price only rescales them
+    np.testing.assert_allclose(shocked.prices, 0.8 * full.prices)
+    # without volatility, the zero drift normal model stays at the start price
+    np.testing.assert_allclose(sweep_result[4].prices, last_price)
+    # doubling the volatility doubles the daily deviations
+    np.testing.assert_allclose(
+        sweep_result[8].prices[:, 0] - last_price,
+        2 * (full.prices[:, 0] - last_price),
+    )
+
+    summary_df = sweep_result.terminal_summary()
+    assert summary_df.index.name == "scenario"
+    assert summary_df.loc[2, "horizon"] == 5
+    assert summary_df.loc[1, "start_price"] == pytest.approx(0.8 * last_price)
+    assert summary_df.loc[8, "std"] > summary_df.loc[0, "std"]
+    assert summary_df.loc[4, "value_at_risk"] == pytest.approx(0)
+
+
+def test_common_random_numbers_reduce_noise(price_df, trading_dates):
+    scenarios = [
+        {"name": "base"},
+        {"name": "stressed", "volatility_shock": 1.2},
+    ]
+
+    differences_df = _sweep(price_df, trading_dates, scenarios).differences()
+
+    assert list(differences_df.index) == ["base", "stressed"]
+    assert differences_df.loc["base", "mean_difference"] == 0
+    # paired paths have a far smaller standard error than independent runs
+    independent_stderr = np.hypot(
+        *[
+            _sweep(price_df, trading_dates, [scenario])[0].terminal_prices.std()
+            for scenario in [{}, {"volatility_shock": 1.2}]
+        ]
+    ) / np.sqrt(200)
+    assert differences_df.loc["stressed", "stderr"] < independent_stderr / 3
+
+
+def test_invalid_scenarios(price_df, trading_dates):
+    with pytest.raises(ValueError, match="unknown scenario fields"):
+        _sweep(price_df, trading_dates, [{"volatility": 2}])
+    with pytest.raises(ValueError, match="horizon"):
+        _sweep(price_df, trading_dates, [{"horizon": 21}])
+    with pytest.raises(ValueError, match="unique"):
+        _sweep(price_df, trading_dates, [{"name": "a"}, {"name": "a"}])
+
+
+def test_sweep_tickers(price_df, trading_dates):
+    scenarios = {
+        "AAA": [{"name": "base"}],
+        "BBB": [{"name": "base"}, {"name": "crash", "price_shock": 0.5}],
+    }
+
+    sweep_results = sweep(
+        {"AAA": price_df, "BBB": price_df},
+        scenarios,
+        trading_dates,
+        num_of_simulation=50,
+        processes=2,
+        seed=1,
+    )
+
+    assert list(sweep_results["BBB"]) == ["base", "crash"]
+    long_df = sweep_results["BBB"].to_long_frame()
+    assert list(long_df.columns) == [
+        "scenario",
+        "ticker",
+        "simulation_id",
+        "date",
+        "price",
+    ]
+    assert len(long_df) == 2 * 50 * 20
+    # the same draws whatever the other scenarios of the ticker
+    base = simulate_sweep(
+        "BBB",
+        price_df["Adj Close"].to_numpy(),
+        trading_dates,
+        [{}],
+        num_of_simulation=50,
+        seed=1,
+    )
+    np.testing.assert_array_equal(sweep_results["BBB"]["base"].prices, base[0].prices)
@@ -0,0 +1,33 @@
+import os
+
+import pandas_market_calendars as mcal
+import pytest
+
+from stock_price_simulator import trading_calendar
+from stock_price_simulator.trading_calendar import get_trading_dates
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    trading_calendar.clear_cache()
+    yield
+    trading_calendar.clear_cache()
+
+
+def test_matches_market_calendar():
+    # the range crosses a precomputed window boundary
+    expected = (
+        mcal.get_calendar("NYSE").schedule("2019-06-03", "2021-01-29").index.to_list()
+    )
+
+    assert get_trading_dates("2019-06-03", "2021-01-29") == expected
+
+
+def test_persists_sessions(tmp_path, monkeypatch):
+    monkeypatch.setenv(trading_calendar.CACHE_DIR_ENV, str(tmp_path))
+    trading_dates = get_trading_dates("2021-12-31", "2022-12-31")
+    assert os.listdir(tmp_path) == ["NYSE-2020-10.npy"]
+
+    trading_calendar.clear_cache()
+    monkeypatch.setattr(trading_calendar, "_calendar", None)
+    assert get_trading_dates("2021-12-31", "2022-12-31") == trading_dates
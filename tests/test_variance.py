@@ -0,0 +1,190 @@
+import numpy as np
+import pytest
+
+from stock_price_simulator import models
+from stock_price_simulator.models import RETURN_MODELS, fit_model
+from stock_price_simulator.rng import antithetic_normals, uniforms
+from stock_price_simulator.simulate import simulate, simulate_chunks
+from stock_price_simulator.variance import control_variate_mean, simulate_adaptive
+
+pytest.importorskip("scipy")
+
+
+@pytest.mark.parametrize("shocks", ["antithetic", "sobol"])
+def test_chunks_match_whole_run(price_df, trading_dates, shocks):
+    result = simulate(
+        "AAA", price_df, trading_dates, 150, as_result=True, seed=1, shocks=shocks
+    )
+    chunks = simulate_chunks(
+        "AAA",
+        price_df,
+        trading_dates,
+        150,
+        chunk_size=40,
+        as_result=True,
+        seed=1,
+        shocks=shocks,
+    )
+
+    np.testing.assert_array_equal(
+        np.concatenate([chunk.prices for chunk in chunks]), result.prices
+    )
+
+
+def test_antithetic_uniforms_are_pairs():
+    u = uniforms(np.random.default_rng(0), "antithetic", 7, 3)
+
+    assert u.shape == (7, 3)
+    np.testing.assert_allclose(u[0:6:2] + u[1:6:2], 1)
+
+
+def test_antithetic_normals_are_pairs():
+    z = antithetic_normals(np.random.default_rng(0), 7, 3)
+
+    assert z.shape == (7, 3)
+    np.testing.assert_array_equal(z[0:6:2], -z[1:6:2])
+
+
+@pytest.mark.parametrize("model", list(RETURN_MODELS))
+def test_from_uniform_matches_sample(price_df, model):
+    fitted = fit_model(model, price_df["Adj Close"])
+    rng = np.random.default_rng(0)
+    sampled = fitted.sample(rng, (20000, 5))
+    inverted = fitted.from_uniform(rng.random((20000, 5)))
+
+    assert inverted.mean() == pytest.approx(sampled.mean(), abs=5e-4)
+    assert inverted.std() == pytest.approx(sampled.std(), rel=0.05)
+
+
+@pytest.mark.parametrize("shocks", ["antithetic", "sobol"])
+def test_shocks_reduce_variance_of_mean(price_df, trading_dates, shocks):
+    def block_means(shocks):
+        result = simulate(
+            "AAA",
+            price_df,
+            trading_dates,
+            64 * 50,
+            as_result=True,
+            seed=3,
+            shocks=shocks,
+        )
+        return result.terminal_prices.reshape(50, 64).mean(axis=1)
+
+    assert block_means(shocks).std() < block_means("pseudo").std() / 2
+
+
+def test_control_variate_mean():
+    rng = np.random.default_rng(0)
+    control = rng.normal(0, 1, 1000)
+    values = np.column_stack([2 * control + rng.normal(0, 0.1, 1000), control])
+
+    estimate, stderr = control_variate_mean(values, control, 0.0)
+
+    np.testing.assert_allclose(estimate, 0, atol=0.01)
+    assert stderr[0] < values[:, 0].std() / np.sqrt(1000) / 10
+    assert stderr[1] == pytest.approx(0, abs=1e-12)
+
+
+def test_adaptive_stops_at_tolerance(price_df, trading_dates):
+    adj_close = price_df["Adj Close"].to_numpy()
+    loose = simulate_adaptive("AAA", adj_close, trading_dates, tolerance=0.02, seed=4)
+    tight = simulate_adaptive("AAA", adj_close, trading_dates, tolerance=0.004, seed=4)
+
+    assert loose.converged and tight.converged
+    assert loose.num_of_simulation < tight.num_of_simulation
+    assert max(tight.half_widths.values()) <= 0.004
+    assert tight.summary().shape == (20, 6)
+    assert tight.mean[-1] == pytest.approx(adj_close[-1])
+
+
+def test_adaptive_gives_up_at_max_simulations(price_df, trading_dates):
+    result = simulate_adaptive(
+        "AAA",
+        price_df["Adj Close"].to_numpy(),
+        trading_dates,
+        tolerance=1e-6,
+        batch_size=128,
+        max_simulations=1000,
+        seed=5,
+    )
+
+    assert not result.converged
+    assert result.num_of_simulation == 960
+
+
+def test_adaptive_stops_below_the_first_batch(price_df, trading_dates):
+    result = simulate_adaptive(
+        "AAA",
+        price_df["Adj Close"].to_numpy(),
+        trading_dates,
+        tolerance=1e-9,
+        max_simulations=100,
+        seed=1,
+    )
+
+    assert not result.converged
+    assert result.num_of_simulation == 64
+    with pytest.raises(ValueError):
+        simulate_adaptive(
+            "AAA",
+            price_df["Adj Close"].to_numpy(),
+            trading_dates,
+            max_simulations=10,
+        )
+
+
+def test_adaptive_quantiles(price_df, trading_dates):
+    result = simulate_adaptive(
+        "AAA",
+        price_df["Adj Close"].to_numpy(),
+        trading_dates,
+        tolerance=0.02,
+        statistics=("quantiles",),
+        seed=2,
+    )
+
+    assert result.converged
+    assert result.half_widths["quantiles"] <= 0.02
+
+
+def test_antithetic_normal_models_need_no_scipy(price_df, trading_dates, monkeypatch):
+    def no_scipy():
+        raise ImportError("no scipy")
+
+    monkeypatch.setattr(models, "_import_scipy_special", no_scipy)
+
+    for model in ["normal", "gbm"]:
+        result = simulate_adaptive(
+            "AAA",
+            price_df["Adj Close"].to_numpy(),
+            trading_dates,
+            tolerance=0.02,
+            seed=7,
+            model=model,
+        )
+        assert result.converged
+
+
+def test_adaptive_matches_simulate(price_df, trading_dates):
+    result = simulate_adaptive(
+        "AAA",
+        price_df["Adj Close"].to_numpy(),
+        trading_dates,
+        tolerance=1.0,
+        batch_size=128,
+        seed=6,
+        model="gbm",
+    )
+    paths = simulate(
+        "AAA",
+        price_df,
+        trading_dates,
+        128,
+        as_result=True,
+        seed=6,
+        model="gbm",
+        shocks="antithetic",
+    )
+
+    assert result.num_of_simulation == 128
+    np.testing.assert_allclose(result.aggregate.mean, paths.prices.mean(axis=0))
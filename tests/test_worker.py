@@ -0,0 +1,149 @@
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from stock_price_simulator.simulate import simulate_prices
+from stock_price_simulator.worker import run_job, serve, serve_socket
+
+ADJ_CLOSE = [100.0, 101.0, 99.0, 102.0, 103.0, 101.0]
+TRADING_DATES = ["2022-01-03", "2022-01-04", "2022-01-05"]
+
+
+def _job(**kwargs):
+    return {
+        "id": 1,
+        "ticker": "AAA",
+        "adj_close": ADJ_CLOSE,
+        "trading_dates": TRADING_DATES,
+        "num_of_simulation": 50,
+        "seed": 3,
+        **kwargs,
+    }
+
+
+def test_paths_match_simulate():
+    response = run_job(_job(output="paths"))
+    expected = simulate_prices(
+        "AAA",
+        np.array(ADJ_CLOSE),
+        pd.DatetimeIndex(TRADING_DATES).to_list(),
+        50,
+        as_result=True,
+        seed=3,
+    )
+
+    assert response["ok"]
+    np.testing.assert_array_equal(response["result"]["prices"], expected.prices)
+
+
+def test_summary_and_errors():
+    summary = run_job(_job())["result"]
+
+    assert summary["num_of_simulation"] == 50
+    assert len(summary["summary"]["mean"]) == 3
+    assert not run_job(_job(output="plot"))["ok"]
+    assert "KeyError" in run_job({"id": 2})["error"]
+
+
+def test_file_output(tmp_path):
+    output_path = str(tmp_path / "out.csv")
+
+    result = run_job(_job(output="file", output_path=output_path))["result"]
+
+    assert result["rows"] == 150
+    assert len(pd.read_csv(output_path)) == 150
+
+
+def test_serve_answers_each_line():
+    lines = [
+        json.dumps({"op": "ping", "id": 0}),
+        "",
+        "not json",
+        json.dumps(_job(id=1)),
+        json.dumps({"op": "shutdown"}),
+        json.dumps(_job(id=2)),
+    ]
+    outfile = io.StringIO()
+
+    assert serve(io.StringIO("\n".join(lines) + "\n"), outfile)
+
+    responses = [json.loads(line) for line in outfile.getvalue().splitlines()]
+    assert [response["id"] for response in responses] == [0, None, 1]
+    assert [response["ok"] for response in responses] == [True, False, True]
+
+
+class DelayedPool:
+    """Runs each job in its own thread, recording how many ran at once."""
+
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def apply_async(self, func, args, callback, error_callback):
+        def run():
+            with self.lock:
+                self.running += 1
+                self.max_running = max(self.max_running, self.running)
+            time.sleep(0.01)
+            response = func(*args)
+            with self.lock:
+                self.running -= 1
+            callback(response)
+
+        threading.Thread(target=run).start()
+
+
+def test_serve_bounds_the_jobs_in_flight():
+    lines = [json.dumps(_job(id=job_id, num_of_simulation=5)) for job_id in range(20)]
+    pool = DelayedPool()
+    outfile = io.StringIO()
+
+    assert not serve(io.StringIO("\n".join(lines) + "\n"), outfile, pool, 3)
+
+    responses = [json.loads(line) for line in outfile.getvalue().splitlines()]
+    assert sorted(response["id"] for response in responses) == list(range(20))
+    assert pool.max_running <= 3
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs Unix sockets")
+def test_serve_socket(tmp_path):
+    path = str(tmp_path / "worker.sock")
+    server = threading.Thread(target=serve_socket, args=(path,))
+    server.start()
+    while not os.path.exists(path):
+        time.sleep(0.01)
+
+    with socket.socket(socket.AF_UNIX) as client:
+        client.connect(path)
+        rfile = client.makefile("r")
+        for job_id in (1, 2):
+            client.sendall((json.dumps(_job(id=job_id)) + "\n").encode())
+            assert json.loads(rfile.readline())["id"] == job_id
+        client.sendall(b'{"op": "shutdown"}\n')
+
+    server.join(timeout=10)
+    assert not server.is_alive()
+    assert not os.path.exists(path)
+
+
+def test_worker_does_not_import_optional_dependencies():
+    code = (
+        "import sys, stock_price_simulator.worker; "
+        "print([name for name in ('yfinance', 'azure', 'scipy') "
+        "if name in sys.modules])"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+
+    assert output.strip() == "[]"